@@ -11,6 +11,7 @@ chown -R www-data:www-data /logs
 BASE_DIR="/srv/www/stimmungskalender"
 V_ENV="${BASE_DIR}/.venv"
 PYTHON="${V_ENV}/bin/python"
+METRICS_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}"
 
 # Define help message
 show_help() {
@@ -20,6 +21,7 @@ Usage: docker run <imagename> COMMAND
 Commands
 
 sh          : Start /bin/sh
+asgi        : Run uvicorn (ASGI) server
 default_user: default_user
 dev         : Start a normal Django development server
 first_run   : Setup the initial database
@@ -40,6 +42,15 @@ translate() {
     cd ..
 }
 
+# The server workers write their Prometheus metrics to an empty directory,
+# files of a previous run would be added to the new ones (see web/metrics.py)
+clear_metrics() {
+    rm -rf "${METRICS_DIR}"
+    mkdir -p "${METRICS_DIR}"
+    chown www-data:www-data "${METRICS_DIR}"
+    export PROMETHEUS_MULTIPROC_DIR="${METRICS_DIR}"
+}
+
 
 # Run
 case "$1" in
@@ -68,8 +79,14 @@ case "$1" in
     translate)
         translate
         ;;
+    asgi)
+        echo "Running App (uvicorn)..."
+        clear_metrics
+        "${V_ENV}/bin/uvicorn" stimmungskalender.asgi:application --host 0.0.0.0 --port 8000 --workers "${WORKERS:-2}"
+        ;;
     uwsgi)
         echo "Running App (uWSGI)..."
+        clear_metrics
         uwsgi --ini /srv/www/stimmungskalender/docker/app/uwsgi.ini
         ;;
     *)
@@ -2,6 +2,7 @@
 import * as bootstrap from "bootstrap";
 
 import { SkCalendar } from "./sk.calendar";
+import { SkEvents } from "./sk.events";
 import { MoodForm } from "./sk.mood.form";
 import { Theme } from "./sk.theme";
 import { Graph } from "./sk.graph";
@@ -9,11 +10,9 @@ import * as SkUtil from "./sk.util";
 
 import "../scss/main.scss";
 
-const loadTranslation = (baseUrl) => {
-  const currentLanguage = JSON.parse(
-    document.getElementById("current_language").textContent
-  );
-  return fetch(`${baseUrl}jsoni18n/?lang=${currentLanguage}`)
+const loadTranslation = (catalogUrl) => {
+  // The URL changes with the translations, so the browser can cache it
+  return fetch(catalogUrl)
     .then((response) => response.json())
     .catch((err) => {
       console.error("Error", err);
@@ -39,14 +38,20 @@ ready(() => {
   SkUtil.enableDatePicker();
   new Theme();
 
-  loadTranslation(apiUrls["base-url"]).then((translation) => {
+  loadTranslation(apiUrls["json-catalog"]).then((translation) => {
+    const events = new SkEvents(apiUrls);
     switch (activeUrl) {
-      case "calendar":
-        new SkCalendar(apiUrls, translation["catalog"]);
+      case "calendar": {
+        const calendar = new SkCalendar(apiUrls, translation["catalog"]);
+        events.on("entry", (entry) => calendar.showEntry(entry));
         break;
-      case "index":
-        new MoodForm(apiUrls);
+      }
+      case "index": {
+        const moodForm = new MoodForm(apiUrls);
+        events.on("entry", (entry) => moodForm.showEntry(entry));
+        events.on("note", (week) => moodForm.showNote(week));
         break;
+      }
       case "graph":
         new Graph(apiUrls, translation["catalog"]);
         break;
@@ -13,11 +13,30 @@ export class SkCalendar {
       document.getElementById("mood_colors").textContent
     );
     this.loadEntries().then((response) => {
-      const calendarData = this.buildCalendarEntries(response);
-      this.buildCalendar(calendarData);
+      this.calendarData = this.buildCalendarEntries(response);
+      this.calendar = this.buildCalendar(this.calendarData);
     });
   }
 
+  /**
+   * Displays an entry that has been changed elsewhere.
+   */
+  showEntry(entry) {
+    if (!this.calendar) {
+      return;
+    }
+    const item = this.calendarData.entries.find((i) => i.day === entry.day);
+    if (item) {
+      item.mood_day = entry.mood_day;
+      item.mood_night = entry.mood_night;
+    } else {
+      this.calendarData.entries.push(
+        ...this.buildCalendarEntries({ entries: [entry] }).entries
+      );
+    }
+    this.calendar.setDataSource(this.calendarData.entries);
+  }
+
   buildCalendarEntries(calendarData) {
     calendarData.entries.map((item) => {
       const parts = item.day.split("-");
@@ -53,7 +72,7 @@ export class SkCalendar {
   }
 
   buildCalendar(calendarData) {
-    new Calendar("#calendar", {
+    return new Calendar("#calendar", {
       minDate: new Date(calendarData.first_day),
       maxDate: new Date(calendarData.last_day),
       style: "custom",
@@ -0,0 +1,21 @@
+/**
+ * Receives change events of the current user (Server-Sent Events).
+ * Only available if the server runs under ASGI (`api-events` is set).
+ */
+export class SkEvents {
+  constructor(apiUrls) {
+    this.source = null;
+    if (apiUrls["api-events"] && window.EventSource) {
+      this.source = new EventSource(apiUrls["api-events"]);
+    }
+  }
+
+  on(eventType, callback) {
+    if (!this.source) {
+      return;
+    }
+    this.source.addEventListener(eventType, (event) => {
+      callback(JSON.parse(event.data));
+    });
+  }
+}
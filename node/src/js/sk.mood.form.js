@@ -11,6 +11,13 @@ export class MoodForm {
   }
 
   loadEntries() {
+    // The index page embeds the mood table it was rendered with
+    const initial = document.getElementById("mood_table");
+    if (initial) {
+      this.showMoodTable(JSON.parse(initial.textContent));
+      return;
+    }
+
     let url = this.apiUrls["api-mood-table"];
     const startDt = this.getQueryVariable("start_dt");
     if (startDt) {
@@ -26,24 +33,61 @@ export class MoodForm {
     });
     fetch(request)
       .then((response) => response.json())
-      .then(function (response) {
-        response.days_of_week.forEach((entry) => {
-          for (let period of ["night", "day"]) {
-            const key = `mood_${period}`;
-            if (!entry[key]) {
-              return;
-            }
-            const checkbox = document.querySelector(
-              `[data-mood="${entry[key]}"][data-day="${entry.day}"][data-period="${period}"]`
-            );
-            checkbox.checked = true;
-            checkbox.setAttribute("data-active", checkbox.checked);
-            document.querySelector(
-              `#label-${period}-${entry[key]}-${entry.day}`
-            ).innerText = "X";
-          }
+      .then((response) => this.showMoodTable(response));
+  }
+
+  showMoodTable(moodTable) {
+    moodTable.days_of_week.forEach((entry) => {
+      for (let period of ["night", "day"]) {
+        const key = `mood_${period}`;
+        if (!entry[key]) {
+          continue;
+        }
+        const checkbox = document.querySelector(
+          `[data-mood="${entry[key]}"][data-day="${entry.day}"][data-period="${period}"]`
+        );
+        checkbox.checked = true;
+        checkbox.setAttribute("data-active", checkbox.checked);
+        document.querySelector(
+          `#label-${period}-${entry[key]}-${entry.day}`
+        ).innerText = "X";
+      }
+    });
+  }
+
+  /**
+   * Displays an entry that has been changed elsewhere.
+   */
+  showEntry(entry) {
+    for (let period of ["night", "day"]) {
+      document
+        .querySelectorAll(
+          `.btn-check[data-day="${entry.day}"][data-period="${period}"]`
+        )
+        .forEach((checkbox) => {
+          const active = checkbox.dataset.mood == entry[`mood_${period}`];
+          checkbox.checked = active;
+          checkbox.dataset.active = active;
+          document.querySelector(
+            `#label-${period}-${checkbox.dataset.mood}-${entry.day}`
+          ).innerHTML = active ? "X" : "&nbsp;";
         });
-      });
+    }
+  }
+
+  /**
+   * Displays a note that has been changed elsewhere.
+   */
+  showNote(week) {
+    const weekInput = document.querySelector("#edit-note [name=week]");
+    if (!weekInput || weekInput.value !== week.week_date) {
+      return;
+    }
+    document.querySelector("#note").value = week.note;
+    const readOnlyNote = document.querySelector("#read-only-note");
+    if (readOnlyNote) {
+      readOnlyNote.textContent = week.note;
+    }
   }
 
   addInputListener() {
@@ -10,11 +10,12 @@
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
-from datetime import timedelta
+from importlib.util import find_spec
 from pathlib import Path
 
 from decouple import Csv, config
 from dj_database_url import parse as db_url
+from django.core.exceptions import ImproperlyConfigured
 from django.utils.translation import gettext_lazy as _
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -95,6 +96,141 @@
     )
 }
 
+# Optional read-only replica, used for graphs, calendar, export and search
+DATABASE_REPLICA_URL = config("DATABASE_REPLICA_URL", default="")
+
+if DATABASE_REPLICA_URL:
+    DATABASES["replica"] = db_url(DATABASE_REPLICA_URL)
+    DATABASES["replica"]["TEST"] = {"MIRROR": "default"}
+
+# Optional per-user shards (see docs/database.md): comma-separated database
+# URLs. The moods, notes and settings of a user live on one of them, accounts
+# and sessions stay in the default database.
+DATABASE_SHARD_URLS = config("DATABASE_SHARD_URLS", default="", cast=Csv())
+DATABASE_SHARDS = []
+
+for i, url in enumerate(DATABASE_SHARD_URLS):
+    DATABASES[f"shard{i}"] = db_url(url)
+    DATABASE_SHARDS.append(f"shard{i}")
+
+if DATABASE_SHARDS:
+    if DATABASE_REPLICA_URL:
+        raise ImproperlyConfigured(
+            "DATABASE_SHARD_URLS can't be combined with DATABASE_REPLICA_URL."
+        )
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index("django.contrib.auth.middleware.AuthenticationMiddleware") + 1,
+        "web.sharding.shard_middleware",
+    )
+
+DATABASE_ROUTERS = ["web.sharding.ShardRouter", "web.db_router.ReplicaRouter"]
+
+# After a write, the reads of the user go to the primary for this long.
+# Requires a cache shared by all workers.
+DATABASE_REPLICA_PIN_SECONDS = config(
+    "DATABASE_REPLICA_PIN_SECONDS", default=10, cast=int
+)
+
+# Production profile for SQLite: write-ahead log, relaxed syncing and a busy
+# timeout, so concurrent workers don't fail with "database is locked".
+SQLITE_TUNING = config("SQLITE_TUNING", default=True, cast=bool)
+
+SQLITE_PRAGMAS = {
+    "journal_mode": config("SQLITE_JOURNAL_MODE", default="WAL"),
+    "synchronous": config("SQLITE_SYNCHRONOUS", default="NORMAL"),
+    "busy_timeout": config("SQLITE_BUSY_TIMEOUT", default=5000, cast=int),  # ms
+    "cache_size": config("SQLITE_CACHE_SIZE", default=-32000, cast=int),  # KiB
+    "mmap_size": config("SQLITE_MMAP_SIZE", default=128 * 1024 * 1024, cast=int),
+    "temp_store": config("SQLITE_TEMP_STORE", default="MEMORY"),
+}
+
+# Transactions take the write lock right away instead of upgrading a read
+# lock later, which can't wait for other writers and fails immediately.
+for database in DATABASES.values():
+    if SQLITE_TUNING and database["ENGINE"] == "django.db.backends.sqlite3":
+        database.setdefault("OPTIONS", {}).setdefault("transaction_mode", "IMMEDIATE")
+
+
+# Postgres connections. Without a pool, connections are kept open for
+# DATABASE_CONN_MAX_AGE seconds and reused by the following requests.
+DATABASE_CONN_MAX_AGE = config("DATABASE_CONN_MAX_AGE", default=60, cast=int)
+DATABASE_CONN_HEALTH_CHECKS = config(
+    "DATABASE_CONN_HEALTH_CHECKS", default=True, cast=bool
+)
+
+# Connection pool per worker process, requires psycopg 3 with the "pool" extra
+DATABASE_POOL = config("DATABASE_POOL", default=False, cast=bool)
+DATABASE_POOL_MIN_SIZE = config("DATABASE_POOL_MIN_SIZE", default=2, cast=int)
+DATABASE_POOL_MAX_SIZE = config("DATABASE_POOL_MAX_SIZE", default=4, cast=int)
+DATABASE_POOL_TIMEOUT = config("DATABASE_POOL_TIMEOUT", default=10, cast=float)
+DATABASE_POOL_MAX_IDLE = config("DATABASE_POOL_MAX_IDLE", default=600, cast=float)
+
+# Server-side parameter binding lets psycopg 3 prepare a query on the server
+# after it has run DATABASE_PREPARE_THRESHOLD times on the same connection.
+# Disable it behind PgBouncer in transaction mode.
+DATABASE_SERVER_SIDE_BINDING = config(
+    "DATABASE_SERVER_SIDE_BINDING", default=False, cast=bool
+)
+DATABASE_PREPARE_THRESHOLD = config("DATABASE_PREPARE_THRESHOLD", default=5, cast=int)
+
+for database in DATABASES.values():
+    if database["ENGINE"] != "django.db.backends.postgresql":
+        continue
+    if DATABASE_POOL or DATABASE_SERVER_SIDE_BINDING:
+        # psycopg2 would get options it doesn't know and fail to connect
+        if find_spec("psycopg") is None:
+            raise ImproperlyConfigured(
+                "DATABASE_POOL and DATABASE_SERVER_SIDE_BINDING require psycopg 3."
+            )
+        if DATABASE_POOL and find_spec("psycopg_pool") is None:
+            raise ImproperlyConfigured(
+                'DATABASE_POOL requires psycopg 3 with the "pool" extra.'
+            )
+    options = database.setdefault("OPTIONS", {})
+    database["CONN_HEALTH_CHECKS"] = DATABASE_CONN_HEALTH_CHECKS
+    if DATABASE_POOL:
+        # Connections are returned to the pool after each request instead
+        database["CONN_MAX_AGE"] = 0
+        options["pool"] = {
+            "min_size": DATABASE_POOL_MIN_SIZE,
+            "max_size": DATABASE_POOL_MAX_SIZE,
+            "timeout": DATABASE_POOL_TIMEOUT,
+            "max_idle": DATABASE_POOL_MAX_IDLE,
+        }
+    else:
+        database["CONN_MAX_AGE"] = DATABASE_CONN_MAX_AGE
+    if DATABASE_SERVER_SIDE_BINDING:
+        options["server_side_binding"] = True
+        options["prepare_threshold"] = DATABASE_PREPARE_THRESHOLD
+
+# Postgres only: partition the moods by year (see docs/database.md)
+SK_PARTITION_ENTRIES = config("SK_PARTITION_ENTRIES", default=False, cast=bool)
+SK_PARTITION_YEARS_AHEAD = config("SK_PARTITION_YEARS_AHEAD", default=1, cast=int)
+
+# Cache, shared by all workers if it is not the in-process default, e.g.
+# django.core.cache.backends.redis.RedisCache with redis://redis:6379
+# (see docs/cache.md)
+CACHES = {
+    "default": {
+        "BACKEND": config(
+            "CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": config("CACHE_LOCATION", default=""),
+    }
+}
+
+# Sessions
+# django.contrib.sessions.backends.db: one query per request
+# django.contrib.sessions.backends.cached_db: read from the cache
+# django.contrib.sessions.backends.signed_cookies: stored in the cookie
+SESSION_ENGINE = config("SESSION_ENGINE", default="django.contrib.sessions.backends.db")
+
+# The migration web.0036 moved the sessions of ModelBackend to it
+AUTHENTICATION_BACKENDS = ["web.auth.CachedModelBackend"]
+
+# Lifetime of cached users and tokens (seconds), 0 disables the cache.
+# Use a shared cache, so all workers see deactivated users and deleted tokens.
+AUTH_CACHE_TIMEOUT = config("AUTH_CACHE_TIMEOUT", default=0, cast=int)
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -156,6 +292,12 @@
 # Logging
 
 LOG_FILE_PATH = config("LOG_FILE_PATH", default=BASE_DIR / "stimmungskalender.log")
+LOG_LEVEL = config("LOG_LEVEL", default="INFO")
+# verbose: one line of text, json: one JSON object per record
+LOG_FORMAT = config("LOG_FORMAT", default="verbose")
+LOG_HANDLERS = config("LOG_HANDLERS", default="log_file,console", cast=Csv())
+# Write the logs from a background thread, see web/log.py
+LOG_QUEUE = config("LOG_QUEUE", default=True, cast=bool)
 
 LOGGING = {
     "version": 1,
@@ -165,26 +307,38 @@
             "format": "[{levelname} {asctime} {module} {funcName}] {message}",
             "style": "{",
         },
+        "json": {"()": "web.log.JsonFormatter"},
     },
     "handlers": {
         "console": {
             "level": "DEBUG",
             "class": "logging.StreamHandler",
-            "formatter": "verbose",
+            "formatter": LOG_FORMAT,
         },
         "log_file": {
             "level": "DEBUG",
             "class": "logging.FileHandler",
-            "formatter": "verbose",
+            "formatter": LOG_FORMAT,
             "filename": LOG_FILE_PATH,
         },
+        "queue": {
+            "()": "web.log.QueueHandler",
+            "handlers": LOG_HANDLERS,
+        },
         "mail_admins": {
             "level": "ERROR",
             "class": "django.utils.log.AdminEmailHandler",
         },
     },
     "loggers": {
-        "django": {"handlers": ["log_file", "console"], "level": "INFO"},
+        "django": {
+            "handlers": ["queue"] if LOG_QUEUE else LOG_HANDLERS,
+            "level": LOG_LEVEL,
+        },
+        "web": {
+            "handlers": ["queue"] if LOG_QUEUE else LOG_HANDLERS,
+            "level": LOG_LEVEL,
+        },
         "django.request": {
             "handlers": ["mail_admins"],
             "level": "ERROR",
@@ -204,25 +358,64 @@
     "PAGE_SIZE": 7,
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework.authentication.SessionAuthentication",
-        "rest_framework.authentication.TokenAuthentication",
+        "web.auth.CachedTokenAuthentication",
+        "web.auth.SignedTokenAuthentication",
     ),
 }
 
-# dj rest auth
+# Render the API responses with orjson (requires the orjson package)
+FAST_JSON = config("FAST_JSON", default=False, cast=bool)
+if FAST_JSON:
+    REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"] = (
+        "web.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    )
 
-REST_AUTH = {
-    "USE_JWT": True,
-    "JWT_AUTH_COOKIE": "sk-auth-cookie",
-    "JWT_AUTH_REFRESH_COOKIE": "sk-refresh-token",
-    "JWT_AUTH_HTTPONLY": False,
-}
+# Signed API tokens (seconds), see api/token/
+ACCESS_TOKEN_LIFETIME = config("ACCESS_TOKEN_LIFETIME", default=60 * 15, cast=int)
+REFRESH_TOKEN_LIFETIME = config(
+    "REFRESH_TOKEN_LIFETIME", default=60 * 60 * 24 * 30, cast=int
+)
+# Keep revoked tokens in the cache, use a shared cache so all workers see them
+TOKEN_REVOCATION = config("TOKEN_REVOCATION", default=False, cast=bool)
+
+# Request profiling (see web/profiling.py): a share of the requests, requests
+# with the X-Profile-Token header and the requests of some users
+PROFILE_SAMPLE_RATE = config("PROFILE_SAMPLE_RATE", default=0.0, cast=float)
+PROFILE_TOKEN = config("PROFILE_TOKEN", default="")
+PROFILE_USERS = config("PROFILE_USERS", default="", cast=Csv())
+PROFILE_DIR = config("PROFILE_DIR", default=BASE_DIR / "profiles")
+# Only the newest profiles are kept
+PROFILE_MAX_FILES = config("PROFILE_MAX_FILES", default=100, cast=int)
+
+if PROFILE_SAMPLE_RATE or PROFILE_TOKEN or PROFILE_USERS:
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index("django.contrib.auth.middleware.AuthenticationMiddleware") + 1,
+        "web.profiling.profile_middleware",
+    )
 
-# Simple JWT
+# Memory of the workers (see web/memory.py): share of the requests whose memory
+# is stored, frames per allocation if tracemalloc traces all the time (0: only
+# during the sampled requests), number of samples kept
+MEMORY_SAMPLE_RATE = config("MEMORY_SAMPLE_RATE", default=0.0, cast=float)
+MEMORY_TRACE_FRAMES = config("MEMORY_TRACE_FRAMES", default=0, cast=int)
+MEMORY_MAX_SAMPLES = config("MEMORY_MAX_SAMPLES", default=100000, cast=int)
+
+if MEMORY_SAMPLE_RATE:
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index("django.contrib.auth.middleware.AuthenticationMiddleware") + 1,
+        "web.memory.memory_middleware",
+    )
 
-SIMPLE_JWT = {
-    "ACCESS_TOKEN_LIFETIME": timedelta(days=7),
-    "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
-}
+# Prometheus metrics at metrics (see web/metrics.py, requires the
+# prometheus_client package), scraped with "Authorization: Bearer <token>" if
+# METRICS_TOKEN is set
+METRICS = config("METRICS", default=False, cast=bool)
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
+
+if METRICS:
+    # Outermost, the time includes all middleware
+    MIDDLEWARE.insert(0, "web.metrics.metrics_middleware")
 
 # Rosetta Settings
 
@@ -236,4 +429,28 @@
 
 SK_DATE_FORMAT = "%Y-%m-%d"  # To identify a week
 
+# Lifetime of rendered SVG images in the server-side cache (seconds)
+SK_SVG_CACHE_TIMEOUT = config("SK_SVG_CACHE_TIMEOUT", default=60 * 60 * 24, cast=int)
+
 IS_WSGI = config("IS_WSGI", default=True, cast=bool)
+
+# Storage of the moods
+# web.storage.RowMoodStore: one row per day
+# web.storage.PackedMoodStore: one row per week (see docs/database.md)
+SK_MOOD_STORAGE = config("SK_MOOD_STORAGE", default="web.storage.RowMoodStore")
+
+# Read sealed years from their archive (see docs/database.md)
+SK_ARCHIVE = config("SK_ARCHIVE", default=False, cast=bool)
+SK_ARCHIVE_CACHE_TIMEOUT = config(
+    "SK_ARCHIVE_CACHE_TIMEOUT", default=60 * 60 * 24, cast=int
+)
+
+# Live updates (Server-Sent Events, requires ASGI)
+# web.events.LocalEventBroker: in-process, for a single ASGI worker
+# web.events.DatabaseEventBroker: shared between all workers
+SK_EVENT_BROKER = config("SK_EVENT_BROKER", default="web.events.LocalEventBroker")
+SK_EVENTS_HEARTBEAT = config("SK_EVENTS_HEARTBEAT", default=15, cast=int)
+SK_EVENTS_POLL_INTERVAL = config("SK_EVENTS_POLL_INTERVAL", default=1.0, cast=float)
+
+# Serve the read-only api endpoints from async views (recommended under ASGI)
+ASYNC_API = config("ASYNC_API", default=False, cast=bool)
@@ -18,26 +18,44 @@
 from django.conf.urls import include
 from django.contrib import admin
 from django.urls import path, re_path
-from rest_framework.schemas import get_schema_view
+from rest_framework.schemas.openapi import SchemaGenerator
 
-from web import api, views
+from web import api, async_api, metrics, views
 
 handler400 = "web.views.custom_bad_request_view"
 handler403 = "web.views.custom_permission_denied_view"
 handler404 = "web.views.custom_page_not_found_view"
 handler500 = "web.views.custom_error_view"
 
+# Read-only endpoints, optionally served by their async implementations
+read_api = async_api if settings.ASYNC_API else api
+
 api_urlpatterns = [
     path("api/entry-day/", api.EntryDayView.as_view(), name="api-entry-day"),
-    path("api/mood-table/", api.MoodTableView.as_view(), name="api-mood-table"),
+    path("api/mood-table/", read_api.MoodTableView.as_view(), name="api-mood-table"),
     path("api/standout-data/", api.StandoutDataView.as_view()),
-    path("api/scatter-graph/", api.ScatterGraphView.as_view(), name="api-scatter-plot"),
-    path("api/pie-chart-graph/", api.PieChartGraphView.as_view(), name="api-pie-chart"),
-    path("api/bar-chart-graph/", api.BarChartGraphView.as_view(), name="api-bar-chart"),
+    path(
+        "api/scatter-graph/",
+        read_api.ScatterGraphView.as_view(),
+        name="api-scatter-plot",
+    ),
+    path(
+        "api/pie-chart-graph/",
+        read_api.PieChartGraphView.as_view(),
+        name="api-pie-chart",
+    ),
+    path(
+        "api/bar-chart-graph/",
+        read_api.BarChartGraphView.as_view(),
+        name="api-bar-chart",
+    ),
+    path("api/heatmap/", api.HeatmapView.as_view(), name="api-heatmap"),
     path("api/save-note/", api.SaveNoteView.as_view()),
-    path("api/search/", api.SearchView.as_view()),
-    path("api/graph/", api.GraphView.as_view()),
-    path("api/calendar/", api.CalendarView.as_view(), name="api-calendar"),
+    path("api/search/", read_api.SearchView.as_view()),
+    path("api/graph/", read_api.GraphView.as_view()),
+    path("api/graph-page/", async_api.GraphPageView.as_view(), name="api-graph-page"),
+    path("api/events/", async_api.EventStreamView.as_view(), name="api-events"),
+    path("api/calendar/", read_api.CalendarView.as_view(), name="api-calendar"),
     path("api/export/", api.ExportView.as_view(), name="export"),
     path("api/set-language/", api.SetLanguageView.as_view()),
     path("api/forms-displayed/", api.FormsDisplayedView.as_view()),
@@ -46,7 +64,22 @@
         api.UserMoodColorSettingsView.as_view(),
         name="api-mood-colors",
     ),
+    path("api/token/", api.SignedTokenView.as_view(), name="api-token"),
+    path(
+        "api/token/refresh/",
+        api.SignedTokenRefreshView.as_view(),
+        name="api-token-refresh",
+    ),
+    path("api/memory/", api.MemoryView.as_view(), name="api-memory"),
 ]
+if settings.TOKEN_REVOCATION:
+    api_urlpatterns.append(
+        path(
+            "api/token/revoke/",
+            api.SignedTokenRevokeView.as_view(),
+            name="api-token-revoke",
+        )
+    )
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -62,6 +95,16 @@
     path("settings/", views.SettingsView.as_view(), name="settings"),
     path("search/", views.SearchView.as_view(), name="search"),
     path("calendar/", views.CalendarView.as_view(), name="calendar"),
+    path(
+        "svg/heatmap/<int:year>/<int:version>.svg",
+        views.HeatmapSvgView.as_view(),
+        name="svg-heatmap",
+    ),
+    path(
+        "svg/sparkline/<str:week>/<int:version>.svg",
+        views.SparklineSvgView.as_view(),
+        name="svg-sparkline",
+    ),
     re_path(r"^rosetta/", include("rosetta.urls")),
     path("i18n/", include("django.conf.urls.i18n")),
     path(
@@ -69,18 +112,28 @@
         api.SkJSONCatalog.as_view(domain="django"),
         name="json-catalog",
     ),
+    path(
+        "jsoni18n/<str:language>/<str:digest>.json",
+        api.HashedJSONCatalog.as_view(),
+        name="json-catalog-hashed",
+    ),
     path(
         "openapi",
-        get_schema_view(
-            title="Stimmungskalender",
-            description="API for all things …",
-            patterns=api_urlpatterns,
+        api.CachedSchemaView.as_view(
+            schema_generator=SchemaGenerator(
+                title="Stimmungskalender",
+                description="API for all things …",
+                patterns=api_urlpatterns,
+            )
         ),
         name="openapi-schema",
     ),
 ]
 urlpatterns += api_urlpatterns
 
+if settings.METRICS:
+    urlpatterns.append(path("metrics", metrics.metrics_view, name="metrics"))
+
 # Host the static from uWSGI
 if settings.IS_WSGI:
     from django.contrib.staticfiles.urls import staticfiles_urlpatterns
@@ -1,8 +1,175 @@
+"""
+Admins that stay usable with millions of entries: no query per row, no full
+count of unfiltered changelists and no select of all users.
+"""
+
+from datetime import date, timedelta
+
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Min, QuerySet
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+
+from web.models import Entry, RequestProfile, UserMoodColorSettings, UserSettings, Week
+
+# Below this, the exact count is cheap enough
+ESTIMATE_MIN_ROWS = 100000
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Takes the row count of unfiltered querysets from the planner statistics
+    on Postgres.
+    """
+
+    @cached_property
+    def count(self) -> int:
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == "postgresql" and not queryset.query.where:
+            with connection.cursor() as cursor:
+                # The partitions of a partitioned table hold the statistics
+                cursor.execute(
+                    "SELECT SUM(GREATEST(reltuples, 0))::bigint FROM pg_class "
+                    "WHERE oid = %s::regclass "
+                    "OR oid IN (SELECT inhrelid FROM pg_inherits "
+                    "WHERE inhparent = %s::regclass)",
+                    [queryset.model._meta.db_table] * 2,
+                )
+                estimate = cursor.fetchone()[0] or 0
+            if estimate >= ESTIMATE_MIN_ROWS:
+                return estimate
+        return super().count
+
+
+class DateRangeQuerySet(QuerySet):
+    """
+    Lists the periods between the first and the last date for the date
+    hierarchy, instead of a DISTINCT over every row.
+    """
+
+    def dates(self, field_name: str, kind: str, order: str = "ASC") -> list:
+        bounds = self.aggregate(first=Min(field_name), last=Max(field_name))
+        first, last = bounds["first"], bounds["last"]
+        if first is None:
+            return []
+        if kind == "year":
+            ret = [date(year, 1, 1) for year in range(first.year, last.year + 1)]
+        elif kind == "month":
+            ret = [
+                date(month // 12, month % 12 + 1, 1)
+                for month in range(
+                    first.year * 12 + first.month - 1, last.year * 12 + last.month
+                )
+            ]
+        elif kind == "day":
+            ret = [first + timedelta(days=d) for d in range((last - first).days + 1)]
+        else:
+            return super().dates(field_name, kind, order)
+        return ret if order == "ASC" else ret[::-1]
+
+
+class UserDataAdmin(admin.ModelAdmin):
+    list_select_related = ["user"]
+    raw_id_fields = ["user"]
+    search_fields = ["=user__username"]
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    def get_queryset(self, request) -> QuerySet:
+        queryset = super().get_queryset(request)
+        if not self.date_hierarchy:
+            return queryset
+        return DateRangeQuerySet(
+            model=queryset.model,
+            query=queryset.query.chain(),
+            using=queryset._db,
+            hints=queryset._hints,
+        )
+
+
+@admin.register(Entry)
+class EntryAdmin(UserDataAdmin):
+    list_display = ["day", "user", "mood_day", "mood_night"]
+    list_filter = ["mood_day", "mood_night"]
+    date_hierarchy = "day"
+
+
+@admin.register(Week)
+class WeekAdmin(UserDataAdmin):
+    list_display = ["week_date", "user", "short_note"]
+    list_filter = [("note", admin.EmptyFieldListFilter)]
+    date_hierarchy = "week_date"
+
+    @admin.display(description="Note")
+    def short_note(self, obj: Week) -> str:
+        return obj.note[:50]
+
+
+@admin.register(UserSettings)
+class UserSettingsAdmin(UserDataAdmin):
+    list_display = ["user", "use_js_btn", "data_version"]
+    list_filter = ["use_js_btn", "view_is_markers", "streaks_valid"]
+
+
+@admin.register(UserMoodColorSettings)
+class UserMoodColorSettingsAdmin(UserDataAdmin):
+    list_display = ["user", "mood", "color"]
+    list_filter = ["mood"]
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    """
+    Lists the profiles of web.profiling, read-only, with their files for
+    download.
+    """
+
+    list_display = [
+        "created",
+        "method",
+        "path",
+        "user",
+        "status",
+        "duration_ms",
+        "trigger",
+        "download",
+    ]
+    list_filter = ["trigger", "method", "status"]
+    list_select_related = ["user"]
+    search_fields = ["path", "=user__username"]
+    date_hierarchy = "created"
+
+    def has_add_permission(self, request) -> bool:
+        return False
+
+    def has_change_permission(self, request, obj=None) -> bool:
+        return False
+
+    @admin.display(description="Profile")
+    def download(self, obj: RequestProfile) -> str:
+        url = reverse("admin:web_requestprofile_download", args=[obj.pk])
+        return format_html('<a href="{}">{}</a>', url, obj.file_name)
 
-from web.models import Entry, UserMoodColorSettings, UserSettings, Week
+    def get_urls(self) -> list:
+        return [
+            path(
+                "<int:pk>/download/",
+                self.admin_site.admin_view(self.download_view),
+                name="web_requestprofile_download",
+            ),
+            *super().get_urls(),
+        ]
 
-admin.site.register(Entry)
-admin.site.register(Week)
-admin.site.register(UserSettings)
-admin.site.register(UserMoodColorSettings)
+    def download_view(self, request, pk: int) -> FileResponse:
+        if not self.has_view_permission(request):
+            raise Http404()
+        obj = get_object_or_404(RequestProfile, pk=pk)
+        if not obj.file_path.exists():
+            raise Http404()
+        return FileResponse(obj.file_path.open("rb"), as_attachment=True)
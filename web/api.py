@@ -1,23 +1,42 @@
+import logging
+
 from django.conf import settings
 from django.core.exceptions import BadRequest
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse
+from django.shortcuts import redirect
 from django.utils import translation
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views import View
 from django.views.i18n import JSONCatalog
-from rest_framework import status, views
+from rest_framework import exceptions, status, views
+from rest_framework.authtoken.serializers import AuthTokenSerializer
 from rest_framework.generics import GenericAPIView
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
-
-from web import serializers
-from web.models import UserMoodColorSettings, UserSettings
-from web.query_params import QP_END_DT, QP_MOOD, QP_PERIOD, QP_SEARCH_TERM, QP_START_DT
+from rest_framework.schemas.views import SchemaView
+
+from web import auth, memory, serializers
+from web.catalog import get_catalog
+from web.models import UserMoodColorSettings
+from web.query_params import (
+    QP_END_DT,
+    QP_LIMIT,
+    QP_MOOD,
+    QP_PERIOD,
+    QP_SEARCH_TERM,
+    QP_START_DT,
+    QP_YEAR,
+)
 from web.service.bar_graph import BarGraphService
+from web.service.heatmap import HeatmapService
 from web.service.pie_graph import PieGraphService
 from web.service.scatter_graph import ScatterGraphService
-from web.service.settings import SettingsService
+from web.service.settings import settings_service
 from web.service.sk import SkService
 from web.views import DefaultDateHandler
 
+logger = logging.getLogger(__name__)
+
 
 class EntryDayView(GenericAPIView):
     """
@@ -101,6 +120,55 @@ def get(self, request):
         return Response(serializer.data)
 
 
+class SignedTokenView(GenericAPIView):
+    """
+    Get signed access and refresh tokens for a username and password.
+    """
+
+    authentication_classes = []
+    permission_classes = []
+    serializer_class = AuthTokenSerializer
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        tokens = auth.issue_tokens(serializer.validated_data["user"])
+        return Response(serializers.SignedTokensSerializer(tokens).data)
+
+
+class SignedTokenRefreshView(GenericAPIView):
+    """
+    Exchange a refresh token for new tokens.
+    """
+
+    authentication_classes = []
+    permission_classes = []
+    serializer_class = serializers.RefreshTokenSerializer
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        tokens = auth.refresh_tokens(serializer.validated_data["refresh"])
+        return Response(serializers.SignedTokensSerializer(tokens).data)
+
+
+class SignedTokenRevokeView(GenericAPIView):
+    """
+    Revoke an access or refresh token.
+    """
+
+    authentication_classes = []
+    permission_classes = []
+    serializer_class = serializers.RevokeTokenSerializer
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if not auth.revoke_token(serializer.validated_data["token"]):
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 class SkJSONCatalog(GenericAPIView, JSONCatalog):
     authentication_classes = []  # disables authentication
     permission_classes = []  # disables permission
@@ -126,6 +194,44 @@ def render_to_response(self, context, **response_kwargs):
         return response
 
 
+class HashedJSONCatalog(View):
+    """
+    The translation catalog of a language, cached forever by the clients.
+    """
+
+    def get(self, request, language, digest):
+        try:
+            catalog = get_catalog(language)
+        except LookupError:
+            raise Http404()
+        if digest != catalog.digest:
+            # A page rendered before the translations changed
+            return redirect(catalog.url)
+        response = get_conditional_response(request, etag=catalog.etag)
+        if response is None:
+            response = HttpResponse(catalog.body, content_type="application/json")
+        response["ETag"] = catalog.etag
+        patch_cache_control(response, public=True, max_age=31536000, immutable=True)
+        return response
+
+
+class CachedSchemaView(SchemaView):
+    """
+    Generates the OpenAPI schema once per process. The endpoints require no
+    permission, a login or staff (`api/memory/`), so there is one schema for
+    anonymous users, one for users and one for staff.
+    """
+
+    def get(self, request, *args, **kwargs):
+        schemas = self.schema_generator.__dict__.setdefault("sk_schemas", {})
+        key = (request.user.is_authenticated, request.user.is_staff)
+        if key not in schemas:
+            schemas[key] = self.schema_generator.get_schema(request, self.public)
+        if schemas[key] is None:
+            raise exceptions.PermissionDenied()
+        return Response(schemas[key])
+
+
 class SetLanguageView(views.APIView):
     """
     Set the language of a user.
@@ -217,7 +323,7 @@ def get(self, request):
         sk_service = SkService(request.user)
         start_dt = self.default_start_dt()
         end_dt = self.default_end_dt()
-        print(f"start_dt: {start_dt}")
+        logger.debug("Bar chart from %s to %s", start_dt, end_dt)
         bar_graph = BarGraphService(
             user=self.request.user,
             mood_mapping=sk_service.mood_mapping,
@@ -229,13 +335,33 @@ def get(self, request):
         return Response(serializer.data)
 
 
+class HeatmapView(GenericAPIView):
+    """
+    Average moods per weekday and month over the whole history and, if a
+    `year` is given, per ISO week and weekday of that year.
+    """
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = serializers.HeatmapResponseSerializer
+
+    def get(self, request):
+        year = request.GET.get(QP_YEAR, "")
+        try:
+            year = int(year) if year else None
+        except ValueError:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        heatmap = HeatmapService(user=request.user, year=year)
+        serializer = serializers.HeatmapResponseSerializer(heatmap.load_data())
+        return Response(serializer.data)
+
+
 class UserMoodColorSettingsView(GenericAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = serializers.UserMoodColorSettingsSerializer
     queryset = UserMoodColorSettings.objects.all()
 
     def get(self, request):
-        sk_service = SettingsService(request.user)
+        sk_service = settings_service(request)
         serializer = serializers.UserMoodColorSettingsSerializer(
             sk_service.user_colors_settings(), many=True
         )
@@ -251,14 +377,14 @@ class FormsDisplayedView(GenericAPIView):
     serializer_class = serializers.UserSettingsSerializer
 
     def get(self, request):
-        user_settings = UserSettings.objects.get(user=request.user)
+        user_settings = settings_service(request).user_settings()
         serializer = serializers.UserSettingsSerializer(user_settings)
         return Response(serializer.data)
 
     def post(self, request):
         night_form = request.data.get("night_form")
         day_form = request.data.get("day_form")
-        ss = SettingsService(request.user)
+        ss = settings_service(request)
         ss.set_forms_displayed(day=day_form, night=night_form)
         return Response(status=status.HTTP_200_OK)
 
@@ -301,3 +427,19 @@ def get(self, request):
         sk_service = SkService(request.user)
         serializer = serializers.ExportDataSerializer(sk_service.export())
         return Response(serializer.data)
+
+
+class MemoryView(views.APIView):
+    """
+    Staff only: the memory and the top allocation sites of the worker process
+    that serves the request, see web.memory.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        try:
+            limit = int(request.GET.get(QP_LIMIT, 20))
+        except ValueError:
+            raise exceptions.ParseError(f"{QP_LIMIT} must be a number")
+        return Response(memory.allocation_sites(limit))
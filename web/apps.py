@@ -4,3 +4,14 @@
 class WebConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "web"
+
+    def ready(self) -> None:
+        from web import (  # noqa: F401 (connects the signal receivers)
+            auth,
+            metrics,
+            sharding,
+            sqlite,
+        )
+        from web.memory import start_tracing
+
+        start_tracing()
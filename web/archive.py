@@ -0,0 +1,414 @@
+"""
+Archive of old, unchanging years, see `SK_ARCHIVE`.
+
+`seal_year` moves the moods of a year out of the mood store into an
+`ArchivedYear` row. `ArchiveMoodStore` wraps the configured store and merges
+the sealed years back in, so the services don't notice the difference. The
+decoded years are memoized in the cache. Saving a mood of a sealed year
+unseals it first.
+
+Notes stay in `Week`, where the search looks for them.
+"""
+
+import typing
+import zlib
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+
+from web import metrics
+from web.models import ArchivedYear
+from web.sharding import db_for_user
+from web.storage import PERIODS, DateRange, MoodStore
+from web.structs import WeekdayEntry
+
+
+def year_range(year: int) -> typing.Tuple[date, date]:
+    return date(year, 1, 1), date(year + 1, 1, 1)
+
+
+def seal_year(store: MoodStore, user: User, year: int) -> bool:
+    """
+    Archives the moods of a year. Returns False if there were none.
+    """
+    first_day, last_day = year_range(year)
+    with transaction.atomic(using=db_for_user(user)):
+        # Merges moods that were saved while the archive was disabled
+        unseal_year(store, user, year)
+        entries = store.entries(user, first_day, last_day)
+        if not entries:
+            return False
+        moods = bytearray((last_day - first_day).days * 2)
+        stats = {period: defaultdict(int) for period in PERIODS}
+        for entry in entries:
+            idx = (entry.day - first_day).days * 2
+            moods[idx] = entry.mood_day or 0
+            moods[idx + 1] = entry.mood_night or 0
+            for period in PERIODS:
+                if getattr(entry, period):
+                    stats[period][str(getattr(entry, period))] += 1
+        ArchivedYear.objects.create(
+            user=user, year=year, moods=zlib.compress(bytes(moods)), stats=stats
+        )
+        store.delete_range(user, first_day, last_day)
+    return True
+
+
+def unseal_year(store: MoodStore, user: User, year: int) -> None:
+    """
+    Moves the moods of a sealed year back into the mood store.
+    """
+    with transaction.atomic(using=db_for_user(user)):
+        archive = (
+            ArchivedYear.objects.select_for_update()
+            .filter(user=user, year=year)
+            .first()
+        )
+        if archive is None:
+            return
+        store.save_many(user, decode(archive))
+        archive.delete()
+
+
+def decode(archive: ArchivedYear) -> typing.List[WeekdayEntry]:
+    """
+    Returns the days of the archive with at least one mood.
+    """
+    first_day, last_day = year_range(archive.year)
+    moods = zlib.decompress(archive.moods)
+    ret = []
+    for d in range((last_day - first_day).days):
+        if moods[d * 2] or moods[d * 2 + 1]:
+            ret.append(
+                WeekdayEntry(
+                    day=first_day + timedelta(days=d),
+                    mood_day=moods[d * 2] or None,
+                    mood_night=moods[d * 2 + 1] or None,
+                )
+            )
+    return ret
+
+
+class ArchiveMoodStore(MoodStore):
+    """
+    Reads sealed years from their archive and everything else from the
+    wrapped store. Calls that don't touch a sealed year go straight to the
+    wrapped store, after one query for the sealed years of the user.
+    """
+
+    def __init__(self, store: MoodStore):
+        self.store = store
+
+    def get(self, user: User, day: date) -> WeekdayEntry:
+        archives = self._archives(user)
+        if day.year not in archives:
+            return self.store.get(user, day)
+        for entry in self._decoded(archives[day.year]):
+            if entry.day == day:
+                return entry
+        return WeekdayEntry(day=day, mood_day=None, mood_night=None)
+
+    def save(self, user: User, entry: WeekdayEntry) -> None:
+        if entry.day.year in self._archives(user):
+            unseal_year(self.store, user, entry.day.year)
+        self.store.save(user, entry)
+
+    def save_many(self, user: User, entries: typing.List[WeekdayEntry]) -> None:
+        for year in self._archives(user).keys() & {e.day.year for e in entries}:
+            unseal_year(self.store, user, year)
+        self.store.save_many(user, entries)
+
+    def delete_range(self, user: User, first_day: date, last_day: date) -> None:
+        for year in self._sealed_in_range(self._archives(user), first_day, last_day):
+            unseal_year(self.store, user, year)
+        self.store.delete_range(user, first_day, last_day)
+
+    def entries(
+        self,
+        user: User,
+        first_day: typing.Optional[date] = None,
+        last_day: typing.Optional[date] = None,
+    ) -> typing.List[WeekdayEntry]:
+        archives = self._archives(user)
+        live = self.store.entries(user, first_day, last_day)
+        sealed = self._sealed_in_range(archives, first_day, last_day)
+        if not sealed:
+            return live
+        archived = [
+            entry
+            for year in sealed
+            for entry in self._decoded(archives[year])
+            if self._in_range(entry.day, first_day, last_day)
+        ]
+        return sorted(archived + live, key=lambda entry: entry.day)
+
+    async def aentries(
+        self,
+        user: User,
+        first_day: typing.Optional[date] = None,
+        last_day: typing.Optional[date] = None,
+    ) -> typing.List[WeekdayEntry]:
+        archives = await self._aarchives(user)
+        live = await self.store.aentries(user, first_day, last_day)
+        sealed = self._sealed_in_range(archives, first_day, last_day)
+        if not sealed:
+            return live
+        archived = [
+            entry
+            for year in sealed
+            for entry in await self._adecoded(archives[year])
+            if self._in_range(entry.day, first_day, last_day)
+        ]
+        return sorted(archived + live, key=lambda entry: entry.day)
+
+    def bounds(self, user: User) -> DateRange:
+        archives = self._archives(user)
+        if not archives:
+            return self.store.bounds(user)
+        # Sealed years are never empty
+        return self._bounds(
+            self.store.bounds(user),
+            self._decoded(archives[min(archives)])[0].day,
+            self._decoded(archives[max(archives)])[-1].day,
+        )
+
+    async def abounds(self, user: User) -> DateRange:
+        archives = await self._aarchives(user)
+        if not archives:
+            return await self.store.abounds(user)
+        first = await self._adecoded(archives[min(archives)])
+        last = await self._adecoded(archives[max(archives)])
+        return self._bounds(await self.store.abounds(user), first[0].day, last[-1].day)
+
+    def weeks_with_moods(
+        self,
+        user: User,
+        first_day: typing.Optional[date] = None,
+        last_day: typing.Optional[date] = None,
+        mood: typing.Optional[int] = None,
+    ) -> typing.Set[date]:
+        archives = self._archives(user)
+        live = self.store.weeks_with_moods(user, first_day, last_day, mood)
+        archived = [
+            entry
+            for year in self._sealed_in_range(archives, first_day, last_day)
+            for entry in self._decoded(archives[year])
+            if self._in_range(entry.day, first_day, last_day)
+        ]
+        return live | self._weeks(archived, mood)
+
+    async def aweeks_with_moods(
+        self,
+        user: User,
+        first_day: typing.Optional[date] = None,
+        last_day: typing.Optional[date] = None,
+        mood: typing.Optional[int] = None,
+    ) -> typing.Set[date]:
+        archives = await self._aarchives(user)
+        live = await self.store.aweeks_with_moods(user, first_day, last_day, mood)
+        archived = [
+            entry
+            for year in self._sealed_in_range(archives, first_day, last_day)
+            for entry in await self._adecoded(archives[year])
+            if self._in_range(entry.day, first_day, last_day)
+        ]
+        return live | self._weeks(archived, mood)
+
+    def counts(
+        self,
+        user: User,
+        period: str,
+        first_day: typing.Optional[date] = None,
+        last_day: typing.Optional[date] = None,
+    ) -> typing.Dict[int, int]:
+        archives = self._archives(user)
+        live = self.store.counts(user, period, first_day, last_day)
+        sealed = self._sealed_in_range(archives, first_day, last_day)
+        if not sealed:
+            return live
+        ret = defaultdict(int, live)
+        for year in sealed:
+            for mood, count in self._year_counts(
+                archives[year], period, first_day, last_day
+            ).items():
+                ret[mood] += count
+        return dict(ret)
+
+    def averages(
+        self,
+        user: User,
+        first_day: typing.Optional[date] = None,
+        last_day: typing.Optional[date] = None,
+    ) -> typing.Dict[str, typing.Optional[float]]:
+        archives = self._archives(user)
+        sealed = self._sealed_in_range(archives, first_day, last_day)
+        if not sealed:
+            return self.store.averages(user, first_day, last_day)
+        ret = {}
+        for period in PERIODS:
+            counts = self.counts(user, period, first_day, last_day)
+            total = sum(counts.values())
+            ret[period] = (
+                sum(mood * count for mood, count in counts.items()) / total
+                if total
+                else None
+            )
+        return ret
+
+    async def acounts(
+        self,
+        user: User,
+        period: str,
+        first_day: typing.Optional[date] = None,
+        last_day: typing.Optional[date] = None,
+    ) -> typing.Dict[int, int]:
+        archives = await self._aarchives(user)
+        if not self._sealed_in_range(archives, first_day, last_day):
+            return await self.store.acounts(user, period, first_day, last_day)
+        return self._counts(await self.aentries(user, first_day, last_day), period)
+
+    async def aaverages(
+        self,
+        user: User,
+        first_day: typing.Optional[date] = None,
+        last_day: typing.Optional[date] = None,
+    ) -> typing.Dict[str, typing.Optional[float]]:
+        archives = await self._aarchives(user)
+        if not self._sealed_in_range(archives, first_day, last_day):
+            return await self.store.aaverages(user, first_day, last_day)
+        return self._averages(await self.aentries(user, first_day, last_day))
+
+    def latest(
+        self, user: User, period: str, mood: int
+    ) -> typing.Optional[WeekdayEntry]:
+        ret = self.store.latest(user, period, mood)
+        archives = self._archives(user)
+        for year in sorted(archives, reverse=True):
+            if ret and ret.day.year > year:
+                break
+            for entry in reversed(self._decoded(archives[year])):
+                if getattr(entry, period) == mood:
+                    if ret is None or entry.day > ret.day:
+                        ret = entry
+                    break
+        return ret
+
+    def grid(
+        self,
+        user: User,
+        row: str,
+        column: str,
+        iso_year: typing.Optional[int] = None,
+    ) -> typing.Dict[typing.Tuple[int, int], dict]:
+        archives = self._archives(user)
+        live = self.store.grid(user, row, column, iso_year)
+        sealed = [
+            year
+            for year in archives
+            if not iso_year or iso_year - 1 <= year <= iso_year + 1
+        ]
+        if not sealed:
+            return live
+        entries = [entry for year in sealed for entry in self._decoded(archives[year])]
+        ret = dict(live)
+        for key, item in self._grid(entries, row, column, iso_year).items():
+            if key not in ret:
+                ret[key] = item
+                continue
+            merged = {}
+            for name in ("day", "night"):
+                counts = (ret[key][f"count_{name}"], item[f"count_{name}"])
+                sums = sum(
+                    (avg or 0) * count
+                    for avg, count in zip(
+                        (ret[key][f"avg_{name}"], item[f"avg_{name}"]), counts
+                    )
+                )
+                merged[f"count_{name}"] = sum(counts)
+                merged[f"avg_{name}"] = sums / sum(counts) if sum(counts) else None
+            ret[key] = merged
+        return ret
+
+    def _archives(self, user: User) -> typing.Dict[int, ArchivedYear]:
+        # The blobs are only loaded if they are not cached
+        return {
+            archive.year: archive
+            for archive in ArchivedYear.objects.filter(user=user).defer("moods")
+        }
+
+    async def _aarchives(self, user: User) -> typing.Dict[int, ArchivedYear]:
+        return {
+            archive.year: archive
+            async for archive in ArchivedYear.objects.filter(user=user).defer("moods")
+        }
+
+    def _decoded(self, archive: ArchivedYear) -> typing.List[WeekdayEntry]:
+        # Archives never change, a new seal creates a new row
+        key = f"sk-archive-{archive.pk}"
+        ret = cache.get(key)
+        metrics.cache_lookup("archive", ret is not None)
+        if ret is None:
+            ret = decode(archive)
+            cache.set(key, ret, settings.SK_ARCHIVE_CACHE_TIMEOUT)
+        return ret
+
+    async def _adecoded(self, archive: ArchivedYear) -> typing.List[WeekdayEntry]:
+        key = f"sk-archive-{archive.pk}"
+        ret = await cache.aget(key)
+        metrics.cache_lookup("archive", ret is not None)
+        if ret is None:
+            await archive.arefresh_from_db(fields=["moods"])
+            ret = decode(archive)
+            await cache.aset(key, ret, settings.SK_ARCHIVE_CACHE_TIMEOUT)
+        return ret
+
+    def _year_counts(
+        self,
+        archive: ArchivedYear,
+        period: str,
+        first_day: typing.Optional[date],
+        last_day: typing.Optional[date],
+    ) -> typing.Dict[int, int]:
+        year_first, year_last = year_range(archive.year)
+        if (not first_day or first_day <= year_first) and (
+            not last_day or last_day >= year_last
+        ):
+            # The whole year is in the range: use the precomputed stats
+            return {int(mood): count for mood, count in archive.stats[period].items()}
+        entries = [
+            entry
+            for entry in self._decoded(archive)
+            if self._in_range(entry.day, first_day, last_day)
+        ]
+        return self._counts(entries, period)
+
+    @staticmethod
+    def _sealed_in_range(
+        archives: typing.Dict[int, ArchivedYear],
+        first_day: typing.Optional[date],
+        last_day: typing.Optional[date],
+    ) -> typing.List[int]:
+        return sorted(
+            year
+            for year in archives
+            if (not first_day or first_day.year <= year)
+            and (not last_day or last_day > date(year, 1, 1))
+        )
+
+    @staticmethod
+    def _in_range(
+        day: date, first_day: typing.Optional[date], last_day: typing.Optional[date]
+    ) -> bool:
+        return (not first_day or day >= first_day) and (not last_day or day < last_day)
+
+    @staticmethod
+    def _bounds(live: DateRange, first_sealed: date, last_sealed: date) -> DateRange:
+        first_day, last_day = live
+        return (
+            min(first_day, first_sealed) if first_day else first_sealed,
+            max(last_day, last_sealed) if last_day else last_sealed,
+        )
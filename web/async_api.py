@@ -0,0 +1,211 @@
+"""
+Async implementations of the read-only API endpoints.
+
+They are served instead of their counterparts in `web.api` if `ASYNC_API` is
+enabled, which only pays off when running under an ASGI server. The graph page
+data and the event stream only exist as async views.
+"""
+
+import asyncio
+import json
+import typing
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework import exceptions, status
+from rest_framework.settings import api_settings
+
+from web import events, serializers
+from web.auth import CachedTokenAuthentication, SignedTokenAuthentication
+from web.query_params import QP_END_DT, QP_MOOD, QP_PERIOD, QP_SEARCH_TERM, QP_START_DT
+from web.service.bar_graph import BarGraphService
+from web.service.base_graph import PERIOD_DAY, PERIOD_NIGHT
+from web.service.pie_graph import PieGraphService
+from web.service.scatter_graph import ScatterGraphService
+from web.service.sk import SkService
+from web.views import DefaultDateHandler
+
+
+class AsyncAPIView(View):
+    """
+    Async counterpart of `GenericAPIView` for authenticated GET endpoints.
+    Accepts the same session and token authentications and renders the same
+    JSON as the DRF views.
+    """
+
+    http_method_names = ["get", "head", "options"]
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            user = await self.authenticate(request)
+        except exceptions.AuthenticationFailed as e:
+            return self.render({"detail": e.detail}, status.HTTP_401_UNAUTHORIZED)
+        if user is None:
+            return self.render(
+                {"detail": exceptions.NotAuthenticated.default_detail},
+                status.HTTP_403_FORBIDDEN,
+            )
+        request.user = user
+        return await super().dispatch(request, *args, **kwargs)
+
+    async def authenticate(self, request) -> typing.Optional[User]:
+        user = await request.auser()
+        if user.is_authenticated:
+            return user
+        for authentication in (CachedTokenAuthentication, SignedTokenAuthentication):
+            ret = await sync_to_async(authentication().authenticate)(request)
+            if ret:
+                return ret[0]
+        return None
+
+    def render(self, data: typing.Any, status_code: int = status.HTTP_200_OK):
+        return HttpResponse(
+            api_settings.DEFAULT_RENDERER_CLASSES[0]().render(data),
+            content_type="application/json",
+            status=status_code,
+        )
+
+
+class MoodTableView(AsyncAPIView):
+    async def get(self, request):
+        sk_service = SkService(request.user)
+        mood_table = await sk_service.amood_table(request.GET.get(QP_START_DT, None))
+        return self.render(serializers.MoodTableSerializer(mood_table).data)
+
+
+class SearchView(AsyncAPIView):
+    async def get(self, request):
+        sk_service = SkService(request.user)
+        results = await sk_service.asearch(
+            mood=request.GET.get(QP_MOOD, ""),
+            search_term=request.GET.get(QP_SEARCH_TERM, ""),
+            start_dt=request.GET.get(QP_START_DT, ""),
+            end_dt=request.GET.get(QP_END_DT, ""),
+        )
+        return self.render(serializers.WeekSerializer(results, many=True).data)
+
+
+class CalendarView(AsyncAPIView):
+    async def get(self, request):
+        sk_service = SkService(request.user)
+        calendar = await sk_service.acalendar()
+        return self.render(serializers.CalendarSerializer(calendar).data)
+
+
+class GraphView(AsyncAPIView):
+    async def get(self, request):
+        sk_service = SkService(request.user)
+        time_ranges = await sk_service.agraph_time_ranges()
+        return self.render(serializers.GraphTimeRangesSerializer(time_ranges).data)
+
+
+class ScatterGraphView(DefaultDateHandler, AsyncAPIView):
+    async def get(self, request):
+        scatter_graph = ScatterGraphService(
+            is_markers=True,
+            mood_mapping=SkService(request.user).mood_mapping,
+            user=request.user,
+            start_dt=self.default_start_dt(),
+            end_dt=self.default_end_dt(),
+        )
+        data = await scatter_graph.aload_data()
+        return self.render(
+            serializers.ScatterGraphResponseSerializer(data, many=True).data
+        )
+
+
+class PieChartGraphView(DefaultDateHandler, AsyncAPIView):
+    async def get(self, request):
+        period = request.GET.get(QP_PERIOD, None)
+        if not period:
+            return self.render(None, status.HTTP_400_BAD_REQUEST)
+        pie_graph = PieGraphService(
+            user=request.user,
+            mood_mapping=SkService(request.user).mood_mapping,
+            start_dt=self.default_start_dt(),
+            end_dt=self.default_end_dt(),
+        )
+        data = await pie_graph.aload_data(period)
+        return self.render(serializers.PieChartResponseSerializer(data).data)
+
+
+class BarChartGraphView(DefaultDateHandler, AsyncAPIView):
+    async def get(self, request):
+        bar_graph = BarGraphService(
+            user=request.user,
+            mood_mapping=SkService(request.user).mood_mapping,
+            start_dt=self.default_start_dt(),
+            end_dt=self.default_end_dt(),
+        )
+        data = await bar_graph.aload_data()
+        return self.render(serializers.BarChartResponseSerializer(data).data)
+
+
+class GraphPageView(DefaultDateHandler, AsyncAPIView):
+    """
+    Everything the graph page needs in one response. The single computations
+    run concurrently.
+    """
+
+    async def get(self, request):
+        sk_service = SkService(request.user)
+        graph_kwargs = {
+            "user": request.user,
+            "mood_mapping": sk_service.mood_mapping,
+            "start_dt": self.default_start_dt(),
+            "end_dt": self.default_end_dt(),
+        }
+        pie_graph = PieGraphService(**graph_kwargs)
+        time_ranges, scatter, pie_day, pie_night, bar = await asyncio.gather(
+            sk_service.agraph_time_ranges(),
+            ScatterGraphService(is_markers=True, **graph_kwargs).aload_data(),
+            pie_graph.aload_data(PERIOD_DAY),
+            pie_graph.aload_data(PERIOD_NIGHT),
+            BarGraphService(**graph_kwargs).aload_data(),
+        )
+        return self.render(
+            {
+                "time_ranges": serializers.GraphTimeRangesSerializer(time_ranges).data,
+                "scatter": serializers.ScatterGraphResponseSerializer(
+                    scatter, many=True
+                ).data,
+                "pie_day": serializers.PieChartResponseSerializer(pie_day).data,
+                "pie_night": serializers.PieChartResponseSerializer(pie_night).data,
+                "bar": serializers.BarChartResponseSerializer(bar).data,
+            }
+        )
+
+
+class EventStreamView(AsyncAPIView):
+    """
+    Streams the change events of the user as Server-Sent Events.
+    """
+
+    async def get(self, request):
+        if not isinstance(request, ASGIRequest):
+            return self.render(
+                {"detail": "Event streams require an ASGI server."},
+                status.HTTP_501_NOT_IMPLEMENTED,
+            )
+        try:
+            last_event_id = int(request.headers.get("Last-Event-ID", ""))
+        except ValueError:
+            last_event_id = None
+        stream = self.stream(request.user.pk, last_event_id)
+        response = StreamingHttpResponse(stream, content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    async def stream(
+        self, user_id: int, last_event_id: typing.Optional[int]
+    ) -> typing.AsyncIterator[str]:
+        yield "retry: 5000\n\n"
+        async for event in events.get_broker().subscribe(user_id, last_event_id):
+            if event is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"id: {event.id}\nevent: {event.type}\ndata: {json.dumps(event.data)}\n\n"
@@ -0,0 +1,204 @@
+"""
+Authentication without database queries for warm requests.
+
+The session and token authentication look up the user on every request.
+`CachedModelBackend` and `CachedTokenAuthentication` keep the users and the
+token to user mapping in the cache for `AUTH_CACHE_TIMEOUT` seconds. Saving
+or deleting a user or token drops its entries, other workers see the change
+once the entries expire, unless the cache is shared.
+
+`SignedTokenAuthentication` accepts signed access tokens (`Bearer`), which
+are verified without a query. Access tokens are short-lived, the longer
+lived refresh tokens check the user in the database whenever they issue new
+tokens. With `TOKEN_REVOCATION`, revoked tokens are kept in the cache until
+they expire.
+"""
+
+import hashlib
+import typing
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Model
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from web import metrics
+
+
+def _user_key(user_id: typing.Any) -> str:
+    return f"sk-auth-user-{user_id}"
+
+
+def _token_key(key: str) -> str:
+    # Tokens are secrets, they don't go into cache keys as they are
+    return f"sk-auth-token-{hashlib.sha256(key.encode()).hexdigest()}"
+
+
+def _revoked_key(jti: str) -> str:
+    return f"sk-auth-revoked-{jti}"
+
+
+ACCESS = "access"
+REFRESH = "refresh"
+_SALTS = {ACCESS: "web.auth.access", REFRESH: "web.auth.refresh"}
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    `ModelBackend`, that caches the user of the session.
+    """
+
+    def get_user(self, user_id: typing.Any) -> typing.Optional[User]:
+        if not settings.AUTH_CACHE_TIMEOUT:
+            return super().get_user(user_id)
+        user = cache.get(_user_key(user_id))
+        metrics.cache_lookup("user", user is not None)
+        if user is None:
+            try:
+                user = User._default_manager.get(pk=user_id)
+            except User.DoesNotExist:
+                return None
+            cache.set(_user_key(user_id), user, settings.AUTH_CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    `TokenAuthentication`, that caches which user a token belongs to.
+    """
+
+    def authenticate_credentials(self, key: str) -> typing.Tuple[User, Token]:
+        if not settings.AUTH_CACHE_TIMEOUT:
+            return super().authenticate_credentials(key)
+        user_id = cache.get(_token_key(key))
+        metrics.cache_lookup("token", user_id is not None)
+        if user_id is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set(_token_key(key), user.pk, settings.AUTH_CACHE_TIMEOUT)
+            return user, token
+        user = CachedModelBackend().get_user(user_id)
+        if user is None:
+            raise exceptions.AuthenticationFailed(_("User inactive or deleted."))
+        return user, Token(key=key, user=user)
+
+
+def _lifetime(kind: str) -> int:
+    if kind == ACCESS:
+        return settings.ACCESS_TOKEN_LIFETIME
+    return settings.REFRESH_TOKEN_LIFETIME
+
+
+def _password_claim(user: User) -> str:
+    # Changing the password invalidates the refresh tokens
+    return user.get_session_auth_hash()[:16]
+
+
+def issue_tokens(user: User) -> dict:
+    """
+    Returns a new pair of access and refresh tokens for the user.
+    """
+    access = {"u": user.pk, "n": user.username, "j": uuid.uuid4().hex}
+    refresh = {"u": user.pk, "j": uuid.uuid4().hex, "p": _password_claim(user)}
+    return {
+        "access": signing.dumps(access, salt=_SALTS[ACCESS]),
+        "refresh": signing.dumps(refresh, salt=_SALTS[REFRESH]),
+        "expires_in": settings.ACCESS_TOKEN_LIFETIME,
+    }
+
+
+def verify_token(token: str, kind: str) -> dict:
+    """
+    Returns the claims of a valid token of this kind, only the revocation
+    list needs the cache.
+    """
+    try:
+        claims = signing.loads(token, salt=_SALTS[kind], max_age=_lifetime(kind))
+    except signing.SignatureExpired:
+        raise exceptions.AuthenticationFailed(_("Token expired."))
+    except signing.BadSignature:
+        raise exceptions.AuthenticationFailed(_("Invalid token."))
+    if settings.TOKEN_REVOCATION and cache.get(_revoked_key(claims["j"])):
+        raise exceptions.AuthenticationFailed(_("Token revoked."))
+    return claims
+
+
+def revoke_token(token: str) -> bool:
+    """
+    Puts an access or refresh token on the revocation list. Returns False
+    if the token isn't valid anyway.
+    """
+    for kind in (ACCESS, REFRESH):
+        try:
+            claims = verify_token(token, kind)
+        except exceptions.AuthenticationFailed:
+            continue
+        cache.set(_revoked_key(claims["j"]), True, _lifetime(kind))
+        return True
+    return False
+
+
+def refresh_tokens(token: str) -> dict:
+    """
+    Exchanges a refresh token for new tokens, the old one is revoked.
+    """
+    claims = verify_token(token, REFRESH)
+    user = User._default_manager.filter(pk=claims["u"], is_active=True).first()
+    if user is None or claims["p"] != _password_claim(user):
+        raise exceptions.AuthenticationFailed(_("Invalid token."))
+    if settings.TOKEN_REVOCATION:
+        cache.set(_revoked_key(claims["j"]), True, settings.REFRESH_TOKEN_LIFETIME)
+    return issue_tokens(user)
+
+
+def token_user(claims: dict) -> User:
+    """
+    Builds the user of an access token without a query. Only the id and
+    username are set, so the user can't be saved.
+    """
+    user = User(pk=claims["u"], username=claims["n"], is_active=True)
+    user._state.adding = False
+    user._state.db = DEFAULT_DB_ALIAS
+    user.from_signed_token = True
+    return user
+
+
+class SignedTokenAuthentication(TokenAuthentication):
+    """
+    Authentication with the signed access tokens of `issue_tokens`.
+    """
+
+    keyword = "Bearer"
+
+    def authenticate_credentials(self, key: str) -> typing.Tuple[User, dict]:
+        claims = verify_token(key, ACCESS)
+        return token_user(claims), claims
+
+
+@receiver(pre_save, sender=User)
+def refuse_token_user(
+    sender: typing.Type[Model], instance: User, **kwargs: dict
+) -> None:
+    if getattr(instance, "from_signed_token", False):
+        raise ValueError("The user of a signed token has to be loaded to be saved.")
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_user(sender: typing.Type[Model], instance: User, **kwargs: dict) -> None:
+    cache.delete(_user_key(instance.pk))
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def forget_token(sender: typing.Type[Model], instance: Token, **kwargs: dict) -> None:
+    cache.delete(_token_key(instance.key))
@@ -0,0 +1,212 @@
+"""
+Load for the server benchmarks (`benchmark_servers`, `benchmark_connections`).
+
+`serve()` starts the app under an HTTP server in a subprocess, `drive()` sends
+requests to it from concurrent client threads. The clients authenticate with
+the API token of a generated user (`seed_user()`), which has two years of
+moods and is deleted afterwards.
+"""
+
+import contextlib
+import http.client
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import threading
+import time
+import typing
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import CommandError
+from rest_framework.authtoken.models import Token
+
+from web.storage import get_store
+from web.structs import WeekdayEntry
+
+DAYS = 2 * 365
+# Seconds to wait for a server to accept connections
+STARTUP_TIMEOUT = 30
+
+
+@dataclass
+class Route:
+    path: str
+    method: str = "GET"
+    # Builds the JSON body of a request
+    body: typing.Optional[typing.Callable[[random.Random], dict]] = None
+
+
+@dataclass
+class Result:
+    latencies: typing.Dict[str, typing.List[float]] = field(
+        default_factory=lambda: defaultdict(list)
+    )
+    errors: int = 0
+    seconds: float = 0.0
+
+    @property
+    def requests(self) -> int:
+        return sum(len(values) for values in self.latencies.values())
+
+
+def percentile(values: typing.List[float], p: float) -> float:
+    if not values:
+        return math.nan
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def seed_user(username: str) -> typing.Tuple[User, str]:
+    """
+    Creates a user with a mood on every day of the last two years and returns
+    it with its API token.
+    """
+    User.objects.filter(username=username).delete()
+    user = User.objects.create_user(username=username)
+    today = date.today()
+    rng = random.Random(username)
+    get_store().save_many(
+        user,
+        [
+            WeekdayEntry(
+                day=today - timedelta(days=d),
+                mood_day=rng.randint(1, 5),
+                mood_night=rng.randint(1, 5),
+            )
+            for d in range(DAYS)
+        ],
+    )
+    return user, Token.objects.create(user=user).key
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def serve(command: typing.List[str], env: dict, port: int) -> typing.Iterator[None]:
+    """
+    Runs a server with the settings in `env` until the block is left.
+    """
+    process = subprocess.Popen(
+        command,
+        cwd=settings.BASE_DIR,
+        env={**os.environ, **env},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    try:
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while True:
+            if process.poll() is not None:
+                raise CommandError(
+                    f"{command[2]} exited: {process.stderr.read().decode()[-2000:]}"
+                )
+            with contextlib.suppress(OSError):
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            if time.monotonic() > deadline:
+                raise CommandError(
+                    f"{command[2]} didn't start within {STARTUP_TIMEOUT}s"
+                )
+            time.sleep(0.2)
+        yield
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        process.stderr.close()
+
+
+def _client(
+    port: int,
+    token: str,
+    routes: typing.List[Route],
+    seed: int,
+    start: threading.Barrier,
+    end: typing.List[float],
+    result: Result,
+    lock: threading.Lock,
+) -> None:
+    rng = random.Random(seed)
+    headers = {
+        "Authorization": f"Token {token}",
+        "Content-Type": "application/json",
+        "Host": "127.0.0.1",
+    }
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    latencies = defaultdict(list)
+    errors = 0
+    start.wait()
+    i = seed
+    while time.monotonic() < end[0]:
+        # Every client goes round the routes, starting at another one
+        route = routes[i % len(routes)]
+        i += 1
+        body = json.dumps(route.body(rng)) if route.body else None
+        began = time.perf_counter()
+        try:
+            connection.request(route.method, route.path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            continue
+        if response.status >= 300:
+            errors += 1
+            continue
+        latencies[route.path].append((time.perf_counter() - began) * 1000)
+    connection.close()
+    with lock:
+        for path, values in latencies.items():
+            result.latencies[path].extend(values)
+        result.errors += errors
+
+
+def drive(
+    port: int,
+    token: str,
+    routes: typing.List[Route],
+    clients: int,
+    seconds: float,
+    warmup: float = 1.0,
+) -> Result:
+    """
+    Sends requests from `clients` threads for `seconds`, after `warmup`
+    seconds whose requests are not counted.
+    """
+    if warmup:
+        drive(port, token, routes, clients, warmup, warmup=0)
+    result = Result(seconds=seconds)
+    lock = threading.Lock()
+    # The end is set once all threads are ready
+    end = [math.inf]
+    start = threading.Barrier(clients + 1)
+    threads = [
+        threading.Thread(
+            target=_client,
+            args=(port, token, routes, seed, start, end, result, lock),
+        )
+        for seed in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    end[0] = time.monotonic() + seconds
+    start.wait()
+    for thread in threads:
+        thread.join()
+    return result
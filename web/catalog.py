@@ -0,0 +1,60 @@
+"""
+JavaScript translation catalogs with content-hashed URLs.
+
+The catalog of a language is built once per process and served from
+`jsoni18n/<language>/<digest>.json`. The digest changes with the
+translations, so the responses can be cached by browsers and proxies
+forever.
+"""
+
+import hashlib
+import json
+import typing
+from dataclasses import dataclass
+from functools import lru_cache
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.urls import reverse
+from django.utils import translation
+from django.views.i18n import JSONCatalog
+
+
+@dataclass(frozen=True)
+class Catalog:
+    language: str
+    body: bytes
+    digest: str
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.digest}"'
+
+    @property
+    def url(self) -> str:
+        return reverse("json-catalog-hashed", args=[self.language, self.digest])
+
+
+class _CatalogBuilder(JSONCatalog):
+    domain = "django"
+
+    def render_to_response(self, context: dict, **response_kwargs) -> dict:
+        return context
+
+
+@lru_cache(maxsize=None)
+def _build(language: str) -> Catalog:
+    with translation.override(language):
+        context = _CatalogBuilder().get(None)
+    body = json.dumps(context, cls=DjangoJSONEncoder, sort_keys=True).encode()
+    return Catalog(language, body, hashlib.sha256(body).hexdigest()[:16])
+
+
+def get_catalog(language: typing.Optional[str] = None) -> Catalog:
+    """
+    Returns the catalog of a supported language, by default of the active
+    one. Raises `LookupError` for other languages.
+    """
+    language = translation.get_supported_language_variant(
+        language or translation.get_language()
+    )
+    return _build(language.lower())
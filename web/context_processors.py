@@ -1,10 +1,12 @@
+from django.conf import settings
 from django.core.handlers.wsgi import WSGIRequest
 from django.urls import resolve, reverse_lazy
 from django.utils.translation import get_language
 from django.utils.translation import gettext as _
 from django.utils.translation import to_locale
 
-from web.service.settings import SettingsService
+from web.catalog import get_catalog
+from web.service.settings import settings_service
 
 
 def lang(request: WSGIRequest) -> dict:
@@ -18,9 +20,7 @@ def lang(request: WSGIRequest) -> dict:
 def mood_colors(request: WSGIRequest) -> dict:
     ret = {}
     if request.user.is_authenticated:
-        ss = SettingsService(request.user)
-        for obj in ss.user_colors_settings():
-            ret[obj.mood] = obj.color
+        ret = settings_service(request).user_colors()
     return {"mood_colors": ret}
 
 
@@ -42,7 +42,7 @@ def api_urls(request: WSGIRequest) -> dict:
     :param request:
     :return:
     """
-    return {
+    urls = {
         "api_urls": {
             "base-url": reverse_lazy("index"),
             "api-entry-day": reverse_lazy("api-entry-day"),
@@ -52,8 +52,13 @@ def api_urls(request: WSGIRequest) -> dict:
             "api-pie-chart": reverse_lazy("api-pie-chart"),
             "api-mood-colors": reverse_lazy("api-mood-colors"),
             "api-bar-chart": reverse_lazy("api-bar-chart"),
+            "json-catalog": get_catalog().url,
         }
     }
+    # Live updates are only available under ASGI
+    if settings.ASYNC_API:
+        urls["api_urls"]["api-events"] = reverse_lazy("api-events")
+    return urls
 
 
 def active_url(request: WSGIRequest) -> dict:
@@ -0,0 +1,94 @@
+"""
+Routing of read-only queries to the replica database (`DATABASE_REPLICA_URL`).
+
+Service methods that only read are decorated with `replica_reads`. Their
+queries go to the replica, unless the user has written something within the
+last `DATABASE_REPLICA_PIN_SECONDS` seconds (read-your-writes).
+"""
+
+import contextvars
+import inspect
+import typing
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICA_DB = "replica"
+
+_use_replica = contextvars.ContextVar("sk_use_replica", default=False)
+
+
+def has_replica() -> bool:
+    return REPLICA_DB in settings.DATABASES
+
+
+def _pin_key(user: User) -> str:
+    return f"sk-replica-pin-{user.pk}"
+
+
+def pin_to_primary(user: User) -> None:
+    """
+    Makes the reads of a user use the primary database for a while, so they
+    see their own writes even if the replica lags behind.
+    """
+    if has_replica():
+        cache.set(_pin_key(user), True, settings.DATABASE_REPLICA_PIN_SECONDS)
+
+
+def replica_alias() -> typing.Optional[str]:
+    """
+    Returns the alias to bind lazy querysets to, which are evaluated after the
+    decorated method has returned.
+    """
+    return REPLICA_DB if _use_replica.get() else None
+
+
+def replica_reads(method: typing.Callable) -> typing.Callable:
+    """
+    Sends the reads of a service method to the replica. The service must
+    hold the user in `_user` or `user`.
+    """
+
+    def use_replica(service: typing.Any) -> bool:
+        user = getattr(service, "_user", None) or getattr(service, "user", None)
+        return has_replica() and not cache.get(_pin_key(user), False)
+
+    if inspect.iscoroutinefunction(method):
+
+        @wraps(method)
+        async def async_wrapper(self, *args, **kwargs):
+            token = _use_replica.set(use_replica(self))
+            try:
+                return await method(self, *args, **kwargs)
+            finally:
+                _use_replica.reset(token)
+
+        return async_wrapper
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        token = _use_replica.set(use_replica(self))
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            _use_replica.reset(token)
+
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints) -> typing.Optional[str]:
+        return replica_alias()
+
+    def db_for_write(self, model, **hints) -> typing.Optional[str]:
+        # Objects read from the replica must still be saved to the primary
+        return DEFAULT_DB_ALIAS if has_replica() else None
+
+    def allow_relation(self, obj1, obj2, **hints) -> typing.Optional[bool]:
+        databases = {DEFAULT_DB_ALIAS, REPLICA_DB}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
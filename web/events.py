@@ -0,0 +1,155 @@
+"""
+Small per-user change events ("entry changed", "note changed").
+
+The write paths publish events through the configured broker
+(`SK_EVENT_BROKER`), the `api/events/` endpoint streams them to the clients of
+the same user as Server-Sent Events.
+"""
+
+import asyncio
+import itertools
+import threading
+import typing
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+EVENT_ENTRY = "entry"
+EVENT_NOTE = "note"
+
+
+@dataclass
+class Event:
+    id: int
+    type: str
+    data: dict
+
+
+class EventBroker(ABC):
+    @abstractmethod
+    def publish(self, user_id: int, event_type: str, data: dict) -> None:
+        pass
+
+    @abstractmethod
+    def subscribe(
+        self, user_id: int, last_event_id: typing.Optional[int] = None
+    ) -> typing.AsyncIterator[typing.Optional[Event]]:
+        """
+        Yields the events of a user as they are published. Yields None if
+        nothing happened for `SK_EVENTS_HEARTBEAT` seconds.
+        """
+
+
+class LocalEventBroker(EventBroker):
+    """
+    Delivers events to the subscribers of the same process. Keeps the last
+    events of every user, so reconnecting clients can catch up.
+    """
+
+    def __init__(self, backlog: int = 50):
+        self._backlog = backlog
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._history: typing.Dict[int, deque] = {}
+        self._subscribers: typing.Dict[int, typing.Set[tuple]] = {}
+
+    def publish(self, user_id: int, event_type: str, data: dict) -> None:
+        with self._lock:
+            event = Event(id=next(self._ids), type=event_type, data=data)
+            history = self._history.setdefault(user_id, deque(maxlen=self._backlog))
+            history.append(event)
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    async def subscribe(
+        self, user_id: int, last_event_id: typing.Optional[int] = None
+    ) -> typing.AsyncIterator[typing.Optional[Event]]:
+        queue = asyncio.Queue()
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscriber)
+            missed = [
+                event
+                for event in self._history.get(user_id, ())
+                if last_event_id is not None and event.id > last_event_id
+            ]
+        try:
+            for event in missed:
+                yield event
+            while True:
+                try:
+                    yield await asyncio.wait_for(
+                        queue.get(), timeout=settings.SK_EVENTS_HEARTBEAT
+                    )
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            with self._lock:
+                self._subscribers[user_id].discard(subscriber)
+                if not self._subscribers[user_id]:
+                    del self._subscribers[user_id]
+
+
+class DatabaseEventBroker(EventBroker):
+    """
+    Stores events in the database, so they reach the subscribers of all
+    worker processes. Subscribers poll for new rows.
+    """
+
+    retention = timedelta(hours=1)
+
+    def publish(self, user_id: int, event_type: str, data: dict) -> None:
+        from web.models import SkEvent
+
+        SkEvent.objects.create(user_id=user_id, type=event_type, data=data)
+        SkEvent.objects.filter(created__lt=timezone.now() - self.retention).delete()
+
+    async def subscribe(
+        self, user_id: int, last_event_id: typing.Optional[int] = None
+    ) -> typing.AsyncIterator[typing.Optional[Event]]:
+        from web.models import SkEvent
+
+        qs = SkEvent.objects.filter(user_id=user_id).order_by("id")
+        if last_event_id is None:
+            latest = await qs.order_by("-id").afirst()
+            last_event_id = latest.id if latest else 0
+        idle = 0.0
+        while True:
+            found = False
+            async for row in qs.filter(id__gt=last_event_id):
+                found = True
+                last_event_id = row.id
+                yield Event(id=row.id, type=row.type, data=row.data)
+            if found:
+                idle = 0.0
+            elif idle >= settings.SK_EVENTS_HEARTBEAT:
+                idle = 0.0
+                yield None
+            await asyncio.sleep(settings.SK_EVENTS_POLL_INTERVAL)
+            idle += settings.SK_EVENTS_POLL_INTERVAL
+
+
+@lru_cache(maxsize=None)
+def get_broker() -> EventBroker:
+    return import_string(settings.SK_EVENT_BROKER)()
+
+
+def publish(user: User, event_type: str, data: dict) -> None:
+    """
+    Publishes an event once the current transaction has been committed.
+    """
+    from web.sharding import db_for_user
+
+    transaction.on_commit(
+        lambda: get_broker().publish(user.pk, event_type, data),
+        using=db_for_user(user),
+    )
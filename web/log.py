@@ -0,0 +1,96 @@
+"""
+Logging without blocking the request threads (`LOG_QUEUE`).
+
+`QueueHandler` puts the records into a queue, one listener thread per
+process writes them to the handlers named in its `handlers` option. The
+handlers are looked up on the first record, after `LOGGING` is configured.
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import typing
+from datetime import datetime, timezone
+
+# Attributes of every record, everything else was passed in `extra`
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as one JSON object per line.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "function": record.funcName,
+            "process": record.process,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key not in data:
+                data[key] = value
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            data["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(data, default=str)
+
+
+def _get_handler(name: str) -> logging.Handler:
+    # logging.getHandlerByName() only exists since Python 3.12
+    return logging._handlers[name]
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands the records over to a listener thread, which writes them to the
+    handlers with the names in `handlers`.
+    """
+
+    def __init__(self, handlers: typing.List[str]):
+        super().__init__(queue.SimpleQueue())
+        self.handler_names = handlers
+        self.listener = None
+        self.pid = None
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self.pid != os.getpid():
+            # First record, or a worker forked after the listener was started.
+            # Threads logging their first record at once start one listener.
+            with self.lock:
+                if self.pid != os.getpid():
+                    self._start()
+        super().emit(record)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The formatters of the target handlers format the record, they need
+        # the exception. Only the message is rendered here, the arguments
+        # may change after the call.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def _start(self) -> None:
+        self.queue = queue.SimpleQueue()
+        self.listener = logging.handlers.QueueListener(
+            self.queue,
+            *[_get_handler(name) for name in self.handler_names],
+            respect_handler_level=True,
+        )
+        self.listener.start()
+        self.pid = os.getpid()
+
+    def close(self) -> None:
+        # Called on exit by logging.shutdown(), writes the remaining records
+        if self.listener and self.pid == os.getpid():
+            self.listener.stop()
+        self.listener = None
+        self.pid = None
+        super().close()
@@ -0,0 +1,110 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, CommandError, CommandParser
+from django.db import connections, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from web import sharding
+
+URL_NAME = "api-mood-table"
+# Tables read by the authentication, everything else is app data
+AUTH_TABLES = ("django_session", "auth_user", "authtoken_token")
+
+VARIANTS = [
+    ("db session", "django.contrib.sessions.backends.db", 0, False),
+    ("cached_db session", "django.contrib.sessions.backends.cached_db", 0, False),
+    ("db session + user cache", "django.contrib.sessions.backends.db", 300, False),
+    (
+        "cached_db session + user cache",
+        "django.contrib.sessions.backends.cached_db",
+        300,
+        False,
+    ),
+    (
+        "signed_cookies session + user cache",
+        "django.contrib.sessions.backends.signed_cookies",
+        300,
+        False,
+    ),
+    ("token", settings.SESSION_ENGINE, 0, True),
+    ("token + cache", settings.SESSION_ENGINE, 300, True),
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+class QueryCounter:
+    def __init__(self):
+        self.queries = 0
+        self.auth_queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        if any(table in sql for table in AUTH_TABLES):
+            self.auth_queries += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        f"Measures the queries and time of authenticated {URL_NAME} requests with "
+        "the session and authentication settings. Works on a generated user "
+        "within a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--requests", type=int, default=500)
+
+    def handle(self, *args: tuple, **options: dict) -> None:
+        if sharding.is_enabled():
+            raise CommandError("Run the benchmark without DATABASE_SHARD_URLS.")
+        try:
+            with transaction.atomic():
+                self._run(options["requests"])
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def _run(self, requests: int) -> None:
+        user = User.objects.create_user(username="benchmark-auth")
+        token = Token.objects.create(user=user)
+        url = reverse(URL_NAME)
+        self.stdout.write(f"{requests} warm GET {url} requests per variant")
+        for label, engine, timeout, use_token in VARIANTS:
+            with override_settings(
+                SESSION_ENGINE=engine,
+                AUTH_CACHE_TIMEOUT=timeout,
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+            ):
+                # A new client loads the middleware with the settings above
+                client = Client()
+                headers = {}
+                if use_token:
+                    headers["Authorization"] = f"Token {token.key}"
+                else:
+                    client.force_login(user)
+                # Warm up the caches
+                client.get(url, headers=headers)
+
+                counter = QueryCounter()
+                with ExitStack() as stack:
+                    for connection in connections.all():
+                        stack.enter_context(connection.execute_wrapper(counter))
+                    start = time.perf_counter()
+                    for _ in range(requests):
+                        response = client.get(url, headers=headers)
+                        if response.status_code != 200:
+                            raise CommandError(f"{label}: HTTP {response.status_code}")
+                    ms = (time.perf_counter() - start) * 1000 / requests
+
+            self.stdout.write(
+                f"{label}: {counter.queries / requests:.1f} queries "
+                f"({counter.auth_queries / requests:.1f} auth), {ms:.2f} ms"
+            )
@@ -0,0 +1,97 @@
+import random
+import sys
+import uuid
+from datetime import date, timedelta
+from importlib.util import find_spec
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError, CommandParser
+from django.db import connection
+
+from web.benchmark import DAYS, Route, drive, free_port, percentile, seed_user, serve
+
+
+def _entry_day(rng: random.Random) -> dict:
+    day = date.today() - timedelta(days=rng.randrange(DAYS))
+    return {
+        "mood": rng.randint(1, 5),
+        "period": rng.choice(["day", "night"]),
+        "day": day.strftime(settings.SK_DATE_FORMAT),
+    }
+
+
+ROUTES = [
+    Route("/api/mood-table/"),
+    Route("/api/entry-day/", method="POST", body=_entry_day),
+]
+
+# (label, environment)
+VARIANTS = [
+    ("CONN_MAX_AGE=0", {"DATABASE_CONN_MAX_AGE": "0", "DATABASE_POOL": "False"}),
+    ("persistent", {"DATABASE_CONN_MAX_AGE": "60", "DATABASE_POOL": "False"}),
+    ("pool", {"DATABASE_POOL": "True"}),
+    (
+        "pool, server-side binding",
+        {"DATABASE_POOL": "True", "DATABASE_SERVER_SIDE_BINDING": "True"},
+    ),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Serves the app with gunicorn once per connection setting (closed after "
+        "each request, persistent, pooled, pooled with server-side binding) and "
+        "measures api/mood-table/ and api/entry-day/ for a user with two years "
+        "of moods. Requires Postgres."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--clients", type=int, default=4)
+        parser.add_argument("--seconds", type=float, default=10.0)
+
+    def handle(self, *args: tuple, **options: dict) -> None:
+        if connection.vendor != "postgresql":
+            raise CommandError("The connection settings only apply to Postgres.")
+        if settings.DATABASE_SHARD_URLS:
+            raise CommandError("Run the benchmark without DATABASE_SHARD_URLS.")
+        for module in ("gunicorn", "psycopg_pool"):
+            if not find_spec(module):
+                raise CommandError(f"The benchmark needs {module} to be installed.")
+        clients = options["clients"]
+        user, token = seed_user(f"benchmark-{uuid.uuid4().hex[:8]}")
+        try:
+            for label, env in VARIANTS:
+                port = free_port()
+                command = [
+                    sys.executable,
+                    "-m",
+                    "gunicorn",
+                    "stimmungskalender.wsgi:application",
+                    "--workers",
+                    "1",
+                    "--threads",
+                    str(clients),
+                    "--bind",
+                    f"127.0.0.1:{port}",
+                ]
+                env = {
+                    **env,
+                    "ALLOWED_HOSTS": "127.0.0.1",
+                    # One connection per thread
+                    "DATABASE_POOL_MIN_SIZE": str(clients),
+                    "DATABASE_POOL_MAX_SIZE": str(clients),
+                }
+                with serve(command, env, port):
+                    result = drive(port, token, ROUTES, clients, options["seconds"])
+                latencies = ", ".join(
+                    f"{route.method} {route.path} "
+                    f"p50 {percentile(result.latencies[route.path], 50):.1f} ms "
+                    f"p95 {percentile(result.latencies[route.path], 95):.1f} ms"
+                    for route in ROUTES
+                )
+                self.stdout.write(
+                    f"{label}: {result.requests / result.seconds:.0f} req/s, "
+                    f"{latencies}, {result.errors} errors"
+                )
+        finally:
+            user.delete()
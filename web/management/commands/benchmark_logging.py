@@ -0,0 +1,123 @@
+import logging
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, CommandError, CommandParser
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from web import sharding
+from web.log import JsonFormatter, QueueHandler
+
+URL_NAME = "api-bar-chart"
+LOGGERS = ["django", "web"]
+
+
+class Rollback(Exception):
+    pass
+
+
+class SlowStream:
+    def __init__(self, stream, delay: float):
+        self.stream = stream
+        self.delay = delay
+
+    def write(self, data: str) -> int:
+        time.sleep(self.delay)
+        return self.stream.write(data)
+
+    def __getattr__(self, name: str):
+        return getattr(self.stream, name)
+
+
+class Command(BaseCommand):
+    help = (
+        f"Measures {URL_NAME} requests with DEBUG logging (including the SQL "
+        "queries) to a JSON log file, written directly and through the queue. "
+        "Works on a generated user within a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--records", type=int, default=20000)
+        parser.add_argument(
+            "--write-delay",
+            type=float,
+            default=0,
+            help="Milliseconds every write to the log file takes, e.g. to emulate "
+            "a log pipe that is full.",
+        )
+
+    def handle(self, *args: tuple, **options: dict) -> None:
+        if sharding.is_enabled():
+            raise CommandError("Run the benchmark without DATABASE_SHARD_URLS.")
+        with tempfile.TemporaryDirectory() as directory:
+            file_handler = logging.FileHandler(Path(directory) / "benchmark.log")
+            if options["write_delay"]:
+                file_handler.stream = SlowStream(
+                    file_handler.stream, options["write_delay"] / 1000
+                )
+            file_handler.setFormatter(JsonFormatter())
+            file_handler.name = "sk-benchmark-file"
+            variants = [
+                ("no logging", None),
+                ("file", file_handler),
+                ("queue + file", QueueHandler(handlers=[file_handler.name])),
+            ]
+            try:
+                with transaction.atomic():
+                    self._run(variants, options["requests"], options["records"])
+                    raise Rollback()
+            except Rollback:
+                pass
+            finally:
+                file_handler.close()
+
+    def _run(self, variants: list, requests: int, records: int) -> None:
+        user = User.objects.create_user(username="benchmark-logging")
+        url = reverse(URL_NAME)
+        client = Client()
+        client.force_login(user)
+        self.stdout.write(f"{requests} GET {url} requests, {records} log records")
+        for label, handler in variants:
+            saved = {}
+            for name in LOGGERS:
+                logger = logging.getLogger(name)
+                saved[name] = (logger.handlers, logger.level)
+                logger.handlers = [handler] if handler else []
+                logger.setLevel(logging.DEBUG if handler else logging.CRITICAL)
+            connection.force_debug_cursor = True
+            try:
+                with override_settings(
+                    ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]
+                ):
+                    client.get(url)
+                    start = time.perf_counter()
+                    for _ in range(requests):
+                        response = client.get(url)
+                        if response.status_code != 200:
+                            raise CommandError(f"{label}: HTTP {response.status_code}")
+                    request_ms = (time.perf_counter() - start) * 1000 / requests
+
+                logger = logging.getLogger("web.benchmark")
+                start = time.perf_counter()
+                for i in range(records):
+                    logger.info("Record %s", i, extra={"user_id": user.pk})
+                record_us = (time.perf_counter() - start) * 1000 * 1000 / records
+            finally:
+                connection.force_debug_cursor = False
+                for name, (handlers, level) in saved.items():
+                    logging.getLogger(name).handlers = handlers
+                    logging.getLogger(name).setLevel(level)
+                if isinstance(handler, QueueHandler):
+                    # Waits until everything is written
+                    handler.close()
+
+            self.stdout.write(
+                f"{label}: {request_ms:.2f} ms per request "
+                f"({1000 / request_ms:.0f} req/s), {record_us:.1f} µs per record"
+            )
@@ -0,0 +1,128 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, CommandError, CommandParser
+from django.db import DatabaseError, connection, transaction
+
+from web import sharding
+from web.models import Entry, Week
+from web.storage import PackedMoodStore, RowMoodStore
+
+FIRST_DAY = date(2020, 1, 6)  # A Monday
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares table size and range-scan time of both mood storage layouts. "
+        "Works on generated users within a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--days", type=int, default=3 * 365)
+        parser.add_argument("--scans", type=int, default=1000)
+
+    def handle(self, *args: tuple, **options: dict) -> None:
+        if sharding.is_enabled():
+            raise CommandError("Run the benchmark without DATABASE_SHARD_URLS.")
+        try:
+            with transaction.atomic():
+                self._run(options["users"], options["days"], options["scans"])
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def _run(self, user_count: int, days: int, scans: int) -> None:
+        sizes_before = {table: self._size(table) for table in ("web_entry", "web_week")}
+        users = [
+            User.objects.create(username=f"benchmark-mood-storage-{i}")
+            for i in range(user_count)
+        ]
+        for user in users:
+            moods = [
+                (
+                    FIRST_DAY + timedelta(days=d),
+                    random.randint(1, 5),
+                    random.randint(1, 5),
+                )
+                for d in range(days)
+            ]
+            Entry.objects.bulk_create(
+                [
+                    Entry(user=user, day=day, mood_day=mood_day, mood_night=mood_night)
+                    for day, mood_day, mood_night in moods
+                ],
+                batch_size=500,
+            )
+            weeks = {}
+            for day, mood_day, mood_night in moods:
+                packed = weeks.setdefault(
+                    day - timedelta(days=day.weekday()), bytearray(14)
+                )
+                packed[day.weekday() * 2] = mood_day
+                packed[day.weekday() * 2 + 1] = mood_night
+            Week.objects.bulk_create(
+                [
+                    Week(user=user, week_date=week_date, moods=bytes(packed))
+                    for week_date, packed in weeks.items()
+                ],
+                batch_size=500,
+            )
+
+        self.stdout.write(f"{user_count} users with {days} days each")
+        for label, table, store in (
+            ("rows", "web_entry", RowMoodStore()),
+            ("packed", "web_week", PackedMoodStore()),
+        ):
+            size = self._size(table)
+            if size is not None and sizes_before[table] is not None:
+                size_info = f"{(size - sizes_before[table]) / 1024:.0f} KiB"
+            else:
+                size_info = f"size not available on {connection.vendor}"
+
+            rng = random.Random(0)
+            start = time.perf_counter()
+            for _ in range(scans):
+                first_day = FIRST_DAY + timedelta(days=rng.randrange(days - 28))
+                store.entries(
+                    rng.choice(users), first_day, first_day + timedelta(days=28)
+                )
+            month_ms = (time.perf_counter() - start) * 1000 / scans
+
+            start = time.perf_counter()
+            for user in users:
+                store.entries(user)
+            history_ms = (time.perf_counter() - start) * 1000 / user_count
+
+            self.stdout.write(
+                f"{label}: {size_info}, 4-week scan {month_ms:.2f} ms, "
+                f"full history {history_ms:.2f} ms"
+            )
+
+    @staticmethod
+    def _size(table: str):
+        """
+        Size of the table and its indexes in bytes.
+        """
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute("SELECT pg_total_relation_size(%s)", [table])
+                return cursor.fetchone()[0]
+            if connection.vendor == "sqlite":
+                try:
+                    cursor.execute(
+                        "SELECT SUM(pgsize) FROM dbstat WHERE name IN "
+                        "(SELECT name FROM sqlite_master WHERE tbl_name = %s)",
+                        [table],
+                    )
+                except DatabaseError:
+                    # SQLite was built without the dbstat table
+                    return None
+                return cursor.fetchone()[0] or 0
+        return None
@@ -0,0 +1,104 @@
+import importlib.util
+import json
+import random
+import time
+from datetime import date, timedelta
+
+from django.core.management import BaseCommand, CommandParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework_dataclasses.serializers import DataclassSerializer
+
+from web import serializers
+from web.structs import (
+    ScatterGraphDataPointY,
+    ScatterGraphResponse,
+    SkCalendar,
+    WeekdayEntry,
+)
+
+FIRST_DAY = date(2020, 1, 6)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the CPU time of the generic dataclass serializers with the "
+        "hand-written ones of the calendar and scatter graph, and of both JSON "
+        "renderers, on generated data."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--rows", type=int, default=3 * 365)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args: tuple, **options: dict) -> None:
+        rows, repeat = options["rows"], options["repeat"]
+        moods = [None, 1, 2, 3, 4, 5]
+        days = [FIRST_DAY + timedelta(days=d) for d in range(rows)]
+        entries = [
+            WeekdayEntry(day, random.choice(moods), random.choice(moods))
+            for day in days
+        ]
+        calendar = SkCalendar(days[0], days[-1], entries)
+        points = [
+            ScatterGraphResponse(
+                x=e.day, y=ScatterGraphDataPointY(e.mood_day, e.mood_night)
+            )
+            for e in entries
+        ]
+
+        renderers = [("json", JSONRenderer())]
+        if importlib.util.find_spec("orjson"):
+            from web.renderers import FastJSONRenderer
+
+            renderers.append(("orjson", FastJSONRenderer()))
+        else:
+            self.stdout.write("orjson is not installed, skipping FastJSONRenderer")
+
+        # Like ListSerializer, one child serializer for all points
+        point_serializer = serializers.ScatterGraphResponseSerializer()
+
+        self.stdout.write(f"CPU time per 1000 rows ({rows} rows, best of {repeat})")
+        cases = [
+            (
+                "calendar",
+                lambda: DataclassSerializer.to_representation(
+                    serializers.CalendarSerializer(), calendar
+                ),
+                lambda: serializers.CalendarSerializer(calendar).data,
+            ),
+            (
+                "scatter-graph",
+                lambda: [
+                    DataclassSerializer.to_representation(point_serializer, point)
+                    for point in points
+                ],
+                lambda: serializers.ScatterGraphResponseSerializer(
+                    points, many=True
+                ).data,
+            ),
+        ]
+        for name, generic, lean in cases:
+            generic_data, lean_data = generic(), lean()
+            for label, renderer in renderers:
+                if json.loads(renderer.render(generic_data)) != json.loads(
+                    renderer.render(lean_data)
+                ):
+                    self.stderr.write(f"{name}: the outputs differ ({label})")
+            self._report(name, "generic serializer", generic, rows, repeat)
+            self._report(name, "lean serializer", lean, rows, repeat)
+            for label, renderer in renderers:
+                self._report(
+                    name,
+                    f"{label} render",
+                    lambda: renderer.render(lean_data),
+                    rows,
+                    repeat,
+                )
+
+    def _report(self, name: str, label: str, fn, rows: int, repeat: int) -> None:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.process_time()
+            fn()
+            best = min(best, time.process_time() - start)
+        self.stdout.write(f"{name}, {label}: {best * 1000 * 1000 / rows:.2f} ms")
@@ -0,0 +1,85 @@
+import sys
+import uuid
+from importlib.util import find_spec
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError, CommandParser
+
+from web.benchmark import Route, drive, free_port, seed_user, serve
+
+ROUTES = [
+    Route("/api/mood-table/"),
+    Route("/api/graph/"),
+    Route("/api/bar-chart-graph/"),
+    Route("/api/search/?mood=1"),
+]
+
+# (label, server module, arguments, environment)
+SERVERS = [
+    (
+        "gunicorn, WSGI, 1 worker, 8 threads",
+        "gunicorn",
+        ["stimmungskalender.wsgi:application", "--workers", "1", "--threads", "8"],
+        {},
+    ),
+    (
+        "uvicorn, ASGI, 1 worker, ASYNC_API=True",
+        "uvicorn",
+        ["stimmungskalender.asgi:application", "--workers", "1"],
+        {"ASYNC_API": "True"},
+    ),
+    (
+        "uvicorn, ASGI, 1 worker, ASYNC_API=False",
+        "uvicorn",
+        ["stimmungskalender.asgi:application", "--workers", "1"],
+        {"ASYNC_API": "False"},
+    ),
+]
+
+
+def _bind(module: str, port: int) -> list:
+    if module == "gunicorn":
+        return ["--bind", f"127.0.0.1:{port}"]
+    return ["--host", "127.0.0.1", "--port", str(port)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Serves the app with gunicorn (WSGI) and uvicorn (ASGI, with and without "
+        "ASYNC_API) and sends API requests from concurrent clients for a user "
+        "with two years of moods."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--clients", type=int, nargs="+", default=[1, 8, 32], metavar="N"
+        )
+        parser.add_argument("--seconds", type=float, default=8.0)
+
+    def handle(self, *args: tuple, **options: dict) -> None:
+        if settings.DATABASE_SHARD_URLS:
+            raise CommandError("Run the benchmark without DATABASE_SHARD_URLS.")
+        for _, module, *_ in SERVERS:
+            if not find_spec(module):
+                raise CommandError(f"The benchmark needs {module} to be installed.")
+        user, token = seed_user(f"benchmark-{uuid.uuid4().hex[:8]}")
+        try:
+            for label, module, arguments, env in SERVERS:
+                port = free_port()
+                command = [
+                    sys.executable,
+                    "-m",
+                    module,
+                    *arguments,
+                    *_bind(module, port),
+                ]
+                with serve(command, {**env, "ALLOWED_HOSTS": "127.0.0.1"}, port):
+                    for clients in options["clients"]:
+                        result = drive(port, token, ROUTES, clients, options["seconds"])
+                        self.stdout.write(
+                            f"{label}, {clients} clients: "
+                            f"{result.requests / result.seconds:.0f} req/s, "
+                            f"{result.errors} errors"
+                        )
+        finally:
+            user.delete()
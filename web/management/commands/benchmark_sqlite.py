@@ -0,0 +1,115 @@
+import multiprocessing
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandParser
+
+from web.sqlite import apply_pragmas
+
+USERS = 20
+DAYS = 365
+FIRST_DAY = date(2024, 1, 1)
+
+# (label, pragmas, statement opening a write transaction)
+PROFILES = [
+    ("stock", {"journal_mode": "DELETE"}, "BEGIN"),
+    ("tuned", None, "BEGIN IMMEDIATE"),
+]
+
+
+def _seed(path: Path) -> None:
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE entry (id INTEGER PRIMARY KEY, user_id INTEGER, day TEXT,"
+        " mood_day INTEGER, mood_night INTEGER, UNIQUE (user_id, day))"
+    )
+    db.executemany(
+        "INSERT INTO entry (user_id, day, mood_day, mood_night) VALUES (?, ?, ?, ?)",
+        (
+            (user, (FIRST_DAY + timedelta(days=d)).isoformat(), 3, 3)
+            for user in range(USERS)
+            for d in range(DAYS)
+        ),
+    )
+    db.commit()
+    db.close()
+
+
+def _worker(path: str, pragmas: dict, begin: str, seconds: float, write_ratio: float):
+    """
+    Mixes week reads with writes shaped like `SkService.save_entry`: read the
+    current entry, then update it within the same transaction.
+    """
+    db = sqlite3.connect(path, isolation_level=None)
+    apply_pragmas(db, pragmas)
+    reads = writes = locked = 0
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        user = random.randrange(USERS)
+        day = FIRST_DAY + timedelta(days=random.randrange(DAYS - 7))
+        try:
+            if random.random() < write_ratio:
+                db.execute(begin)
+                row = db.execute(
+                    "SELECT mood_day FROM entry WHERE user_id = ? AND day = ?",
+                    (user, day.isoformat()),
+                ).fetchone()
+                db.execute(
+                    "UPDATE entry SET mood_day = ? WHERE user_id = ? AND day = ?",
+                    (None if row[0] else random.randint(1, 5), user, day.isoformat()),
+                )
+                db.execute("COMMIT")
+                writes += 1
+            else:
+                db.execute(
+                    "SELECT * FROM entry WHERE user_id = ? AND day BETWEEN ? AND ?",
+                    (user, day.isoformat(), (day + timedelta(days=6)).isoformat()),
+                ).fetchall()
+                reads += 1
+        except sqlite3.OperationalError:
+            locked += 1
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+    db.close()
+    return reads, writes, locked
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs concurrent reading and writing processes against a scratch SQLite "
+        "database, once with the SQLite defaults and once with SQLITE_PRAGMAS."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--processes", type=int, default=4)
+        parser.add_argument("--seconds", type=float, default=5.0)
+        parser.add_argument("--write-ratio", type=float, default=0.2)
+
+    def handle(self, *args: tuple, **options: dict) -> None:
+        processes = options["processes"]
+        seconds = options["seconds"]
+        for label, pragmas, begin in PROFILES:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = Path(tmp) / "benchmark.sqlite3"
+                _seed(path)
+                jobs = [
+                    (
+                        str(path),
+                        pragmas or settings.SQLITE_PRAGMAS,
+                        begin,
+                        seconds,
+                        options["write_ratio"],
+                    )
+                ] * processes
+                with multiprocessing.Pool(processes) as pool:
+                    results = pool.starmap(_worker, jobs)
+            reads, writes, locked = (sum(col) for col in zip(*results))
+            self.stdout.write(
+                f"{label}: {reads / seconds:.0f} reads/s, "
+                f"{writes / seconds:.0f} writes/s, {locked} failed with 'database is locked'"
+            )
@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError, CommandParser
+from django.db import connection, transaction
+from django.utils import timezone
+
+from web import partitioning
+
+ACTION_LIST = "list"
+ACTION_CREATE = "create"
+ACTION_ENABLE = "enable"
+ACTION_DISABLE = "disable"
+ACTION_VACUUM = "vacuum"
+ACTION_DETACH = "detach"
+
+
+class Command(BaseCommand):
+    help = (
+        "Manages the yearly partitions of the mood entries on Postgres. "
+        "'create' adds the partitions up to SK_PARTITION_YEARS_AHEAD years ahead "
+        "and should run regularly, e.g. once a month."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "action",
+            choices=[
+                ACTION_LIST,
+                ACTION_CREATE,
+                ACTION_ENABLE,
+                ACTION_DISABLE,
+                ACTION_VACUUM,
+                ACTION_DETACH,
+            ],
+        )
+        parser.add_argument(
+            "year", type=int, nargs="?", help="Year for 'vacuum' and 'detach'."
+        )
+
+    def handle(self, *args: tuple, **options: dict) -> None:
+        if not partitioning.is_supported(connection):
+            raise CommandError("Partitioning requires Postgres.")
+        action = options["action"]
+        if action == ACTION_ENABLE:
+            if partitioning.is_partitioned(connection):
+                raise CommandError("The entries are already partitioned.")
+            with transaction.atomic():
+                partitioning.partition_table(connection)
+            self.stdout.write("Partitioned the entries by year.")
+            return
+        if not partitioning.is_partitioned(connection):
+            raise CommandError(
+                "The entries are not partitioned, see SK_PARTITION_ENTRIES."
+            )
+
+        if action == ACTION_LIST:
+            for partition in partitioning.partitions(connection):
+                self.stdout.write(
+                    f"{partition.name}: ~{partition.rows} rows, "
+                    f"{partition.size / 1024:.0f} KiB"
+                )
+        elif action == ACTION_CREATE:
+            this_year = timezone.now().year
+            for year in range(
+                this_year, this_year + settings.SK_PARTITION_YEARS_AHEAD + 1
+            ):
+                with transaction.atomic():
+                    if partitioning.create_partition(connection, year):
+                        self.stdout.write(
+                            f"Created {partitioning.partition_name(year)}"
+                        )
+        elif action == ACTION_DISABLE:
+            with transaction.atomic():
+                partitioning.unpartition_table(connection)
+            self.stdout.write("Merged the partitions into a single table.")
+        else:
+            year = options["year"]
+            if not year:
+                raise CommandError(f"'{action}' requires a year.")
+            if action == ACTION_VACUUM:
+                partitioning.vacuum_partition(connection, year)
+                self.stdout.write(f"Vacuumed {partitioning.partition_name(year)}")
+            else:
+                with transaction.atomic():
+                    partitioning.detach_partition(connection, year)
+                self.stdout.write(
+                    f"Detached {partitioning.partition_name(year)}. Its entries are "
+                    f"no longer visible in the app, dump and drop the table to archive it."
+                )
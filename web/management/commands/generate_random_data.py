@@ -6,8 +6,9 @@
 from django.utils import timezone
 from django_registration.forms import User
 
-from web.models import PERIODS, Moods, Week
+from web.models import PERIODS, Entry, Moods, Week
 from web.service.sk import SkService
+from web.sharding import use_shard
 
 
 class Command(BaseCommand):
@@ -18,16 +19,18 @@ def add_arguments(self, parser: CommandParser) -> None:
     def handle(self, *args: tuple, **options: dict) -> None:
         user = User.objects.get(username=options.get("username"))
         days = options.get("days", 30)
-        Week.objects.filter(user=user).delete()
-        sk_service = SkService(user)
-        days = [(timezone.now() - timedelta(days=d)).date() for d in range(days)]
-        mood_list = list(Moods)
+        with use_shard(user):
+            Entry.objects.filter(user=user).delete()
+            Week.objects.filter(user=user).delete()
+            sk_service = SkService(user)
+            days = [(timezone.now() - timedelta(days=d)).date() for d in range(days)]
+            mood_list = list(Moods)
 
-        for period in PERIODS:
-            for day in days:
-                mood = random.choice(mood_list)
-                sk_service.save_entry(
-                    period,
-                    mood,
-                    day.strftime(settings.SK_DATE_FORMAT),
-                )
+            for period in PERIODS:
+                for day in days:
+                    mood = random.choice(mood_list)
+                    sk_service.save_entry(
+                        period,
+                        mood,
+                        day.strftime(settings.SK_DATE_FORMAT),
+                    )
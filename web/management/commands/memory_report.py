@@ -0,0 +1,116 @@
+from datetime import timedelta
+
+from django.core.management import BaseCommand, CommandError, CommandParser
+from django.db.models import Avg, Count, F, Max, Min, Sum
+from django.utils import timezone
+
+from web.models import MemorySample
+
+
+def _mib(value) -> str:
+    return "-" if value is None else f"{value / 1024 / 1024:.2f}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Sums up the memory of the sampled requests (MEMORY_SAMPLE_RATE) by "
+        "route and by worker process: the growth of the resident memory (RSS) "
+        "and the peak of the memory allocated by Python, in MiB."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--hours", type=float, default=0, help="Only the last hours."
+        )
+        parser.add_argument("--limit", type=int, default=20)
+
+    def handle(self, *args: tuple, **options: dict) -> None:
+        samples = MemorySample.objects.all()
+        if options["hours"]:
+            samples = samples.filter(
+                created__gte=timezone.now() - timedelta(hours=options["hours"])
+            )
+        if not samples.exists():
+            raise CommandError("No memory samples, set MEMORY_SAMPLE_RATE.")
+
+        # Routes whose requests grew the processes the most first
+        routes = (
+            samples.order_by()
+            .values("route")
+            .annotate(
+                samples=Count("pk"),
+                rss_growth=Sum("rss_delta"),
+                rss_delta_max=Max("rss_delta"),
+                peak_avg=Avg("peak_alloc"),
+                peak_max=Max("peak_alloc"),
+            )
+            .order_by(F("rss_growth").desc(nulls_last=True), "-peak_max")
+        )
+        self._table(
+            [
+                "route",
+                "samples",
+                "RSS growth",
+                "max RSS growth",
+                "avg peak",
+                "max peak",
+            ],
+            [
+                [
+                    row["route"] or "/",
+                    str(row["samples"]),
+                    _mib(row["rss_growth"]),
+                    _mib(row["rss_delta_max"]),
+                    _mib(row["peak_avg"]),
+                    _mib(row["peak_max"]),
+                ]
+                for row in routes[: options["limit"]]
+            ],
+        )
+
+        # Processes that were sampled last first
+        self.stdout.write("")
+        processes = (
+            samples.order_by()
+            .values("pid")
+            .annotate(
+                samples=Count("pk"),
+                first=Min("created"),
+                last=Max("created"),
+            )
+            .order_by("-last")
+        )
+        rows = []
+        for row in processes[: options["limit"]]:
+            process_samples = samples.filter(pid=row["pid"]).order_by("created")
+            first_rss = process_samples.values_list("rss", flat=True).first()
+            last_rss = process_samples.values_list("rss", flat=True).last()
+            growth = None
+            if first_rss is not None and last_rss is not None:
+                growth = last_rss - first_rss
+            rows.append(
+                [
+                    str(row["pid"]),
+                    str(row["samples"]),
+                    f"{row['first']:%Y-%m-%d %H:%M}",
+                    f"{row['last']:%Y-%m-%d %H:%M}",
+                    _mib(first_rss),
+                    _mib(last_rss),
+                    _mib(growth),
+                ]
+            )
+        self._table(
+            ["pid", "samples", "first", "last", "first RSS", "last RSS", "growth"],
+            rows,
+        )
+
+    def _table(self, header: list, rows: list) -> None:
+        table = [header, *rows]
+        widths = [max(len(row[i]) for row in table) for i in range(len(header))]
+        for row in table:
+            self.stdout.write(
+                "  ".join(
+                    cell.ljust(width) if i == 0 else cell.rjust(width)
+                    for i, (cell, width) in enumerate(zip(row, widths))
+                )
+            )
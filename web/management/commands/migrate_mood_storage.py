@@ -0,0 +1,99 @@
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, CommandParser
+from django.db import transaction
+from django.db.models import Q
+
+from web import sharding
+from web.models import Entry, Week
+from web.sharding import use_shard
+from web.storage import PackedMoodStore, week_start
+
+TO_PACKED = "packed"
+TO_ROWS = "rows"
+
+
+class Command(BaseCommand):
+    help = (
+        "Copies the moods of all users into the other storage layout. Stop the "
+        "app while it runs, then switch SK_MOOD_STORAGE."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("target", choices=[TO_PACKED, TO_ROWS])
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--delete-source",
+            action="store_true",
+            help="Removes the moods from the old layout after copying them.",
+        )
+
+    def handle(self, *args: tuple, **options: dict) -> None:
+        if options["target"] == TO_PACKED:
+            users = Entry.objects.values_list("user_id", flat=True)
+            migrate = self._to_packed
+        else:
+            users = Week.objects.filter(moods__isnull=False).values_list(
+                "user_id", flat=True
+            )
+            migrate = self._to_rows
+        total = 0
+        for alias in sharding.locations():
+            user_ids = users.using(alias).distinct().order_by("user_id")
+            for user in User.objects.filter(pk__in=list(user_ids)).order_by("pk"):
+                # One transaction per user keeps the locks short
+                with use_shard(user), transaction.atomic(using=alias):
+                    total += migrate(
+                        user.pk, options["batch_size"], options["delete_source"]
+                    )
+        self.stdout.write(f"Migrated {total} days to {options['target']}.")
+
+    def _to_packed(self, user_id: int, batch_size: int, delete_source: bool) -> int:
+        weeks = {}
+        qs = (
+            Entry.objects.filter(user_id=user_id)
+            .filter(Q(mood_day__isnull=False) | Q(mood_night__isnull=False))
+            .values_list("day", "mood_day", "mood_night")
+        )
+        count = 0
+        for day, mood_day, mood_night in qs.iterator(chunk_size=batch_size):
+            moods = weeks.setdefault(week_start(day), bytearray(14))
+            moods[day.weekday() * 2] = mood_day or 0
+            moods[day.weekday() * 2 + 1] = mood_night or 0
+            count += 1
+
+        Week.objects.filter(user_id=user_id).update(moods=None)
+        existing = Week.objects.filter(user_id=user_id, week_date__in=list(weeks))
+        updates = []
+        for week in existing:
+            week.moods = bytes(weeks.pop(week.week_date))
+            updates.append(week)
+        Week.objects.bulk_update(updates, ["moods"], batch_size=batch_size)
+        Week.objects.bulk_create(
+            [
+                Week(user_id=user_id, week_date=week_date, moods=bytes(moods))
+                for week_date, moods in weeks.items()
+            ],
+            batch_size=batch_size,
+        )
+        if delete_source:
+            Entry.objects.filter(user_id=user_id).delete()
+        return count
+
+    def _to_rows(self, user_id: int, batch_size: int, delete_source: bool) -> int:
+        entries = PackedMoodStore().entries(User.objects.get(pk=user_id))
+        Entry.objects.filter(user_id=user_id).delete()
+        Entry.objects.bulk_create(
+            [
+                Entry(
+                    user_id=user_id,
+                    day=entry.day,
+                    mood_day=entry.mood_day,
+                    mood_night=entry.mood_night,
+                )
+                for entry in entries
+            ],
+            batch_size=batch_size,
+        )
+        if delete_source:
+            Week.objects.filter(user_id=user_id).update(moods=None)
+        return len(entries)
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management import BaseCommand, call_command
+from django.db import DEFAULT_DB_ALIAS
+
+
+class Command(BaseCommand):
+    help = "Runs the migrations on the default database and on every shard."
+
+    def handle(self, *args: tuple, **options: dict) -> None:
+        for alias in [DEFAULT_DB_ALIAS, *settings.DATABASE_SHARDS]:
+            self.stdout.write(f"Migrating {alias}")
+            call_command(
+                "migrate",
+                database=alias,
+                interactive=False,
+                verbosity=options["verbosity"],
+            )
@@ -0,0 +1,47 @@
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, CommandError, CommandParser
+
+from web import sharding
+from web.models import UserShard
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves every user to the shard of their id modulo the number of shards, "
+        "e.g. after adding a shard or enabling sharding. Stop the app while it runs."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Only shows what would be moved."
+        )
+        parser.add_argument("--user", help="Only the user with this username.")
+
+    def handle(self, *args: tuple, **options: dict) -> None:
+        if not sharding.is_enabled():
+            raise CommandError("Sharding is disabled, see DATABASE_SHARD_URLS.")
+        users = User.objects.order_by("pk")
+        if options["user"]:
+            users = users.filter(username=options["user"])
+
+        moved = 0
+        for user_id in users.values_list("pk", flat=True).iterator():
+            # Read-only, --dry-run must not assign shards to new users
+            source = sharding.current_shard(user_id)
+            target = sharding.target_shard(user_id)
+            if source == target:
+                continue
+            if options["dry_run"]:
+                self.stdout.write(f"User {user_id}: {source} -> {target}")
+            else:
+                sharding.move_user(user_id, target)
+            moved += 1
+
+        self.stdout.write(
+            f"{'Would move' if options['dry_run'] else 'Moved'} {moved} users."
+        )
+        counts = Counter(UserShard.objects.values_list("shard", flat=True))
+        for alias in sharding.locations():
+            self.stdout.write(f"{alias}: {counts[alias]} users")
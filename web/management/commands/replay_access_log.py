@@ -0,0 +1,482 @@
+import gzip
+import http.client
+import json
+import math
+import queue
+import random
+import re
+import threading
+import time
+import typing
+import zlib
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, CommandError, CommandParser
+from django.db import connections
+from django.test import Client, override_settings
+from django.urls import Resolver404, resolve
+from django.utils.crypto import get_random_string
+
+from web import auth, sharding
+from web.models import Week
+from web.storage import get_store
+from web.structs import WeekdayEntry
+
+USERNAME_PREFIX = "replay-"
+PASSWORD = "replay-password"
+
+# log-format of docker/app/uwsgi.ini, the log-date prefix is skipped
+LINE_RE = re.compile(
+    r"(?P<addr>\S+) - (?P<user>\S+) \[(?P<time>[^\]]+)\] "
+    r'"(?P<method>[A-Z]+) (?P<uri>\S+) [^"]*" (?P<status>\d{3}) \d+ '
+    r'"[^"]*" "(?P<uagent>[^"]*)"'
+)
+# %(ltime), or the log-date format if it was used instead
+TIME_FORMATS = ["%d/%b/%Y:%H:%M:%S %z", "%Y:%m:%d %H:%M:%S"]
+
+# Requests that would end the session or never end
+SKIPPED_ROUTES = {"logout", "api/events/"}
+SKIPPED_PREFIXES = ("admin/", "accounts/", "login/", "password_")
+
+REPORT_HEADER = [
+    "route",
+    "requests",
+    "errors",
+    "4xx",
+    "p50 ms",
+    "p90 ms",
+    "p99 ms",
+    "max ms",
+]
+
+
+def _day(rng: random.Random, days: int) -> str:
+    return (date.today() - timedelta(days=rng.randrange(days))).strftime(
+        settings.SK_DATE_FORMAT
+    )
+
+
+def _week(rng: random.Random, days: int) -> str:
+    day = date.today() - timedelta(days=rng.randrange(days))
+    return (day - timedelta(days=day.weekday())).strftime(settings.SK_DATE_FORMAT)
+
+
+# The log has no request bodies, writes get a generated one:
+# route -> (JSON body, function of user, random and days)
+PAYLOADS = {
+    "save-mood/": (
+        False,
+        lambda user, rng, days: {
+            "entry": f"{rng.randint(1, 5)}_{_day(rng, days)}",
+            "period": rng.choice(["day", "night"]),
+        },
+    ),
+    "save-note/": (
+        False,
+        lambda user, rng, days: {"week": _week(rng, days), "note": "Replayed"},
+    ),
+    "save-settings/": (
+        False,
+        lambda user, rng, days: {
+            "view_day_form": "on",
+            "view_night_form": "on",
+            "use_js_btn": "on",
+        },
+    ),
+    "api/entry-day/": (
+        True,
+        lambda user, rng, days: {
+            "mood": rng.randint(1, 5),
+            "period": rng.choice(["day", "night"]),
+            "day": _day(rng, days),
+        },
+    ),
+    "api/save-note/": (
+        True,
+        lambda user, rng, days: {"week_date": _week(rng, days), "note": "Replayed"},
+    ),
+    "api/set-language/": (
+        True,
+        lambda user, rng, days: {"language": settings.LANGUAGE_CODE},
+    ),
+    "api/forms-displayed/": (
+        True,
+        lambda user, rng, days: {"day_form": True, "night_form": True},
+    ),
+    "api/token/": (
+        True,
+        lambda user, rng, days: {"username": user.username, "password": PASSWORD},
+    ),
+    "api/token/refresh/": (
+        True,
+        lambda user, rng, days: {"refresh": auth.issue_tokens(user)["refresh"]},
+    ),
+}
+
+
+@dataclass
+class LogRequest:
+    # Seconds after the first request of the log
+    offset: float
+    method: str
+    uri: str
+    route: str
+    user: User
+    user_agent: str
+    body: typing.Optional[str] = None
+    content_type: typing.Optional[str] = None
+
+
+@dataclass
+class Result:
+    route: str
+    status: typing.Optional[int]
+    seconds: float
+    error: str = ""
+
+
+def _percentile(values: typing.List[float], percent: int) -> float:
+    # Nearest rank of the sorted values
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays a uWSGI access log (log-format of docker/app/uwsgi.ini) against "
+        "the app, in-process or over HTTP, and reports the latency percentiles "
+        f"and errors per route. Requests are mapped by client address onto "
+        f"generated users ({USERNAME_PREFIX}*), which are kept for the next run."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("log_file", help="Access log, may be gzipped.")
+        parser.add_argument("--users", type=int, default=20)
+        parser.add_argument(
+            "--days", type=int, default=365, help="Days of moods of a new user."
+        )
+        parser.add_argument("--concurrency", type=int, default=4)
+        parser.add_argument(
+            "--speed",
+            type=float,
+            default=0,
+            help="Speed-up of the logged request times, e.g. 10 replays an hour "
+            "in 6 minutes. 0 sends the requests as fast as the clients can.",
+        )
+        parser.add_argument("--limit", type=int, default=0)
+        parser.add_argument(
+            "--url",
+            help="Base URL of a running server, e.g. http://127.0.0.1:8000. It "
+            "must use this database and a session store this command can write "
+            "to. Without it, the requests go to the app in this process.",
+        )
+        parser.add_argument(
+            "--methods",
+            default="GET,HEAD,POST",
+            help="Methods to replay, comma-separated.",
+        )
+
+    def handle(self, *args: tuple, **options: dict) -> None:
+        if sharding.is_enabled():
+            raise CommandError("Run the replay without DATABASE_SHARD_URLS.")
+        users = self._users(options["users"], options["days"])
+        skipped = Counter()
+        requests = list(
+            self._parse(
+                options["log_file"],
+                users,
+                options["days"],
+                {method.strip().upper() for method in options["methods"].split(",")},
+                options["limit"],
+                skipped,
+            )
+        )
+        if not requests:
+            raise CommandError("No requests to replay.")
+        for reason, count in sorted(skipped.items()):
+            self.stdout.write(f"Skipped {count} requests: {reason}")
+
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            if options["url"]:
+                send = HttpSender(options["url"], users)
+            else:
+                send = ClientSender()
+            start = time.perf_counter()
+            results, behind = self._replay(
+                requests, send, options["concurrency"], options["speed"]
+            )
+            seconds = time.perf_counter() - start
+
+        self.stdout.write(
+            f"Replayed {len(results)} requests of {len(users)} users in "
+            f"{seconds:.1f} s ({len(results) / seconds:.0f} req/s), "
+            f"concurrency {options['concurrency']}"
+        )
+        if options["speed"]:
+            self.stdout.write(
+                f"At most {behind:.2f} s behind the schedule of the log "
+                f"(speed-up {options['speed']:g})"
+            )
+        self._report(results)
+
+    def _users(self, count: int, days: int) -> typing.List[User]:
+        users = []
+        store = get_store()
+        for i in range(count):
+            user, created = User.objects.get_or_create(username=f"{USERNAME_PREFIX}{i}")
+            if created:
+                user.set_password(PASSWORD)
+                user.save(update_fields=["password"])
+                rng = random.Random(i)
+                store.save_many(
+                    user,
+                    [
+                        WeekdayEntry(
+                            date.today() - timedelta(days=d),
+                            rng.randint(1, 5),
+                            rng.randint(1, 5),
+                        )
+                        for d in range(days)
+                        if rng.random() > 0.1
+                    ],
+                )
+                for d in range(0, days, 28):
+                    week_date = date.today() - timedelta(days=d)
+                    Week.objects.update_or_create(
+                        user=user,
+                        week_date=week_date - timedelta(days=week_date.weekday()),
+                        defaults={"note": f"Note {d}"},
+                    )
+            users.append(user)
+        return users
+
+    def _parse(
+        self,
+        path: str,
+        users: typing.List[User],
+        days: int,
+        methods: typing.Set[str],
+        limit: int,
+        skipped: Counter,
+    ) -> typing.Iterator[LogRequest]:
+        opener = gzip.open if path.endswith(".gz") else open
+        first = None
+        offset = 0.0
+        rng = random.Random(0)
+        count = 0
+        with opener(path, "rt", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                match = LINE_RE.search(line)
+                if not match:
+                    continue
+                logged_at = self._time(match["time"])
+                if logged_at:
+                    first = first or logged_at
+                    offset = max(offset, (logged_at - first).total_seconds())
+
+                method, uri = match["method"], match["uri"]
+                try:
+                    route = resolve(urlsplit(uri).path).route
+                except Resolver404:
+                    skipped["not a route of the app"] += 1
+                    continue
+                if method not in methods:
+                    skipped[f"{method} not replayed"] += 1
+                    continue
+                if route in SKIPPED_ROUTES or route.startswith(SKIPPED_PREFIXES):
+                    skipped[f"{route} not replayed"] += 1
+                    continue
+
+                # Every client address stays with one user
+                user = users[zlib.crc32(match["addr"].encode()) % len(users)]
+                request = LogRequest(offset, method, uri, route, user, match["uagent"])
+                if method == "POST":
+                    if route not in PAYLOADS:
+                        skipped[f"POST {route} has no generated body"] += 1
+                        continue
+                    is_json, payload = PAYLOADS[route]
+                    data = payload(user, rng, days)
+                    if is_json:
+                        request.body = json.dumps(data)
+                        request.content_type = "application/json"
+                    else:
+                        request.body = data
+                yield request
+                count += 1
+                if count == limit:
+                    return
+
+    @staticmethod
+    def _time(value: str) -> typing.Optional[datetime]:
+        for time_format in TIME_FORMATS:
+            try:
+                return datetime.strptime(value, time_format).replace(tzinfo=None)
+            except ValueError:
+                continue
+        return None
+
+    def _replay(
+        self,
+        requests: typing.List[LogRequest],
+        send: typing.Callable,
+        concurrency: int,
+        speed: float,
+    ) -> typing.Tuple[typing.List[Result], float]:
+        jobs = queue.Queue(maxsize=concurrency * 2)
+        results = []
+        behind = 0.0
+
+        def work():
+            try:
+                while (request := jobs.get()) is not None:
+                    results.append(send(request))
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=work) for _ in range(concurrency)]
+        for worker in workers:
+            worker.start()
+        start = time.perf_counter()
+        for request in requests:
+            if speed:
+                delay = request.offset / speed - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+                behind = max(behind, -delay)
+            jobs.put(request)
+        for _ in workers:
+            jobs.put(None)
+        for worker in workers:
+            worker.join()
+        return results, behind
+
+    def _report(self, results: typing.List[Result]) -> None:
+        routes = defaultdict(list)
+        for result in results:
+            routes[result.route].append(result)
+        rows = []
+        for route, route_results in routes.items():
+            ms = sorted(result.seconds * 1000 for result in route_results)
+            errors = [
+                result
+                for result in route_results
+                if result.status is None or result.status >= 500
+            ]
+            client_errors = sum(
+                1 for result in route_results if 400 <= (result.status or 0) < 500
+            )
+            rows.append(
+                (
+                    sum(ms),
+                    [
+                        route or "/",
+                        str(len(ms)),
+                        str(len(errors)),
+                        str(client_errors),
+                        *[f"{_percentile(ms, p):.1f}" for p in (50, 90, 99)],
+                        f"{ms[-1]:.1f}",
+                    ],
+                )
+            )
+            for error in {result.error for result in errors if result.error}:
+                self.stderr.write(f"{route or '/'}: {error}")
+
+        # Routes with the most time first
+        table = [REPORT_HEADER] + [row for _, row in sorted(rows, reverse=True)]
+        widths = [max(len(row[i]) for row in table) for i in range(len(REPORT_HEADER))]
+        for row in table:
+            self.stdout.write(
+                "  ".join(
+                    cell.ljust(width) if i == 0 else cell.rjust(width)
+                    for i, (cell, width) in enumerate(zip(row, widths))
+                )
+            )
+
+
+class ClientSender:
+    """
+    Sends the requests to the app in this process, with one logged-in client
+    per thread and user.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def _client(self, user: User) -> Client:
+        clients = self.local.__dict__.setdefault("clients", {})
+        if user.pk not in clients:
+            clients[user.pk] = Client(raise_request_exception=False)
+            clients[user.pk].force_login(user)
+        return clients[user.pk]
+
+    def __call__(self, request: LogRequest) -> Result:
+        client = self._client(request.user)
+        kwargs = {"headers": {"user-agent": request.user_agent}}
+        if request.content_type:
+            kwargs["content_type"] = request.content_type
+        start = time.perf_counter()
+        try:
+            if request.method == "POST":
+                response = client.post(request.uri, request.body, **kwargs)
+            else:
+                response = client.generic(request.method, request.uri, **kwargs)
+            if response.streaming:
+                b"".join(response.streaming_content)
+        except Exception as e:
+            return Result(request.route, None, time.perf_counter() - start, repr(e))
+        return Result(request.route, response.status_code, time.perf_counter() - start)
+
+
+class HttpSender:
+    """
+    Sends the requests to a server, with one kept-alive connection per thread
+    and the session cookie of each user.
+    """
+
+    def __init__(self, url: str, users: typing.List[User]):
+        parts = urlsplit(url)
+        self.connection_class = (
+            http.client.HTTPSConnection
+            if parts.scheme == "https"
+            else http.client.HTTPConnection
+        )
+        self.netloc = parts.netloc
+        self.local = threading.local()
+        csrf_token = get_random_string(32)
+        self.headers = {}
+        for user in users:
+            client = Client()
+            client.force_login(user)
+            session = client.cookies[settings.SESSION_COOKIE_NAME].value
+            self.headers[user.pk] = {
+                "Cookie": f"{settings.SESSION_COOKIE_NAME}={session}; "
+                f"{settings.CSRF_COOKIE_NAME}={csrf_token}",
+                settings.CSRF_HEADER_NAME[5:].replace("_", "-"): csrf_token,
+            }
+
+    def __call__(self, request: LogRequest) -> Result:
+        if getattr(self.local, "connection", None) is None:
+            self.local.connection = self.connection_class(self.netloc, timeout=60)
+        headers = {**self.headers[request.user.pk], "User-Agent": request.user_agent}
+        body = request.body
+        if isinstance(body, dict):
+            body = urlencode(body)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        elif request.content_type:
+            headers["Content-Type"] = request.content_type
+        start = time.perf_counter()
+        try:
+            self.local.connection.request(
+                request.method, request.uri, body=body, headers=headers
+            )
+            response = self.local.connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException) as e:
+            self.local.connection.close()
+            self.local.connection = None
+            return Result(request.route, None, time.perf_counter() - start, repr(e))
+        return Result(request.route, response.status, time.perf_counter() - start)
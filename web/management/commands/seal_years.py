@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, CommandError, CommandParser
+from django.utils import timezone
+
+from web.archive import seal_year, unseal_year
+from web.models import ArchivedYear
+from web.sharding import use_shard
+from web.storage import get_store
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves the moods of past years into the archive, see SK_ARCHIVE. "
+        "Can run regularly, e.g. once a year."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--older-than",
+            type=int,
+            default=2,
+            help="Seals the years before the current year minus this many years.",
+        )
+        parser.add_argument("--user", help="Only the user with this username.")
+        parser.add_argument(
+            "--unseal-all",
+            action="store_true",
+            help="Moves all archived years back into the mood store.",
+        )
+
+    def handle(self, *args: tuple, **options: dict) -> None:
+        if not settings.SK_ARCHIVE:
+            raise CommandError("The archive is disabled, see SK_ARCHIVE.")
+        # The wrapped store, the archive store would unseal on every write
+        store = get_store().store
+        users = User.objects.order_by("pk")
+        if options["user"]:
+            users = users.filter(username=options["user"])
+
+        if options["unseal_all"]:
+            count = 0
+            for user in users:
+                with use_shard(user):
+                    years = ArchivedYear.objects.filter(user=user).values_list(
+                        "year", flat=True
+                    )
+                    for year in list(years):
+                        unseal_year(store, user, year)
+                        count += 1
+            self.stdout.write(f"Unsealed {count} years.")
+            return
+
+        before_year = timezone.now().year - options["older_than"]
+        count = 0
+        for user in users:
+            with use_shard(user):
+                bounds = store.bounds(user)
+                if not bounds[0]:
+                    continue
+                for year in range(bounds[0].year, min(bounds[1].year + 1, before_year)):
+                    if seal_year(store, user, year):
+                        count += 1
+        self.stdout.write(f"Sealed {count} years before {before_year}.")
@@ -0,0 +1,196 @@
+"""
+Memory of the worker processes (`MEMORY_*` settings).
+
+A share of the requests (`MEMORY_SAMPLE_RATE`) is stored as `MemorySample`
+with the growth of the resident memory (RSS) of the process and the peak of
+the memory allocated by Python during the request, traced by tracemalloc.
+`./manage.py memory_report` sums them up by route. Only one request per process
+is measured at a time; under ASGI, the numbers include the requests that run
+concurrently in the event loop.
+
+`api/memory/` shows the top allocation sites of the process that serves it,
+and their growth since the last call, if tracemalloc traces all the time
+(`MEMORY_TRACE_FRAMES`).
+"""
+
+import linecache
+import os
+import random
+import threading
+import tracemalloc
+import typing
+from functools import lru_cache
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+from django.urls import reverse
+from django.utils.decorators import sync_and_async_middleware
+
+from web.models import MemorySample
+
+# Samples are deleted down to MEMORY_MAX_SAMPLES every this many samples
+ROTATE_EVERY = 100
+
+_lock = threading.Lock()
+_last_snapshot = None
+
+_TRACE_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, linecache.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def rss() -> typing.Optional[int]:
+    """
+    Resident memory of this process in bytes, None if it isn't known (only
+    Linux has /proc).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def start_tracing() -> None:
+    """
+    Keeps tracemalloc running, called on startup with `MEMORY_TRACE_FRAMES`.
+    """
+    if settings.MEMORY_TRACE_FRAMES and not tracemalloc.is_tracing():
+        tracemalloc.start(settings.MEMORY_TRACE_FRAMES)
+
+
+class _Measurement:
+    def start(self) -> bool:
+        if not _lock.acquire(blocking=False):
+            return False
+        # Traces only during the request, unless it traces all the time
+        self.started_tracing = not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self.traced = tracemalloc.get_traced_memory()[0]
+        self.rss = rss()
+        return True
+
+    def stop(self) -> typing.Tuple[typing.Optional[int], typing.Optional[int], int]:
+        try:
+            peak = tracemalloc.get_traced_memory()[1] - self.traced
+            if self.started_tracing:
+                tracemalloc.stop()
+        finally:
+            _lock.release()
+        rss_delta = None
+        rss_after = rss()
+        if self.rss is not None and rss_after is not None:
+            rss_delta = rss_after - self.rss
+        return rss_after, rss_delta, peak
+
+
+def _save(request: HttpRequest, measurement: tuple) -> None:
+    rss_after, rss_delta, peak = measurement
+    match = request.resolver_match
+    sample = MemorySample.objects.create(
+        route=(match.route if match else "")[:255],
+        pid=os.getpid(),
+        rss=rss_after,
+        rss_delta=rss_delta,
+        peak_alloc=peak,
+    )
+    if sample.pk % ROTATE_EVERY == 0:
+        stale = list(
+            MemorySample.objects.values_list("pk", flat=True)[
+                settings.MEMORY_MAX_SAMPLES :
+            ]
+        )
+        if stale:
+            MemorySample.objects.filter(pk__in=stale).delete()
+
+
+@lru_cache
+def _memory_path() -> str:
+    return reverse("api-memory")
+
+
+def _sampled(request: HttpRequest) -> typing.Optional[_Measurement]:
+    if random.random() >= settings.MEMORY_SAMPLE_RATE:
+        return None
+    # The snapshots of api/memory/ would outweigh the requests of the app
+    if request.path_info == _memory_path():
+        return None
+    measurement = _Measurement()
+    return measurement if measurement.start() else None
+
+
+@sync_and_async_middleware
+def memory_middleware(get_response: typing.Callable) -> typing.Callable:
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            measurement = _sampled(request)
+            if not measurement:
+                return await get_response(request)
+            try:
+                response = await get_response(request)
+            finally:
+                result = measurement.stop()
+            await sync_to_async(_save)(request, result)
+            return response
+
+        return middleware
+
+    def middleware(request) -> HttpResponse:
+        measurement = _sampled(request)
+        if not measurement:
+            return get_response(request)
+        try:
+            response = get_response(request)
+        finally:
+            result = measurement.stop()
+        _save(request, result)
+        return response
+
+    return middleware
+
+
+def _site(stat: typing.Any) -> dict:
+    frame = stat.traceback[0]
+    return {
+        "site": f"{frame.filename}:{frame.lineno}",
+        "size": stat.size,
+        "count": stat.count,
+    }
+
+
+def allocation_sites(limit: int) -> dict:
+    """
+    The top allocation sites of this process, and the sites that grew the
+    most since the last call in this process.
+    """
+    global _last_snapshot
+
+    # Without MEMORY_TRACE_FRAMES, only a sampled request may be traced now
+    tracing = bool(settings.MEMORY_TRACE_FRAMES) and tracemalloc.is_tracing()
+    data = {
+        "pid": os.getpid(),
+        "rss": rss(),
+        "tracing": tracing,
+        "top": [],
+        "growth": [],
+    }
+    if not tracing:
+        return data
+    data["traced"], data["traced_peak"] = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot().filter_traces(_TRACE_FILTERS)
+    data["top"] = [_site(stat) for stat in snapshot.statistics("lineno")[:limit]]
+    if _last_snapshot is not None:
+        data["growth"] = [
+            {**_site(stat), "size_diff": stat.size_diff, "count_diff": stat.count_diff}
+            for stat in snapshot.compare_to(_last_snapshot, "lineno")[:limit]
+        ]
+    _last_snapshot = snapshot
+    return data
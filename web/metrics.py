@@ -0,0 +1,228 @@
+"""
+Prometheus metrics (`METRICS`), served at `metrics`, requires the
+`prometheus_client` package.
+
+uWSGI runs every worker in its own process. With the environment variable
+`PROMETHEUS_MULTIPROC_DIR` (an empty directory, cleared before the server
+starts), the workers write their metrics to files there and the scrape sums
+them up. Without it, a scrape only sees the worker that serves it.
+
+The database queries of a request are counted by a wrapper on every
+connection, which finds the request through a context variable; the threads
+of async views inherit it.
+"""
+
+import contextvars
+import os
+import time
+import typing
+from datetime import timedelta
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.signals import connection_created
+from django.db.models import Count, Q
+from django.dispatch import receiver
+from django.http import HttpRequest, HttpResponse
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import sync_and_async_middleware
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST,
+        REGISTRY,
+        CollectorRegistry,
+        Counter,
+        Histogram,
+        generate_latest,
+        multiprocess,
+    )
+    from prometheus_client.core import GaugeMetricFamily
+except ImportError:
+    Counter = None
+
+if settings.METRICS and Counter is None:
+    raise ImproperlyConfigured("METRICS requires the prometheus_client package.")
+
+# Windows of sk_active_users, by last login
+ACTIVE_WINDOWS = {
+    "1d": timedelta(days=1),
+    "7d": timedelta(days=7),
+    "30d": timedelta(days=30),
+}
+
+if Counter is not None:
+    REQUEST_DURATION = Histogram(
+        "sk_request_duration_seconds",
+        "Time to answer a request, by URL name",
+        ["view", "method"],
+    )
+    REQUESTS = Counter(
+        "sk_requests", "Answered requests, by URL name", ["view", "method", "status"]
+    )
+    DB_QUERIES = Histogram(
+        "sk_db_queries_per_request",
+        "Database queries of a request",
+        ["view"],
+        buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, float("inf")),
+    )
+    DB_DURATION = Histogram(
+        "sk_db_duration_seconds_per_request",
+        "Time of the database queries of a request",
+        ["view"],
+    )
+    CACHE_LOOKUPS = Counter(
+        "sk_cache_lookups", "Lookups in the cache", ["cache", "result"]
+    )
+    WRITES = Counter("sk_writes", "Saved moods and notes", ["kind"])
+
+
+class _RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+_request_stats = contextvars.ContextVar("sk_metrics_request", default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.seconds += time.perf_counter() - start
+
+
+def instrument_connection(connection: typing.Any) -> None:
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+@receiver(connection_created)
+def _instrument_new_connection(sender, connection, **kwargs) -> None:
+    if settings.METRICS:
+        instrument_connection(connection)
+
+
+def cache_lookup(cache_name: str, hit: bool) -> None:
+    """
+    Counts a lookup in the cache, the hit ratio is
+    `rate(sk_cache_lookups_total{result="hit"}) / rate(sk_cache_lookups_total)`.
+    """
+    if settings.METRICS:
+        CACHE_LOOKUPS.labels(cache_name, "hit" if hit else "miss").inc()
+
+
+def count_write(kind: str) -> None:
+    if settings.METRICS:
+        WRITES.labels(kind).inc()
+
+
+def _view(request: HttpRequest) -> str:
+    match = request.resolver_match
+    if match is None:
+        return "unresolved"
+    return match.url_name or match.route
+
+
+def _observe(
+    request: HttpRequest, response: HttpResponse, seconds: float, stats: _RequestStats
+) -> None:
+    view = _view(request)
+    REQUEST_DURATION.labels(view, request.method).observe(seconds)
+    REQUESTS.labels(view, request.method, str(response.status_code)).inc()
+    DB_QUERIES.labels(view).observe(stats.queries)
+    DB_DURATION.labels(view).observe(stats.seconds)
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response: typing.Callable) -> typing.Callable:
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            stats = _RequestStats()
+            token = _request_stats.set(stats)
+            start = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                _request_stats.reset(token)
+            _observe(request, response, time.perf_counter() - start, stats)
+            return response
+
+        return middleware
+
+    def middleware(request):
+        stats = _RequestStats()
+        token = _request_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = get_response(request)
+        finally:
+            _request_stats.reset(token)
+        _observe(request, response, time.perf_counter() - start, stats)
+        return response
+
+    return middleware
+
+
+class ActiveUsersCollector:
+    """
+    Counts the users by their last login when scraped.
+    """
+
+    def collect(self) -> typing.Iterator:
+        now = timezone.now()
+        counts = User.objects.aggregate(
+            **{
+                window: Count("pk", filter=Q(last_login__gte=now - delta))
+                for window, delta in ACTIVE_WINDOWS.items()
+            }
+        )
+        family = GaugeMetricFamily(
+            "sk_active_users",
+            "Users who logged in within the window",
+            labels=["window"],
+        )
+        for window, count in counts.items():
+            family.add_metric([window], count)
+        yield family
+
+
+def render(path: typing.Optional[str] = None) -> bytes:
+    """
+    The metrics in the Prometheus text format, summed up over the processes
+    that write to `path` (default: `PROMETHEUS_MULTIPROC_DIR`).
+    """
+    path = path or os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=path)
+    else:
+        # The metrics of this process only
+        registry = REGISTRY
+    users = CollectorRegistry()
+    users.register(ActiveUsersCollector())
+    return generate_latest(registry) + generate_latest(users)
+
+
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    """
+    Scraped by Prometheus, with `Authorization: Bearer <METRICS_TOKEN>` if
+    `METRICS_TOKEN` is set.
+    """
+    if settings.METRICS_TOKEN:
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+        if scheme != "Bearer" or not constant_time_compare(
+            token, settings.METRICS_TOKEN
+        ):
+            return HttpResponse(status=401)
+    return HttpResponse(render(), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.5 on 2026-10-18 23:17
+
+import django.db.models.functions.datetime
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("web", "0024_usersettings_use_js_btn"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="entry",
+            index=models.Index(
+                models.F("user"),
+                django.db.models.functions.datetime.ExtractIsoWeekDay("day"),
+                django.db.models.functions.datetime.ExtractMonth("day"),
+                name="entry_user_weekday_month_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.5 on 2026-10-18 23:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("web", "0025_entry_user_weekday_month_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="usersettings",
+            name="good_streak",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="usersettings",
+            name="good_streak_end",
+            field=models.DateField(null=True),
+        ),
+        migrations.AddField(
+            model_name="usersettings",
+            name="longest_good_streak",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="usersettings",
+            name="longest_tracked_streak",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="usersettings",
+            name="streaks_valid",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name="usersettings",
+            name="tracked_streak",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="usersettings",
+            name="tracked_streak_end",
+            field=models.DateField(null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.5 on 2026-10-18 23:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("web", "0026_usersettings_streaks"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="usersettings",
+            name="data_version",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
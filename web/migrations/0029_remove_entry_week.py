@@ -0,0 +1,16 @@
+# Generated by Django 5.1.5 on 2026-10-18 23:33
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("web", "0028_skevent"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="entry",
+            name="week",
+        ),
+    ]
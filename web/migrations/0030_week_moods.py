@@ -0,0 +1,17 @@
+# Generated by Django 5.1.5 on 2026-10-18 23:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("web", "0029_remove_entry_week"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="week",
+            name="moods",
+            field=models.BinaryField(null=True),
+        ),
+    ]
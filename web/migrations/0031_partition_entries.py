@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.db import migrations
+
+from web import partitioning
+
+
+def partition_entries(apps, schema_editor):
+    connection = schema_editor.connection
+    if settings.SK_PARTITION_ENTRIES and partitioning.is_supported(connection):
+        partitioning.partition_table(connection)
+
+
+def unpartition_entries(apps, schema_editor):
+    connection = schema_editor.connection
+    if partitioning.is_supported(connection) and partitioning.is_partitioned(
+        connection
+    ):
+        partitioning.unpartition_table(connection)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("web", "0030_week_moods"),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_entries, unpartition_entries),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.5 on 2026-10-18 23:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("web", "0032_archivedyear"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserShard",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("shard", models.CharField(max_length=32)),
+            ],
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.5 on 2026-10-19 00:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("web", "0034_requestprofile"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MemorySample",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("route", models.CharField(max_length=255)),
+                ("pid", models.PositiveIntegerField()),
+                ("rss", models.PositiveBigIntegerField(null=True)),
+                ("rss_delta", models.BigIntegerField(null=True)),
+                ("peak_alloc", models.PositiveBigIntegerField()),
+            ],
+            options={
+                "ordering": ["-created"],
+            },
+        ),
+    ]
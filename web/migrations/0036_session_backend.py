@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.contrib.sessions.backends.cached_db import KEY_PREFIX
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import caches
+from django.db import migrations
+from django.utils import timezone
+
+MODEL_BACKEND = "django.contrib.auth.backends.ModelBackend"
+CACHED_MODEL_BACKEND = "web.auth.CachedModelBackend"
+
+
+def _rewrite_backend(apps, schema_editor, old: str, new: str) -> None:
+    """
+    Django logs out sessions whose backend is not in AUTHENTICATION_BACKENDS.
+    Sessions in signed cookies can't be rewritten, their users log in again.
+    """
+    Session = apps.get_model("sessions", "Session")
+    store = SessionStore()
+    sessions = Session.objects.using(schema_editor.connection.alias).filter(
+        expire_date__gt=timezone.now()
+    )
+    for session in sessions.iterator():
+        data = store.decode(session.session_data)
+        if data.get(BACKEND_SESSION_KEY) != old:
+            continue
+        data[BACKEND_SESSION_KEY] = new
+        session.session_data = store.encode(data)
+        session.save(update_fields=["session_data"])
+        if settings.SESSION_ENGINE == "django.contrib.sessions.backends.cached_db":
+            # The cached copy is read first
+            caches[settings.SESSION_CACHE_ALIAS].delete(
+                KEY_PREFIX + session.session_key
+            )
+
+
+def to_cached_model_backend(apps, schema_editor):
+    _rewrite_backend(apps, schema_editor, MODEL_BACKEND, CACHED_MODEL_BACKEND)
+
+
+def to_model_backend(apps, schema_editor):
+    _rewrite_backend(apps, schema_editor, CACHED_MODEL_BACKEND, MODEL_BACKEND)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sessions", "0001_initial"),
+        ("web", "0035_memorysample"),
+    ]
+
+    operations = [
+        # Sessions stay in the default database, see web.sharding
+        migrations.RunPython(
+            to_cached_model_backend, to_model_backend, hints={"model_name": "session"}
+        ),
+    ]
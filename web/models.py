@@ -1,7 +1,11 @@
+from pathlib import Path
+
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.db import models
 from django.db.models.base import ModelBase
-from django.db.models.signals import post_save
+from django.db.models.functions import ExtractIsoWeekDay, ExtractMonth
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
 PERIODS = ["day", "night"]
@@ -17,7 +21,6 @@ class Moods(models.IntegerChoices):
 
 class Entry(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    week = models.ForeignKey("Week", on_delete=models.CASCADE, null=True)
     mood_day = models.IntegerField(choices=Moods.choices, null=True)
     mood_night = models.IntegerField(choices=Moods.choices, null=True)
     day = models.DateField(db_index=True)
@@ -31,12 +34,23 @@ class Meta:
         constraints = [
             models.UniqueConstraint(fields=["user", "day"], name="Unique user and day")
         ]
+        indexes = [
+            # Supports the weekday x month GROUP BY of the heatmap
+            models.Index(
+                models.F("user"),
+                ExtractIsoWeekDay("day"),
+                ExtractMonth("day"),
+                name="entry_user_weekday_month_idx",
+            ),
+        ]
 
 
 class Week(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     week_date = models.DateField(db_index=True, null=True)  # Start of the week
     note = models.TextField(blank=True)
+    # Moods of the week if SK_MOOD_STORAGE is web.storage.PackedMoodStore
+    moods = models.BinaryField(null=True)
 
     def __str__(self) -> str:
         return f"User: {self.user}, Week Date: {self.week_date}, Note: {self.note[:10]}"
@@ -60,6 +74,18 @@ class UserSettings(models.Model):
     view_night_form = models.BooleanField(default=True)
     # Defines, if the mood form contains the default buttons or the new toggle button group.
     use_js_btn = models.BooleanField(default=True)
+    # Incremented on every change of moods, notes or colors; used to build
+    # cacheable URLs for rendered data.
+    data_version = models.PositiveIntegerField(default=0)
+    # Streak counters, maintained by the StreakService on every mood write.
+    # A streak is described by its length and the day it ended on.
+    streaks_valid = models.BooleanField(default=False)
+    tracked_streak = models.PositiveIntegerField(default=0)
+    tracked_streak_end = models.DateField(null=True)
+    longest_tracked_streak = models.PositiveIntegerField(default=0)
+    good_streak = models.PositiveIntegerField(default=0)
+    good_streak_end = models.DateField(null=True)
+    longest_good_streak = models.PositiveIntegerField(default=0)
 
 
 class UserMoodColorSettings(models.Model):
@@ -72,6 +98,90 @@ class UserMoodColorSettings(models.Model):
     color = models.CharField(max_length=32)
 
 
+class SkEvent(models.Model):
+    """
+    A change event, used by the DatabaseEventBroker.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    type = models.CharField(max_length=16)
+    data = models.JSONField()
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+
+class ArchivedYear(models.Model):
+    """
+    The moods of a sealed year, see web.archive.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    year = models.PositiveSmallIntegerField()
+    # zlib-compressed, two bytes (day and night) per day of the year
+    moods = models.BinaryField()
+    # Number of days per period and mood
+    stats = models.JSONField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "year"], name="Unique user and archived year"
+            )
+        ]
+
+
+class UserShard(models.Model):
+    """
+    The database with the data of a user, see web.sharding.
+    """
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
+    shard = models.CharField(max_length=32)
+
+
+class RequestProfile(models.Model):
+    """
+    A profiled request, see web.profiling. The profile is a file in
+    `PROFILE_DIR`.
+    """
+
+    created = models.DateTimeField(auto_now_add=True)
+    method = models.CharField(max_length=8)
+    path = models.CharField(max_length=512)
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    status = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    # Why the request was profiled: sample, header or user
+    trigger = models.CharField(max_length=16)
+    file_name = models.CharField(max_length=128)
+
+    class Meta:
+        ordering = ["-created"]
+
+    @property
+    def file_path(self) -> Path:
+        return Path(settings.PROFILE_DIR) / self.file_name
+
+
+class MemorySample(models.Model):
+    """
+    The memory of a sampled request, see web.memory.
+    """
+
+    created = models.DateTimeField(auto_now_add=True)
+    route = models.CharField(max_length=255)
+    pid = models.PositiveIntegerField()
+    # Resident memory of the process after the request and its growth
+    # during the request (bytes), if known
+    rss = models.PositiveBigIntegerField(null=True)
+    rss_delta = models.BigIntegerField(null=True)
+    # Peak of the memory allocated by Python during the request (bytes)
+    peak_alloc = models.PositiveBigIntegerField()
+
+    class Meta:
+        ordering = ["-created"]
+
+
 # Django database signals
 
 
@@ -81,4 +191,13 @@ def create_user_settings(
     sender: ModelBase, instance: User, created: bool, **kwargs: dict
 ) -> None:
     if created:
-        UserSettings.objects.create(user=instance)
+        # Saving the instance lets web.sharding route it by its user
+        UserSettings(user=instance).save(force_insert=True)
+
+
+# Remove the file of a deleted profile
+@receiver(post_delete, sender=RequestProfile)
+def delete_request_profile_file(
+    sender: ModelBase, instance: RequestProfile, **kwargs: dict
+) -> None:
+    instance.file_path.unlink(missing_ok=True)
@@ -0,0 +1,216 @@
+"""
+Yearly range partitions of the `Entry` table on Postgres, see
+`SK_PARTITION_ENTRIES`.
+
+The partitioned table keeps the name, columns, indexes and constraints of the
+plain table, only its primary key becomes (id, day), because Postgres requires
+the partition key in every unique constraint. Days without a partition of
+their year end up in the default partition.
+"""
+
+import typing
+from dataclasses import dataclass
+from datetime import date
+
+from django.conf import settings
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.utils import timezone
+
+from web.models import Entry
+
+TABLE = Entry._meta.db_table
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+
+@dataclass
+class Partition:
+    name: str
+    year: typing.Optional[int]  # None for the default partition
+    rows: int  # Estimated by the planner statistics
+    size: int  # Bytes, including indexes
+
+
+def is_supported(connection: BaseDatabaseWrapper) -> bool:
+    return connection.vendor == "postgresql"
+
+
+def is_partitioned(connection: BaseDatabaseWrapper) -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+            "WHERE partrelid = to_regclass(%s))",
+            [TABLE],
+        )
+        return cursor.fetchone()[0]
+
+
+def partition_name(year: int) -> str:
+    return f"{TABLE}_y{year}"
+
+
+def partitions(connection: BaseDatabaseWrapper) -> typing.List[Partition]:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, GREATEST(c.reltuples, 0), pg_total_relation_size(c.oid) "
+            "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(%s) ORDER BY c.relname",
+            [TABLE],
+        )
+        return [
+            Partition(
+                name=name,
+                year=None if name == DEFAULT_PARTITION else int(name[-4:]),
+                rows=int(rows),
+                size=size,
+            )
+            for name, rows, size in cursor.fetchall()
+        ]
+
+
+def partition_table(connection: BaseDatabaseWrapper) -> None:
+    """
+    Turns the plain table into a partitioned one, with partitions from the
+    year of the first entry up to `SK_PARTITION_YEARS_AHEAD` years ahead.
+    """
+    indexes, constraints = _schema(connection)
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT MIN(day) FROM {TABLE}")
+        first_day = cursor.fetchone()[0] or timezone.now().date()
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {TABLE}_plain")
+        cursor.execute(
+            f"CREATE TABLE {TABLE} (LIKE {TABLE}_plain INCLUDING DEFAULTS "
+            f"INCLUDING IDENTITY) PARTITION BY RANGE (day)"
+        )
+        cursor.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT")
+        last_year = timezone.now().year + settings.SK_PARTITION_YEARS_AHEAD
+        for year in range(first_day.year, last_year + 1):
+            create_partition(connection, year)
+        _move_rows(cursor, f"{TABLE}_plain")
+        cursor.execute(f"ALTER TABLE {TABLE} ADD PRIMARY KEY (id, day)")
+    _restore_schema(connection, indexes, constraints)
+
+
+def unpartition_table(connection: BaseDatabaseWrapper) -> None:
+    """
+    Turns the partitioned table back into a plain one.
+    """
+    indexes, constraints = _schema(connection)
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {TABLE}_partitioned")
+        cursor.execute(
+            f"CREATE TABLE {TABLE} (LIKE {TABLE}_partitioned INCLUDING DEFAULTS "
+            f"INCLUDING IDENTITY)"
+        )
+        _move_rows(cursor, f"{TABLE}_partitioned")
+        cursor.execute(f"ALTER TABLE {TABLE} ADD PRIMARY KEY (id)")
+    _restore_schema(connection, indexes, constraints)
+
+
+def create_partition(connection: BaseDatabaseWrapper, year: int) -> bool:
+    """
+    Creates the partition of a year, unless it exists. Entries of the year
+    that went to the default partition are moved into it.
+    """
+    name = partition_name(year)
+    bounds = [date(year, 1, 1), date(year + 1, 1, 1)]
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [name])
+        if cursor.fetchone()[0]:
+            return False
+        cursor.execute(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS)")
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+            f"WHERE day >= %s AND day < %s RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved",
+            bounds,
+        )
+        cursor.execute(
+            f"ALTER TABLE {TABLE} ATTACH PARTITION {name} "
+            f"FOR VALUES FROM (%s) TO (%s)",
+            bounds,
+        )
+    return True
+
+
+def vacuum_partition(connection: BaseDatabaseWrapper, year: int) -> None:
+    """
+    Must run outside of a transaction.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"VACUUM (ANALYZE) {partition_name(year)}")
+
+
+def detach_partition(connection: BaseDatabaseWrapper, year: int) -> None:
+    """
+    Detaches the partition of a year. It stays a table of its own, which can be
+    dumped and dropped; its entries disappear from the app.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {partition_name(year)}")
+
+
+def _move_rows(cursor: typing.Any, source: str) -> None:
+    cursor.execute(f"INSERT INTO {TABLE} SELECT * FROM {source}")
+    sequence = _serial_sequence(cursor, source)
+    if sequence:
+        # The copied default still uses it, the drop would fail otherwise
+        cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {TABLE}.id")
+    cursor.execute(f"DROP TABLE {source}")
+    cursor.execute(
+        f"SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+        f"COALESCE((SELECT MAX(id) FROM {TABLE}), 0) + 1, false)",
+        [TABLE],
+    )
+
+
+def _serial_sequence(cursor: typing.Any, table: str) -> typing.Optional[str]:
+    """
+    Returns the sequence of a serial id, as created before Django 4.1, or
+    None for an identity column, whose sequence is copied with the table.
+    """
+    cursor.execute(
+        "SELECT attidentity, pg_get_serial_sequence(%s, 'id') FROM pg_attribute "
+        "WHERE attrelid = to_regclass(%s) AND attname = 'id'",
+        [table, table],
+    )
+    identity, sequence = cursor.fetchone()
+    return None if identity else sequence
+
+
+def _schema(
+    connection: BaseDatabaseWrapper,
+) -> typing.Tuple[typing.List[str], typing.List[typing.Tuple[str, str]]]:
+    """
+    Returns the definitions of the indexes and of the constraints (except the
+    primary key), which are recreated on the new table.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = to_regclass(%s) AND contype <> 'p' ORDER BY conname",
+            [TABLE],
+        )
+        constraints = cursor.fetchall()
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = %s "
+            "AND indexname NOT IN (SELECT conname FROM pg_constraint "
+            "WHERE conrelid = to_regclass(%s)) ORDER BY indexname",
+            [TABLE, TABLE],
+        )
+        indexes = [row[0] for row in cursor.fetchall()]
+    return indexes, constraints
+
+
+def _restore_schema(
+    connection: BaseDatabaseWrapper,
+    indexes: typing.List[str],
+    constraints: typing.List[typing.Tuple[str, str]],
+) -> None:
+    with connection.cursor() as cursor:
+        for name, definition in constraints:
+            cursor.execute(
+                f"ALTER TABLE {TABLE} ADD CONSTRAINT "
+                f"{connection.ops.quote_name(name)} {definition}"
+            )
+        for definition in indexes:
+            cursor.execute(definition)
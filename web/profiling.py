@@ -0,0 +1,169 @@
+"""
+Profiling of single requests (`PROFILE_*` settings).
+
+A request is profiled if it is sampled (`PROFILE_SAMPLE_RATE`), sends the
+`X-Profile-Token` header with `PROFILE_TOKEN` or comes from a logged-in user in
+`PROFILE_USERS`. With the pyinstrument package, a sampling profiler writes a
+speedscope profile, otherwise cProfile writes a pstats file. The newest
+`PROFILE_MAX_FILES` profiles are kept in `PROFILE_DIR` and listed in the admin.
+"""
+
+import cProfile
+import logging
+import random
+import time
+import typing
+import uuid
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import sync_and_async_middleware
+
+from web.models import RequestProfile
+
+try:
+    from pyinstrument import Profiler
+    from pyinstrument.renderers import SpeedscopeRenderer
+except ImportError:
+    Profiler = None
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Profile-Token"
+SUFFIXES = (".speedscope.json", ".pstats")
+
+
+def _trigger(request: HttpRequest, user) -> typing.Optional[str]:
+    """
+    `user` is only looked up with `PROFILE_USERS`, None otherwise.
+    """
+    token = request.headers.get(PROFILE_HEADER)
+    if settings.PROFILE_TOKEN and token:
+        if constant_time_compare(token, settings.PROFILE_TOKEN):
+            return "header"
+    if user is not None and user.get_username() in settings.PROFILE_USERS:
+        return "user"
+    if random.random() < settings.PROFILE_SAMPLE_RATE:
+        return "sample"
+    return None
+
+
+class _Profile:
+    def __init__(self, is_async: bool):
+        if Profiler:
+            # Follows the awaits of the request instead of the event loop
+            self.profiler = Profiler(async_mode="enabled" if is_async else "disabled")
+        else:
+            self.profiler = cProfile.Profile()
+
+    def start(self) -> bool:
+        try:
+            if Profiler:
+                self.profiler.start()
+            else:
+                self.profiler.enable()
+        except ValueError:
+            # cProfile on Python 3.12+ profiles one thread at a time
+            logger.debug("Another request is being profiled")
+            return False
+        self.start_time = time.perf_counter()
+        return True
+
+    def stop(self) -> float:
+        if Profiler:
+            self.profiler.stop()
+        else:
+            self.profiler.disable()
+        return (time.perf_counter() - self.start_time) * 1000
+
+    @property
+    def suffix(self) -> str:
+        return SUFFIXES[0] if Profiler else SUFFIXES[1]
+
+    def write(self, path: Path) -> None:
+        if Profiler:
+            path.write_text(self.profiler.output(SpeedscopeRenderer()))
+        else:
+            self.profiler.dump_stats(path)
+
+
+def _save(
+    request: HttpRequest,
+    response: HttpResponse,
+    profile: _Profile,
+    trigger: str,
+    duration_ms: float,
+) -> None:
+    directory = Path(settings.PROFILE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    name = f"{timezone.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}{profile.suffix}"
+    # The API views set the user of their authentication on the request
+    user = getattr(request, "user", None)
+    # The row comes first, so the rotation of another process keeps the file
+    RequestProfile.objects.create(
+        method=request.method,
+        path=request.get_full_path()[:512],
+        user_id=user.pk if user and user.is_authenticated else None,
+        status=response.status_code,
+        duration_ms=duration_ms,
+        trigger=trigger,
+        file_name=name,
+    )
+    profile.write(directory / name)
+    _rotate(directory)
+
+
+def _rotate(directory: Path) -> None:
+    """
+    Deletes the oldest profiles, their files are removed by a signal, and
+    files without a profile.
+    """
+    stale = list(
+        RequestProfile.objects.values_list("pk", flat=True)[
+            settings.PROFILE_MAX_FILES :
+        ]
+    )
+    if stale:
+        RequestProfile.objects.filter(pk__in=stale).delete()
+    kept = set(RequestProfile.objects.values_list("file_name", flat=True))
+    for path in directory.iterdir():
+        if path.name.endswith(SUFFIXES) and path.name not in kept:
+            path.unlink(missing_ok=True)
+
+
+@sync_and_async_middleware
+def profile_middleware(get_response: typing.Callable) -> typing.Callable:
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            user = await request.auser() if settings.PROFILE_USERS else None
+            trigger = _trigger(request, user)
+            profile = _Profile(is_async=True) if trigger else None
+            if not profile or not profile.start():
+                return await get_response(request)
+            try:
+                response = await get_response(request)
+            finally:
+                duration_ms = profile.stop()
+            await sync_to_async(_save)(request, response, profile, trigger, duration_ms)
+            return response
+
+        return middleware
+
+    def middleware(request):
+        trigger = _trigger(request, request.user if settings.PROFILE_USERS else None)
+        profile = _Profile(is_async=False) if trigger else None
+        if not profile or not profile.start():
+            return get_response(request)
+        try:
+            response = get_response(request)
+        finally:
+            duration_ms = profile.stop()
+        _save(request, response, profile, trigger, duration_ms)
+        return response
+
+    return middleware
@@ -5,3 +5,5 @@
 QP_SEARCH_TERM = "search_term"
 QP_PAGE = "page"
 QP_PERIOD = "period"
+QP_YEAR = "year"
+QP_LIMIT = "limit"
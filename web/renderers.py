@@ -0,0 +1,27 @@
+"""
+`FAST_JSON` renderer, requires the `orjson` package.
+"""
+
+import orjson
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    `JSONRenderer` on orjson, which formats dates and dataclasses natively.
+    Pretty printed responses (`indent`) are rendered by `JSONRenderer`.
+    """
+
+    _default = encoders.JSONEncoder().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None) -> bytes:
+        if data is None:
+            return b""
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        return orjson.dumps(
+            data,
+            default=self._default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z,
+        )
@@ -6,6 +6,7 @@
     BarChartResponse,
     ExportData,
     GraphTimeRanges,
+    HeatmapResponse,
     MoodTable,
     PieChartResponse,
     ScatterGraphDataPointY,
@@ -44,10 +45,26 @@ class Meta:
         dataclass = GraphTimeRanges
 
 
+def _entry(entry: WeekdayEntry) -> dict:
+    return {
+        "day": entry.day,
+        "mood_day": entry.mood_day,
+        "mood_night": entry.mood_night,
+    }
+
+
 class CalendarSerializer(DataclassSerializer):
     class Meta:
         dataclass = SkCalendar
 
+    def to_representation(self, instance: SkCalendar) -> dict:
+        # Hand-written for the thousands of entries, the renderers format dates
+        return {
+            "first_day": instance.first_day,
+            "last_day": instance.last_day,
+            "entries": [_entry(entry) for entry in instance.entries],
+        }
+
 
 class GraphDataPointYSerializer(DataclassSerializer):
     class Meta:
@@ -58,6 +75,12 @@ class ScatterGraphResponseSerializer(DataclassSerializer):
     class Meta:
         dataclass = ScatterGraphResponse
 
+    def to_representation(self, instance: ScatterGraphResponse) -> dict:
+        return {
+            "x": instance.x,
+            "y": {"day": instance.y.day, "night": instance.y.night},
+        }
+
 
 class PieChartResponseSerializer(DataclassSerializer):
     class Meta:
@@ -69,12 +92,28 @@ class Meta:
         dataclass = BarChartResponse
 
 
+class HeatmapResponseSerializer(DataclassSerializer):
+    class Meta:
+        dataclass = HeatmapResponse
+
+
 class MoodTableSerializer(DataclassSerializer):
     week = WeekSerializer()
 
     class Meta:
         dataclass = MoodTable
 
+    def to_representation(self, instance: MoodTable) -> dict:
+        return {
+            "week": {
+                "week_date": instance.week.week_date,
+                "note": instance.week.note,
+            },
+            "days_of_week": [_entry(entry) for entry in instance.days_of_week],
+            "next_week": instance.next_week,
+            "prev_week": instance.prev_week,
+        }
+
 
 class StandoutDataSerializer(DataclassSerializer):
     entry = WeekdayEntrySerializer()
@@ -88,3 +127,24 @@ class ExportDataSerializer(DataclassSerializer):
 
     class Meta:
         dataclass = ExportData
+
+    def to_representation(self, instance: ExportData) -> dict:
+        return {
+            "weeks": list(instance.weeks.values("week_date", "note")),
+            "entries": CalendarSerializer().to_representation(instance.entries),
+            "moods": {str(mood): name for mood, name in instance.moods.items()},
+        }
+
+
+class SignedTokensSerializer(serializers.Serializer):
+    access = serializers.CharField(read_only=True)
+    refresh = serializers.CharField(read_only=True)
+    expires_in = serializers.IntegerField(read_only=True)
+
+
+class RefreshTokenSerializer(serializers.Serializer):
+    refresh = serializers.CharField()
+
+
+class RevokeTokenSerializer(serializers.Serializer):
+    token = serializers.CharField()
@@ -1,12 +1,15 @@
+import logging
 from datetime import date
 
 from django.contrib.auth.models import User
-from django.db.models import Avg
 from django.utils.translation import gettext_lazy as _
 
-from web.service.base_graph import BaseGraph
+from web.db_router import replica_reads
+from web.service.base_graph import PERIOD_DAY, PERIOD_NIGHT, BaseGraph
 from web.structs import BarChartResponse
 
+logger = logging.getLogger(__name__)
+
 
 class BarGraphService(BaseGraph):
     def __init__(self, user: User, mood_mapping: dict, start_dt: date, end_dt: date):
@@ -14,12 +17,21 @@ def __init__(self, user: User, mood_mapping: dict, start_dt: date, end_dt: date)
         self.user = user
         self.mood_mapping = mood_mapping
 
+    @replica_reads
     def load_data(self) -> BarChartResponse:
-        qs = self.date_range_qs().aggregate(Avg("mood_day"), Avg("mood_night"))
+        averages = self.store.averages(self.user, *self.date_range())
+        return self._build(averages)
+
+    @replica_reads
+    async def aload_data(self) -> BarChartResponse:
+        averages = await self.store.aaverages(self.user, *self.date_range())
+        return self._build(averages)
+
+    def _build(self, averages: dict) -> BarChartResponse:
         labels = [str(_(x)) for x in ["day", "night"]]
         ret = BarChartResponse(
             labels=labels,
-            values=[qs["mood_day__avg"], qs["mood_night__avg"]],
+            values=[averages[PERIOD_DAY], averages[PERIOD_NIGHT]],
         )
-        print(ret)
+        logger.debug("Bar chart: %s", ret)
         return ret
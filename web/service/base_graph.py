@@ -1,14 +1,10 @@
+import typing
 from abc import ABC
-from datetime import date
+from datetime import date, timedelta
 
-from django.db.models import QuerySet
 from django.utils import timezone
 
-from web.models import Entry
-
-PERIOD_DAY = "mood_day"
-PERIOD_NIGHT = "mood_night"
-PERIODS = [PERIOD_DAY, PERIOD_NIGHT]
+from web.storage import PERIOD_DAY, PERIOD_NIGHT, PERIODS, get_store  # noqa: F401
 
 
 class BaseGraph(ABC):
@@ -16,19 +12,25 @@ def __init__(self, start_dt: date, end_dt: date, **kwargs: dict):
         self.user = None
         self.start_dt = start_dt
         self.end_dt = end_dt
+        self.store = get_store()
 
     def build_day_range(self, start_dt: date, end_dt: date) -> int:
         if start_dt:
             return (end_dt - start_dt).days
         else:
-            entry = Entry.objects.filter(user=self.user).first()
-            days = (entry.day - timezone.now().date()).days
+            first_day, last_day = self.store.bounds(self.user)
+            days = (first_day - timezone.now().date()).days
             return abs(days)
 
-    def date_range_qs(self) -> QuerySet:
-        qs = Entry.objects.filter(user=self.user)
-        if self.start_dt:
-            qs = qs.filter(day__gte=self.start_dt)
-        if self.end_dt:
-            qs = qs.filter(day__lte=self.end_dt)
-        return qs
+    async def abuild_day_range(self, start_dt: date, end_dt: date) -> int:
+        if start_dt:
+            return (end_dt - start_dt).days
+        first_day, last_day = await self.store.abounds(self.user)
+        return abs((first_day - timezone.now().date()).days)
+
+    def date_range(self) -> typing.Tuple[typing.Optional[date], typing.Optional[date]]:
+        """
+        Returns the graph dates as the half-open range of the mood store.
+        """
+        last_day = self.end_dt + timedelta(days=1) if self.end_dt else None
+        return self.start_dt, last_day
@@ -0,0 +1,69 @@
+import typing
+
+from django.contrib.auth.models import User
+
+from web.db_router import replica_reads
+from web.service.base_graph import BaseGraph
+from web.storage import GRID_MONTH, GRID_WEEK, GRID_WEEKDAY
+from web.structs import HeatmapCell, HeatmapResponse
+
+WEEKDAYS = range(1, 8)
+MONTHS = range(1, 13)
+ISO_WEEKS = range(1, 54)
+
+
+class HeatmapService(BaseGraph):
+    """
+    Aggregates the mood history into fixed-size grids, so the size of the
+    response does not depend on how many years a user has tracked.
+    """
+
+    def __init__(self, user: User, year: typing.Optional[int] = None):
+        super().__init__(start_dt=None, end_dt=None)
+        self.user = user
+        self.year = year
+
+    @replica_reads
+    def load_data(self) -> HeatmapResponse:
+        weekday_month = self._grid(
+            self.store.grid(self.user, GRID_WEEKDAY, GRID_MONTH), WEEKDAYS, MONTHS
+        )
+        week_weekday = []
+        if self.year:
+            week_weekday = self._grid(
+                self.store.grid(self.user, GRID_WEEK, GRID_WEEKDAY, self.year),
+                ISO_WEEKS,
+                WEEKDAYS,
+            )
+        return HeatmapResponse(
+            weekday_month=weekday_month, year=self.year, week_weekday=week_weekday
+        )
+
+    def _grid(
+        self,
+        cells: typing.Dict[typing.Tuple[int, int], dict],
+        rows: range,
+        columns: range,
+    ) -> typing.List[HeatmapCell]:
+        """
+        Fills the buckets without any entries with empty cells.
+        """
+        ret = []
+        for row in rows:
+            for column in columns:
+                item = cells.get((row, column), {})
+                ret.append(
+                    HeatmapCell(
+                        row=row,
+                        column=column,
+                        avg_day=self._round(item.get("avg_day")),
+                        avg_night=self._round(item.get("avg_night")),
+                        count_day=item.get("count_day", 0),
+                        count_night=item.get("count_night", 0),
+                    )
+                )
+        return ret
+
+    @staticmethod
+    def _round(value: typing.Optional[float]) -> typing.Optional[float]:
+        return None if value is None else round(value, 2)
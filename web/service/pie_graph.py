@@ -1,9 +1,10 @@
+import typing
 from datetime import date
 
 from django.contrib.auth.models import User
-from django.db.models import Count
 
-from web.service.base_graph import PERIODS, BaseGraph
+from web.db_router import replica_reads
+from web.service.base_graph import BaseGraph
 from web.structs import PieChartResponse
 
 
@@ -13,20 +14,19 @@ def __init__(self, user: User, mood_mapping: dict, start_dt: date, end_dt: date)
         self.user = user
         self.mood_mapping = mood_mapping
 
+    @replica_reads
     def load_data(self, period: str) -> PieChartResponse:
-        if period not in PERIODS:
-            raise ValueError(f"period must be one of {PERIODS}")
-        qs = (
-            self.date_range_qs()
-            .values(period)
-            .annotate(total=Count(period))
-            .order_by("total")
-        )
+        return self._build(self.store.counts(self.user, period, *self.date_range()))
+
+    @replica_reads
+    async def aload_data(self, period: str) -> PieChartResponse:
+        counts = await self.store.acounts(self.user, period, *self.date_range())
+        return self._build(counts)
+
+    def _build(self, counts: typing.Dict[int, int]) -> PieChartResponse:
         labels = []
         values = []
-        for item in qs:
-            if not item[period]:
-                continue
-            labels.append(item[period])
-            values.append(item["total"])
+        for mood, total in sorted(counts.items(), key=lambda item: (item[1], item[0])):
+            labels.append(mood)
+            values.append(total)
         return PieChartResponse(label_numbers=labels, values=values)
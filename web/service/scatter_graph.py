@@ -3,8 +3,9 @@
 
 from django.contrib.auth.models import User
 
+from web.db_router import replica_reads
 from web.service.base_graph import BaseGraph
-from web.structs import ScatterGraphDataPointY, ScatterGraphResponse
+from web.structs import ScatterGraphDataPointY, ScatterGraphResponse, WeekdayEntry
 
 
 class ScatterGraphService(BaseGraph):
@@ -21,17 +22,28 @@ def __init__(
         self.mood_mapping = mood_mapping
         self.user = user
 
+    @replica_reads
     def load_data(self) -> typing.List[ScatterGraphResponse]:
         """
         Loads data from the last seven days if no dates are provided
         """
-        data = {}
         day_count = self.build_day_range(self.start_dt, self.end_dt)
+        return self._build(day_count, self.store.entries(self.user, *self.date_range()))
+
+    @replica_reads
+    async def aload_data(self) -> typing.List[ScatterGraphResponse]:
+        day_count = await self.abuild_day_range(self.start_dt, self.end_dt)
+        entries = await self.store.aentries(self.user, *self.date_range())
+        return self._build(day_count, entries)
+
+    def _build(
+        self, day_count: int, entries: typing.Iterable[WeekdayEntry]
+    ) -> typing.List[ScatterGraphResponse]:
+        data = {}
         days = [(self.start_dt + timedelta(days=d)) for d in range(day_count)]
         for day in days:
             data[day] = ScatterGraphDataPointY(day=0, night=0)
-        entries = self.date_range_qs()
-        for entry in entries.iterator():
+        for entry in entries:
             data[entry.day] = ScatterGraphDataPointY(
                 day=entry.mood_day, night=entry.mood_night
             )
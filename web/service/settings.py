@@ -1,10 +1,12 @@
 import typing
 
 from django.contrib.auth.models import User
-from django.http import QueryDict
+from django.db.models import F
+from django.http import HttpRequest, QueryDict
 
 from web.models import Moods, UserMoodColorSettings, UserSettings
 from web.mood_colors import DEFAULT_COLORS
+from web.sharding import user_atomic
 
 
 class SettingsService:
@@ -14,38 +16,57 @@ def __init__(
     ):
         self._user = user
         self._obj = UserSettings.objects.get(user=self._user)
+        self._colors = None
 
+    @user_atomic
     def save_user_colors_settings(self, colors=None) -> None:
         """
         Sets a color to each mood.
         """
         if colors is None:
             colors = dict()
-        for mood in Moods:
-            if f"mood-{mood}" in colors:
-                color = colors.get(f"mood-{mood}")
-            else:
-                color = DEFAULT_COLORS.get(mood)
-            UserMoodColorSettings.objects.update_or_create(
-                user=self._user,
-                mood=mood,
-                defaults={"color": color},
-            )
+        self._colors = None
+        objs = self.user_colors_settings()
+        for obj in objs:
+            obj.color = colors.get(f"mood-{obj.mood}", DEFAULT_COLORS.get(obj.mood))
+        UserMoodColorSettings.objects.bulk_update(objs, ["color"])
+        UserSettings.objects.filter(pk=self._obj.pk).update(
+            data_version=F("data_version") + 1
+        )
+        self._obj.refresh_from_db(fields=["data_version"])
+        self._colors = None
 
     def user_colors_settings(self) -> typing.List[UserMoodColorSettings]:
         """
         Returns the color for each mood.
         :return:
         """
-        colors = []
-        for mood in Moods:
-            obj, created = UserMoodColorSettings.objects.get_or_create(
-                user=self._user,
-                mood=mood,
-                defaults={"color": DEFAULT_COLORS.get(mood)},
-            )
-            colors.append(obj)
-        return colors
+        if self._colors is None:
+            # One query for all moods, the missing colors are added at once
+            colors = {
+                obj.mood: obj
+                for obj in UserMoodColorSettings.objects.filter(
+                    user=self._user
+                ).order_by("-pk")
+            }
+            missing = [
+                UserMoodColorSettings(
+                    user=self._user, mood=mood, color=DEFAULT_COLORS.get(mood)
+                )
+                for mood in Moods
+                if mood not in colors
+            ]
+            if missing:
+                UserMoodColorSettings.objects.bulk_create(missing)
+                colors.update((obj.mood, obj) for obj in missing)
+            self._colors = [colors[mood] for mood in Moods]
+        return self._colors
+
+    def user_colors(self) -> typing.Dict[int, str]:
+        """
+        Returns a mapping of mood to color.
+        """
+        return {obj.mood: obj.color for obj in self.user_colors_settings()}
 
     def user_settings(self) -> UserSettings:
         return self._obj
@@ -74,3 +95,13 @@ def is_use_js_btn(self):
     def set_use_js_btn(self, enabled):
         self._obj.use_js_btn = enabled
         self._obj.save()
+
+
+def settings_service(request: HttpRequest) -> SettingsService:
+    """
+    Returns the SettingsService of the request user. It is created once per
+    request and shared by the view and the context processors.
+    """
+    if not hasattr(request, "_sk_settings_service"):
+        request._sk_settings_service = SettingsService(request.user)
+    return request._sk_settings_service
@@ -1,15 +1,21 @@
 import typing
+from dataclasses import replace
 from datetime import date, datetime, timedelta
 from enum import Enum
 
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.db.models import Q, QuerySet
+from django.db.models import F, QuerySet
 from django.utils import timezone
 from django.utils.translation import gettext as _
 
-from web.models import Entry, Moods, Week
+from web import events, metrics
+from web.db_router import pin_to_primary, replica_alias, replica_reads
+from web.models import Moods, UserSettings, Week
 from web.service.base_graph import PERIOD_DAY, PERIOD_NIGHT
+from web.service.streaks import StreakService
+from web.sharding import user_atomic
+from web.storage import get_store
 from web.structs import (
     ExportData,
     GeneralStats,
@@ -40,6 +46,7 @@ def __init__(
         user: User,
     ):
         self._user = user
+        self._store = get_store()
         self.mood_mapping = {
             1: _("very_bad"),
             2: _("bad"),
@@ -48,28 +55,24 @@ def __init__(
             5: _("very_good"),
         }
 
+    @replica_reads
     def export(self) -> ExportData:
-        weeks = Week.objects.filter(user=self._user)
+        weeks = Week.objects.using(replica_alias()).filter(user=self._user)
         return ExportData(entries=self.calendar(), moods=self.mood_mapping, weeks=weeks)
 
     def general_stats(self) -> GeneralStats:
-        qs = Entry.objects.filter(user=self._user)
-        day_count = qs.exclude(mood_day__isnull=True).count()
-        night_count = qs.exclude(mood_night__isnull=True).count()
+        day_count = sum(self._store.counts(self._user, PERIOD_DAY).values())
+        night_count = sum(self._store.counts(self._user, PERIOD_NIGHT).values())
         gs = GeneralStats(day_count=day_count, night_count=night_count)
         return gs
 
+    @replica_reads
     def calendar(self) -> SkCalendar:
-        qs = Entry.objects.filter(user=self._user).order_by("-day")
-        try:
-            first_day = qs.last().day + timedelta(days=-1)
-            last_day = qs.first().day + timedelta(days=1)
-        except AttributeError:
-            return SkCalendar(
-                first_day=timezone.now().date(),
-                last_day=timezone.now().date(),
-                entries=[],
-            )
+        first_day, last_day = self._store.bounds(self._user)
+        if first_day is None:
+            return self._empty_calendar()
+        first_day += timedelta(days=-1)
+        last_day += timedelta(days=1)
         entries = self._entries_range(first_day, last_day)
         data = SkCalendar(
             first_day=first_day,
@@ -78,21 +81,68 @@ def calendar(self) -> SkCalendar:
         )
         return data
 
+    @replica_reads
+    async def acalendar(self) -> SkCalendar:
+        first_day, last_day = await self._store.abounds(self._user)
+        if first_day is None:
+            return self._empty_calendar()
+        first_day += timedelta(days=-1)
+        last_day += timedelta(days=1)
+        entries = await self._aentries_range(first_day, last_day)
+        return SkCalendar(
+            first_day=first_day,
+            last_day=last_day,
+            entries=entries,
+        )
+
+    @replica_reads
     def search(
         self,
         search_term: str = "",
         start_dt: str = "",
         end_dt: str = "",
         mood: str = "",
-    ) -> QuerySet:
-        qs = Week.objects.filter(user=self._user).order_by("-week_date")
-        qs = self._filter_search(qs, search_term)
-        qs = self._filter_date(qs, start_dt, end_dt)
-        qs = self._filter_mood(qs, mood)
+    ) -> typing.List[Week]:
+        """
+        Weeks with a matching note or mood, newest first. Weeks with moods but
+        without a `Week` row are returned unsaved, with an empty note.
+        """
+        first_week, last_week = self._search_range(start_dt, end_dt)
+        qs = self._search_qs(search_term, first_week, last_week)
+        mood = self._search_mood(mood)
+        if search_term.strip() and mood is None:
+            return list(qs)
+        mood_weeks = self._store.weeks_with_moods(
+            self._user, first_week, last_week + timedelta(days=7), mood
+        )
+        return self._search_results(
+            list(qs), mood_weeks, first_week, last_week, search_term, mood
+        )
 
-        # Exclude future weeks
-        qs = qs.exclude(week_date__gt=timezone.now())
-        return qs
+    @replica_reads
+    async def asearch(
+        self,
+        search_term: str = "",
+        start_dt: str = "",
+        end_dt: str = "",
+        mood: str = "",
+    ) -> typing.List[Week]:
+        first_week, last_week = self._search_range(start_dt, end_dt)
+        qs = self._search_qs(search_term, first_week, last_week)
+        mood = self._search_mood(mood)
+        if search_term.strip() and mood is None:
+            return [week async for week in qs]
+        mood_weeks = await self._store.aweeks_with_moods(
+            self._user, first_week, last_week + timedelta(days=7), mood
+        )
+        return self._search_results(
+            [week async for week in qs],
+            mood_weeks,
+            first_week,
+            last_week,
+            search_term,
+            mood,
+        )
 
     def mood_table(self, start_day_p: str) -> MoodTable:
         week_start = self._week_start(start_day_p)
@@ -108,6 +158,18 @@ def mood_table(self, start_day_p: str) -> MoodTable:
             prev_week=prev_week,
         )
 
+    async def amood_table(self, start_day_p: str) -> MoodTable:
+        week_start = self._week_start(start_day_p)
+        return MoodTable(
+            days_of_week=await self._aentries_range(
+                week_start, week_start + timedelta(days=7)
+            ),
+            week=await self._aweek(week_start),
+            next_week=self._next_week(week_start),
+            prev_week=self._prev_week(week_start),
+        )
+
+    @user_atomic
     def save_note(self, week: str, note: str) -> Week:
         """
         :param week: Week in format YYYY-MM-DD, eg: 2022-04-18
@@ -125,8 +187,17 @@ def save_note(self, week: str, note: str) -> Week:
                 "user": self._user,
             },
         )
+        self._bump_data_version()
+        pin_to_primary(self._user)
+        metrics.count_write("note")
+        events.publish(
+            self._user,
+            events.EVENT_NOTE,
+            {"week_date": week_date.strftime(settings.SK_DATE_FORMAT), "note": note},
+        )
         return Week(note=note, week_date=week_date)
 
+    @user_atomic
     def save_entry(self, period: str, mood: int, day: str) -> WeekdayEntry:
         """Set or remove a mood"""
 
@@ -135,44 +206,45 @@ def save_entry(self, period: str, mood: int, day: str) -> WeekdayEntry:
             "day": PERIOD_DAY,
         }
 
-        # Create related week object
-        dt1 = datetime.strptime(day, settings.SK_DATE_FORMAT)
-        dt1 += timedelta(days=0 - dt1.weekday())
-        my_week, created = Week.objects.get_or_create(user=self._user, week_date=dt1)
-
-        db_data = {"day": day, "user": self._user, "week": my_week}
-        if period == "night":
-            db_data[PERIOD_NIGHT] = mood
-        elif period == "day":
-            db_data[PERIOD_DAY] = mood
-        else:
+        if period not in form_mapping:
+            raise MoodEntryError()
+        # Moods are still strings if they were just taken from a request
+        try:
+            mood = int(mood)
+        except (TypeError, ValueError):
+            raise MoodEntryError()
+        if mood not in Moods:
             raise MoodEntryError()
 
-        if Entry.objects.filter(**db_data).count() == 1:
+        ret = self._store.get(
+            self._user, datetime.strptime(day, settings.SK_DATE_FORMAT).date()
+        )
+        if getattr(ret, form_mapping[period]) == mood:
             # Click on saved mood: remove it
-            Entry.objects.filter(**db_data).update(**{form_mapping[period]: None})
-            db_data.pop("mood_night", None)
-            db_data.pop("mood_day", None)
-            obj = Entry.objects.get(**db_data)
-        else:
-            obj, created = Entry.objects.update_or_create(
-                day=day, week=my_week, user=self._user, defaults=db_data
-            )
-
-        return WeekdayEntry(
-            day=obj.day, mood_day=obj.mood_day, mood_night=obj.mood_night
+            mood = None
+        ret = replace(ret, **{form_mapping[period]: mood})
+        self._store.save(self._user, ret)
+
+        StreakService(self._user).update(ret)
+        self._bump_data_version()
+        pin_to_primary(self._user)
+        metrics.count_write("mood")
+        events.publish(
+            self._user,
+            events.EVENT_ENTRY,
+            {"day": day, "mood_day": ret.mood_day, "mood_night": ret.mood_night},
         )
+        return ret
 
     def standout_data(self) -> typing.List[StandoutData]:
         ret = []
-        qs = Entry.objects.filter(user=self._user)
 
         # very good day
         ret.append(
             StandoutData(
                 label="last_very_good_day",
                 css_class="standout-data-good",
-                entry=(qs.filter(mood_day=Moods.VERY_GOOD).order_by("-id").first()),
+                entry=self._store.latest(self._user, PERIOD_DAY, Moods.VERY_GOOD),
             )
         )
 
@@ -181,7 +253,7 @@ def standout_data(self) -> typing.List[StandoutData]:
             StandoutData(
                 label="last_very_good_night",
                 css_class="standout-data-good",
-                entry=(qs.filter(mood_night=Moods.VERY_GOOD).order_by("-id").first()),
+                entry=self._store.latest(self._user, PERIOD_NIGHT, Moods.VERY_GOOD),
             )
         )
 
@@ -190,7 +262,7 @@ def standout_data(self) -> typing.List[StandoutData]:
             StandoutData(
                 label="last_very_bad_day",
                 css_class="standout-data-bad",
-                entry=(qs.filter(mood_day=Moods.VERY_BAD).order_by("-id").first()),
+                entry=self._store.latest(self._user, PERIOD_DAY, Moods.VERY_BAD),
             )
         )
 
@@ -199,14 +271,20 @@ def standout_data(self) -> typing.List[StandoutData]:
             StandoutData(
                 label="last_very_bad_night",
                 css_class="standout-data-bad",
-                entry=(qs.filter(mood_night=Moods.VERY_BAD).order_by("-id").first()),
+                entry=self._store.latest(self._user, PERIOD_NIGHT, Moods.VERY_BAD),
             )
         )
         return ret
 
     def graph_time_ranges(self) -> GraphTimeRanges:
+        return self._graph_time_ranges(self._first_day())
+
+    async def agraph_time_ranges(self) -> GraphTimeRanges:
+        return self._graph_time_ranges(await self._afirst_day())
+
+    def _graph_time_ranges(self, first_day: str) -> GraphTimeRanges:
         return GraphTimeRanges(
-            first_day=self._first_day(),
+            first_day=first_day,
             last_week_start_dt=(timezone.now() + timedelta(days=-7)).strftime(
                 "%Y-%m-%d"
             ),
@@ -220,10 +298,15 @@ def graph_time_ranges(self) -> GraphTimeRanges:
 
     def _first_day(self) -> str:
         """Returns the date of the first mood entry. If the user has no entries, returns today's date"""
-        qs = Entry.objects.filter(user=self._user).order_by("day")
-        if qs.count() > 0:
-            obj = qs.first()
-            return obj.day.strftime("%Y-%m-%d")
+        first_day, last_day = self._store.bounds(self._user)
+        if first_day:
+            return first_day.strftime("%Y-%m-%d")
+        return timezone.now().strftime("%Y-%m-%d")
+
+    async def _afirst_day(self) -> str:
+        first_day, last_day = await self._store.abounds(self._user)
+        if first_day:
+            return first_day.strftime("%Y-%m-%d")
         return timezone.now().strftime("%Y-%m-%d")
 
     def _week_data(self, first_day: date) -> typing.List[WeekdayEntry]:
@@ -232,12 +315,28 @@ def _week_data(self, first_day: date) -> typing.List[WeekdayEntry]:
         return ret
 
     def _week(self, week_start: date) -> Week:
+        """
+        Returns the week with its note. Weeks are only stored once a note
+        has been saved, otherwise an unsaved one is returned.
+        """
         # Make sure we use the start of the week
         week_start += timedelta(days=0 - week_start.weekday())
-        my_week, created = Week.objects.get_or_create(
+        my_week = Week.objects.filter(user=self._user, week_date=week_start).first()
+        return my_week or Week(user=self._user, week_date=week_start)
+
+    async def _aweek(self, week_start: date) -> Week:
+        week_start += timedelta(days=0 - week_start.weekday())
+        my_week = await Week.objects.filter(
             user=self._user, week_date=week_start
+        ).afirst()
+        return my_week or Week(user=self._user, week_date=week_start)
+
+    def _empty_calendar(self) -> SkCalendar:
+        return SkCalendar(
+            first_day=timezone.now().date(),
+            last_day=timezone.now().date(),
+            entries=[],
         )
-        return my_week
 
     def _next_week(self, week_start: date) -> str:
         ret = week_start + timedelta(days=0 - week_start.weekday() + 7)
@@ -260,44 +359,79 @@ def _week_start(self, start_day_p: str = "") -> date:
         dt1 += timedelta(days=0 - dt1.weekday())
         return dt1.date()
 
-    def _filter_mood(
-        self,
-        qs: QuerySet,
-        mood_p: str = "",
-    ) -> QuerySet:
-        try:
-            mood = int(mood_p)
-        except ValueError:
-            return qs
-        if mood in Moods:
-            qs = qs.filter(Q(entry__mood_day=mood) | Q(entry__mood_night=mood))
-        return qs
+    def _bump_data_version(self) -> None:
+        UserSettings.objects.filter(user=self._user).update(
+            data_version=F("data_version") + 1
+        )
 
-    def _filter_search(
+    def _search_qs(
         self,
-        qs: QuerySet,
-        search_term: str = "",
+        search_term: str,
+        first_week: typing.Optional[date],
+        last_week: date,
     ) -> QuerySet:
+        qs = Week.objects.using(replica_alias()).filter(
+            user=self._user, week_date__lte=last_week
+        )
+        if first_week:
+            qs = qs.filter(week_date__gte=first_week)
         search_term = search_term.strip()
         if search_term:
             qs = qs.filter(note__icontains=search_term)
         return qs
 
-    def _filter_date(
-        self,
-        qs: QuerySet,
-        start_date: str = "",
-        end_date: str = "",
-    ) -> QuerySet:
+    @staticmethod
+    def _search_range(
+        start_date: str, end_date: str
+    ) -> typing.Tuple[typing.Optional[date], date]:
+        """
+        First and last week date of a search, future weeks are excluded.
+        """
         start = start_date.strip()
         end = end_date.strip()
+        first_week = None
+        last_week = timezone.now().date()
         if start:
-            start_dt = datetime.strptime(start, settings.SK_DATE_FORMAT).date()
-            qs = qs.filter(week_date__gte=start_dt)
+            first_week = datetime.strptime(start, settings.SK_DATE_FORMAT).date()
         if end:
             end_dt = datetime.strptime(end, settings.SK_DATE_FORMAT).date()
-            qs = qs.filter(week_date__lte=end_dt)
-        return qs
+            last_week = min(last_week, end_dt)
+        return first_week, last_week
+
+    @staticmethod
+    def _search_mood(mood_p: str) -> typing.Optional[int]:
+        try:
+            mood = int(mood_p)
+        except ValueError:
+            return None
+        return mood if mood in Moods else None
+
+    def _search_results(
+        self,
+        weeks: typing.List[Week],
+        mood_weeks: typing.Set[date],
+        first_week: typing.Optional[date],
+        last_week: date,
+        search_term: str,
+        mood: typing.Optional[int],
+    ) -> typing.List[Week]:
+        # Moods were read by day, a week may start before the first week
+        mood_weeks = {
+            week_date
+            for week_date in mood_weeks
+            if (not first_week or week_date >= first_week) and week_date <= last_week
+        }
+        by_date = {week.week_date: week for week in weeks}
+        if search_term.strip():
+            week_dates = by_date.keys() & mood_weeks
+        elif mood is not None:
+            week_dates = mood_weeks
+        else:
+            week_dates = by_date.keys() | mood_weeks
+        return [
+            by_date.get(week_date) or Week(user=self._user, week_date=week_date)
+            for week_date in sorted(week_dates, reverse=True)
+        ]
 
     def _entries_range(
         self, first_day: date, last_day: date
@@ -305,14 +439,21 @@ def _entries_range(
         """
         Generates a list of WeekdayEntry objects for a date range. Fills empty days with empty data.
         :param first_day: Uses entries of this day or after
-        :param last_day: Uses entries of this day or before
+        :param last_day: Uses entries before this day
         :return:
         """
-        qs = (
-            Entry.objects.filter(user=self._user)
-            .filter(day__gte=first_day, day__lt=last_day)
-            .order_by("-day")
-        )
+        entries = self._store.entries(self._user, first_day, last_day)
+        return self._fill_entries_range(first_day, last_day, entries)
+
+    async def _aentries_range(
+        self, first_day: date, last_day: date
+    ) -> typing.List[WeekdayEntry]:
+        entries = await self._store.aentries(self._user, first_day, last_day)
+        return self._fill_entries_range(first_day, last_day, entries)
+
+    def _fill_entries_range(
+        self, first_day: date, last_day: date, entries: typing.Iterable[WeekdayEntry]
+    ) -> typing.List[WeekdayEntry]:
         delta = last_day - first_day
         days = [(first_day + timedelta(days=d)) for d in range(delta.days)]
         week_data = {}
@@ -320,7 +461,7 @@ def _entries_range(
             week_data[day.strftime(settings.SK_DATE_FORMAT)] = WeekdayEntry(
                 day=day, mood_day=None, mood_night=None
             )
-        for entry in qs:
+        for entry in entries:
             week_data[entry.day.strftime(settings.SK_DATE_FORMAT)] = WeekdayEntry(
                 day=entry.day, mood_day=entry.mood_day, mood_night=entry.mood_night
             )
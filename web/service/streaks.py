@@ -0,0 +1,140 @@
+import typing
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from web.models import Moods, UserSettings
+from web.storage import get_store
+from web.structs import Streaks, WeekdayEntry
+
+GOOD_MOODS = (Moods.GOOD, Moods.VERY_GOOD)
+
+# Prefixes of the streak fields on UserSettings
+STREAK_TRACKED = "tracked"
+STREAK_GOOD = "good"
+
+
+def is_tracked(entry: WeekdayEntry) -> bool:
+    return bool(entry.mood_day or entry.mood_night)
+
+
+def is_good(entry: WeekdayEntry) -> bool:
+    return entry.mood_day in GOOD_MOODS
+
+
+PREDICATES = {
+    STREAK_TRACKED: is_tracked,
+    STREAK_GOOD: is_good,
+}
+
+
+class StreakService:
+    """
+    Maintains the streak counters stored on `UserSettings`.
+
+    Writing a mood for the latest tracked day (or any later day) is handled in
+    constant time. Only edits of older days require a scan of the history.
+    """
+
+    def __init__(self, user: User, user_settings: typing.Optional[UserSettings] = None):
+        self._user = user
+        self._obj = user_settings or UserSettings.objects.get(user=self._user)
+
+    def streaks(self) -> Streaks:
+        if not self._obj.streaks_valid:
+            self.recompute()
+        today = timezone.now().date()
+        return Streaks(
+            current_tracked=self._current(STREAK_TRACKED, today),
+            longest_tracked=self._obj.longest_tracked_streak,
+            current_good=self._current(STREAK_GOOD, today),
+            longest_good=self._obj.longest_good_streak,
+        )
+
+    def update(self, entry: WeekdayEntry) -> None:
+        """
+        Applies a freshly saved entry to the streak counters.
+        """
+        if not self._obj.streaks_valid:
+            self.recompute()
+            return
+        for prefix, predicate in PREDICATES.items():
+            if not self._advance(prefix, entry.day, predicate(entry)):
+                self.recompute()
+                return
+        self._save()
+
+    def recompute(self) -> None:
+        """
+        Rebuilds all counters from the whole mood history.
+        """
+        state = {
+            prefix: {"streak": 0, "end": None, "longest": 0} for prefix in PREDICATES
+        }
+        for entry in get_store().entries(self._user):
+            day = entry.day
+            for prefix, predicate in PREDICATES.items():
+                if not predicate(entry):
+                    continue
+                run = state[prefix]
+                if run["end"] is not None and run["end"] + timedelta(days=1) == day:
+                    run["streak"] += 1
+                else:
+                    run["streak"] = 1
+                run["end"] = day
+                run["longest"] = max(run["longest"], run["streak"])
+        for prefix, run in state.items():
+            self._set(prefix, run["streak"], run["end"], run["longest"])
+        self._obj.streaks_valid = True
+        self._save()
+
+    def _advance(self, prefix: str, day: date, hit: bool) -> bool:
+        """
+        Tries to update a streak in place. Returns False if the change can only
+        be applied by a recomputation.
+        """
+        streak = getattr(self._obj, f"{prefix}_streak")
+        end = getattr(self._obj, f"{prefix}_streak_end")
+        longest = getattr(self._obj, f"longest_{prefix}_streak")
+
+        if end is None or day > end:
+            if not hit:
+                return True
+            if end is not None and end + timedelta(days=1) == day:
+                streak += 1
+            else:
+                streak = 1
+            self._set(prefix, streak, day, max(longest, streak))
+            return True
+        # Still hitting the last day of the streak: nothing changes
+        return day == end and hit
+
+    def _current(self, prefix: str, today: date) -> int:
+        """
+        A streak is current as long as it ended today or yesterday.
+        """
+        end = getattr(self._obj, f"{prefix}_streak_end")
+        if end is None or end < today - timedelta(days=1):
+            return 0
+        return getattr(self._obj, f"{prefix}_streak")
+
+    def _set(
+        self, prefix: str, streak: int, end: typing.Optional[date], longest: int
+    ) -> None:
+        setattr(self._obj, f"{prefix}_streak", streak)
+        setattr(self._obj, f"{prefix}_streak_end", end)
+        setattr(self._obj, f"longest_{prefix}_streak", longest)
+
+    def _save(self) -> None:
+        self._obj.save(
+            update_fields=[
+                "streaks_valid",
+                "tracked_streak",
+                "tracked_streak_end",
+                "longest_tracked_streak",
+                "good_streak",
+                "good_streak_end",
+                "longest_good_streak",
+            ]
+        )
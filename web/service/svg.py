@@ -0,0 +1,115 @@
+import typing
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.utils.html import escape
+
+from web.db_router import replica_reads
+from web.models import Moods
+from web.storage import PERIOD_DAY, PERIOD_NIGHT, get_store
+
+CELL_SIZE = 11
+CELL_GAP = 2
+EMPTY_COLOR = "#8b949e33"
+
+SPARKLINE_WIDTH = 84
+SPARKLINE_HEIGHT = 24
+SPARKLINE_LINE_COLOR = "#8b949e"
+
+
+class SvgService:
+    """
+    Renders mood overviews as small, self-contained SVG images.
+    """
+
+    def __init__(self, user: User, mood_colors: typing.Dict[int, str]):
+        self._user = user
+        self._colors = {mood: escape(color) for mood, color in mood_colors.items()}
+
+    @replica_reads
+    def year_heatmap(self, year: int, period: str = PERIOD_DAY) -> str:
+        """
+        GitHub-style heatmap: one column per week, one row per weekday.
+        """
+        if period not in (PERIOD_DAY, PERIOD_NIGHT):
+            raise ValueError(f"period must be one of {[PERIOD_DAY, PERIOD_NIGHT]}")
+        first_day = date(year, 1, 1)
+        last_day = date(year, 12, 31)
+        moods = {
+            entry.day: getattr(entry, period)
+            for entry in get_store().entries(
+                self._user, first_day, last_day + timedelta(days=1)
+            )
+        }
+        grid_start = first_day - timedelta(days=first_day.weekday())
+        step = CELL_SIZE + CELL_GAP
+        weeks = (last_day - grid_start).days // 7 + 1
+
+        # Every cell references the same rect, which keeps the image small
+        cells = [
+            f'<defs><rect id="c" width="{CELL_SIZE}" height="{CELL_SIZE}" rx="2"/>'
+            f'</defs><g fill="{EMPTY_COLOR}">'
+        ]
+        day = first_day
+        while day <= last_day:
+            col = (day - grid_start).days // 7
+            row = day.weekday()
+            color = self._colors.get(moods.get(day))
+            fill = f' fill="{color}"' if color else ""
+            cells.append(f'<use href="#c" x="{col * step}" y="{row * step}"{fill}/>')
+            day += timedelta(days=1)
+        cells.append("</g>")
+        return self._svg(weeks * step - CELL_GAP, 7 * step - CELL_GAP, str(year), cells)
+
+    @replica_reads
+    def week_sparkline(self, week_start: date) -> str:
+        """
+        Day and night moods of one week as two small lines.
+        """
+        week_start -= timedelta(days=week_start.weekday())
+        entries = {
+            entry.day: (entry.mood_day, entry.mood_night)
+            for entry in get_store().entries(
+                self._user, week_start, week_start + timedelta(days=7)
+            )
+        }
+        step_x = (SPARKLINE_WIDTH - 4) / 6
+        step_y = (SPARKLINE_HEIGHT - 4) / (len(Moods) - 1)
+
+        elements = []
+        for idx, dash in ((0, ""), (1, ' stroke-dasharray="2 2"')):
+            points = []
+            for offset in range(7):
+                mood = entries.get(week_start + timedelta(days=offset), (None, None))[
+                    idx
+                ]
+                if not mood:
+                    continue
+                x = round(2 + offset * step_x, 1)
+                y = round(SPARKLINE_HEIGHT - 2 - (mood - 1) * step_y, 1)
+                points.append((x, y, mood))
+            if len(points) > 1:
+                path = " ".join(f"{x},{y}" for x, y, _ in points)
+                elements.append(
+                    f'<polyline points="{path}" fill="none" '
+                    f'stroke="{SPARKLINE_LINE_COLOR}" stroke-width="1"{dash}/>'
+                )
+            for x, y, mood in points:
+                elements.append(
+                    f'<circle cx="{x}" cy="{y}" r="2" '
+                    f'fill="{self._colors.get(mood, EMPTY_COLOR)}"/>'
+                )
+        return self._svg(
+            SPARKLINE_WIDTH,
+            SPARKLINE_HEIGHT,
+            week_start.strftime("%Y-%m-%d"),
+            elements,
+        )
+
+    @staticmethod
+    def _svg(width: int, height: int, title: str, elements: typing.List[str]) -> str:
+        return (
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" '
+            f'height="{height}" viewBox="0 0 {width} {height}">'
+            f"<title>{escape(title)}</title>{''.join(elements)}</svg>"
+        )
@@ -0,0 +1,300 @@
+"""
+Per-user shards (`DATABASE_SHARD_URLS`).
+
+The moods, notes and settings of a user (`SHARDED_MODELS`) live on one shard,
+everything else (accounts, sessions, tokens, events) stays in the default
+database. `UserShard` maps users to shards: new users go to the shard of
+their id modulo the number of shards, users that already had data in the
+default database stay there until `rebalance_shards` moves them.
+
+Queries of sharded models are routed by the user of their instance or, for
+querysets, by the user of the current request (`shard_middleware`) or of
+`use_shard`. A copy of the user row (without personal data) is kept on the
+shard, so the foreign keys hold.
+"""
+
+import contextlib
+import contextvars
+import typing
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Model
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from django.utils.decorators import sync_and_async_middleware
+
+from web import metrics
+from web.models import (
+    ArchivedYear,
+    Entry,
+    UserMoodColorSettings,
+    UserSettings,
+    UserShard,
+    Week,
+)
+
+SHARDED_MODELS = [Entry, Week, UserSettings, UserMoodColorSettings, ArchivedYear]
+# Week was called Note in the old migrations
+SHARDED_MODEL_NAMES = {model._meta.model_name for model in SHARDED_MODELS} | {"note"}
+# Apps the sharded models depend on, migrated on every shard
+SHARD_APPS = {"auth", "contenttypes"}
+
+_current_user_id = contextvars.ContextVar("sk_shard_user_id", default=None)
+
+
+class ShardNotSelected(Exception):
+    pass
+
+
+def is_enabled() -> bool:
+    return bool(settings.DATABASE_SHARDS)
+
+
+def locations() -> typing.List[str]:
+    """
+    Returns the databases that can hold user data.
+    """
+    return [DEFAULT_DB_ALIAS, *settings.DATABASE_SHARDS]
+
+
+def target_shard(user_id: int) -> str:
+    return settings.DATABASE_SHARDS[user_id % len(settings.DATABASE_SHARDS)]
+
+
+def _cache_key(user_id: int) -> str:
+    return f"sk-shard-{user_id}"
+
+
+def db_for_user_id(user_id: int) -> str:
+    """
+    Returns the database with the data of a user and assigns a shard to new
+    users.
+    """
+    if not is_enabled():
+        return DEFAULT_DB_ALIAS
+    alias = cache.get(_cache_key(user_id))
+    metrics.cache_lookup("shard", alias is not None)
+    if alias is None:
+        user_shard = UserShard.objects.filter(user_id=user_id).first()
+        if user_shard is None:
+            if (
+                UserSettings.objects.using(DEFAULT_DB_ALIAS)
+                .filter(user_id=user_id)
+                .exists()
+            ):
+                # Data from before sharding was enabled
+                alias = DEFAULT_DB_ALIAS
+            else:
+                alias = target_shard(user_id)
+                _copy_user(user_id, alias)
+            user_shard, created = UserShard.objects.get_or_create(
+                user_id=user_id, defaults={"shard": alias}
+            )
+        alias = user_shard.shard
+        cache.set(_cache_key(user_id), alias, None)
+    return alias
+
+
+def current_shard(user_id: int) -> str:
+    """
+    Returns the database with the data of a user like `db_for_user_id`, but
+    only reads: new users are not assigned to a shard.
+    """
+    if not is_enabled():
+        return DEFAULT_DB_ALIAS
+    alias = (
+        UserShard.objects.filter(user_id=user_id)
+        .values_list("shard", flat=True)
+        .first()
+    )
+    if alias is not None:
+        return alias
+    if UserSettings.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).exists():
+        # Data from before sharding was enabled
+        return DEFAULT_DB_ALIAS
+    return target_shard(user_id)
+
+
+def db_for_user(user: User) -> str:
+    return db_for_user_id(user.pk)
+
+
+@contextlib.contextmanager
+def use_shard(user: User) -> typing.Iterator[None]:
+    """
+    Routes the queries of sharded models to the shard of the user.
+    """
+    token = _current_user_id.set(lambda: user.pk)
+    try:
+        yield
+    finally:
+        _current_user_id.reset(token)
+
+
+def user_atomic(method: typing.Callable) -> typing.Callable:
+    """
+    Runs a service method in a transaction on the shard of its user. The
+    service must hold the user in `_user` or `user`.
+    """
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        user = getattr(self, "_user", None) or getattr(self, "user", None)
+        with use_shard(user), transaction.atomic(using=db_for_user(user)):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+def move_user(user_id: int, target: str) -> bool:
+    """
+    Moves the data of a user to another database. Returns False if it is
+    already there.
+    """
+    source = db_for_user_id(user_id)
+    if source == target:
+        return False
+    with transaction.atomic(using=DEFAULT_DB_ALIAS), transaction.atomic(
+        using=source
+    ), transaction.atomic(using=target):
+        if target != DEFAULT_DB_ALIAS:
+            _copy_user(user_id, target)
+        for model in SHARDED_MODELS:
+            # Leftovers of an interrupted move
+            model.objects.using(target).filter(user_id=user_id).delete()
+            objs = list(model.objects.using(source).filter(user_id=user_id))
+            for obj in objs:
+                obj.pk = None
+            model.objects.using(target).bulk_create(objs, batch_size=500)
+            model.objects.using(source).filter(user_id=user_id).delete()
+        if source != DEFAULT_DB_ALIAS:
+            _delete_user_copy(user_id, source)
+        UserShard.objects.update_or_create(user_id=user_id, defaults={"shard": target})
+    cache.set(_cache_key(user_id), target, None)
+    return True
+
+
+def _copy_user(user_id: int, alias: str) -> None:
+    User.objects.using(alias).bulk_create(
+        [User(pk=user_id, username=str(user_id), password="!")],
+        ignore_conflicts=True,
+    )
+
+
+def _delete_user_copy(user_id: int, alias: str) -> None:
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {connection.ops.quote_name(User._meta.db_table)} "
+            f"WHERE id = %s",
+            [user_id],
+        )
+
+
+def _delete_user_data(user_id: int, alias: str) -> None:
+    with transaction.atomic(using=alias):
+        for model in SHARDED_MODELS:
+            model.objects.using(alias).filter(user_id=user_id).delete()
+        _delete_user_copy(user_id, alias)
+    cache.delete(_cache_key(user_id))
+
+
+@receiver(pre_delete, sender=User)
+def delete_shard_data(
+    sender: typing.Type[Model], instance: User, using: str, **kwargs: dict
+) -> None:
+    if not is_enabled() or using != DEFAULT_DB_ALIAS:
+        return
+    alias = (
+        UserShard.objects.filter(user=instance).values_list("shard", flat=True).first()
+    )
+    if alias and alias != DEFAULT_DB_ALIAS:
+        user_id = instance.pk
+        transaction.on_commit(lambda: _delete_user_data(user_id, alias), using=using)
+
+
+@sync_and_async_middleware
+def shard_middleware(get_response: typing.Callable) -> typing.Callable:
+    """
+    Routes the queries of sharded models to the shard of the request user.
+    The user is looked up lazily, after the token authentication of the
+    API views has run.
+    """
+
+    def user_id(request) -> typing.Optional[int]:
+        return request.user.pk
+
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            token = _current_user_id.set(lambda: user_id(request))
+            try:
+                return await get_response(request)
+            finally:
+                _current_user_id.reset(token)
+
+        return middleware
+
+    def middleware(request):
+        token = _current_user_id.set(lambda: user_id(request))
+        try:
+            return get_response(request)
+        finally:
+            _current_user_id.reset(token)
+
+    return middleware
+
+
+class ShardRouter:
+    def db_for_read(self, model, **hints) -> typing.Optional[str]:
+        return self._db(model, hints, "read")
+
+    def db_for_write(self, model, **hints) -> typing.Optional[str]:
+        return self._db(model, hints, "write")
+
+    def allow_relation(self, obj1, obj2, **hints) -> typing.Optional[bool]:
+        if not is_enabled():
+            return None
+        databases = set(locations())
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(
+        self, db: str, app_label: str, model_name: typing.Optional[str] = None, **hints
+    ) -> typing.Optional[bool]:
+        if db not in settings.DATABASE_SHARDS:
+            return None
+        if app_label in SHARD_APPS:
+            return True
+        if app_label == "web":
+            # Data migrations (model_name None) only touch sharded models
+            return model_name is None or model_name in SHARDED_MODEL_NAMES
+        return False
+
+    @staticmethod
+    def _db(model, hints: dict, action: str) -> typing.Optional[str]:
+        if not is_enabled():
+            return None
+        if model not in SHARDED_MODELS:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get("instance")
+        if isinstance(instance, User):
+            user_id = instance.pk
+        else:
+            user_id = getattr(instance, "user_id", None)
+        if user_id is None and _current_user_id.get() is not None:
+            user_id = _current_user_id.get()()
+        if user_id is not None:
+            return db_for_user_id(user_id)
+        if action == "write":
+            raise ShardNotSelected(
+                f"Write of {model.__name__} without a user, wrap it in use_shard()."
+            )
+        # E.g. the admin, which only sees the data in the default database
+        return DEFAULT_DB_ALIAS
@@ -0,0 +1,24 @@
+"""
+Production profile for SQLite connections, see `SQLITE_TUNING`.
+"""
+
+import typing
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+def apply_pragmas(cursor: typing.Any, pragmas: typing.Dict[str, typing.Any]) -> None:
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+
+
+@receiver(connection_created)
+def configure_sqlite(
+    sender: typing.Any, connection: typing.Any, **kwargs: dict
+) -> None:
+    if connection.vendor != "sqlite" or not settings.SQLITE_TUNING:
+        return
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, settings.SQLITE_PRAGMAS)
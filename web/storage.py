@@ -0,0 +1,608 @@
+"""
+Storage of the moods, see `SK_MOOD_STORAGE`.
+
+`RowMoodStore` keeps one `Entry` row per day. `PackedMoodStore` packs the 14
+moods of a week (day and night, Monday first) into the `moods` column of the
+`Week` row, which takes a seventh of the rows. The services read and write
+moods only through `get_store()`, so they work the same with both.
+
+Date ranges are half-open: `first_day` is included, `last_day` is not.
+"""
+
+import typing
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from datetime import date, timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Avg, Count, Q, QuerySet
+from django.db.models.functions import (
+    ExtractIsoWeekDay,
+    ExtractMonth,
+    ExtractWeek,
+    TruncWeek,
+)
+from django.utils.module_loading import import_string
+
+from web.models import Entry, Week
+from web.structs import WeekdayEntry
+
+PERIOD_DAY = "mood_day"
+PERIOD_NIGHT = "mood_night"
+PERIODS = [PERIOD_DAY, PERIOD_NIGHT]
+
+# Keys of the heatmap grids
+GRID_WEEKDAY = "weekday"
+GRID_MONTH = "month"
+GRID_WEEK = "week"
+
+GRID_KEYS = {
+    GRID_WEEKDAY: date.isoweekday,
+    GRID_MONTH: lambda day: day.month,
+    GRID_WEEK: lambda day: day.isocalendar()[1],
+}
+
+DateRange = typing.Tuple[typing.Optional[date], typing.Optional[date]]
+
+
+class MoodStore(ABC):
+    """
+    The aggregations are computed from `entries()`, stores that can run them
+    in the database override them.
+    """
+
+    @abstractmethod
+    def get(self, user: User, day: date) -> WeekdayEntry:
+        pass
+
+    @abstractmethod
+    def save(self, user: User, entry: WeekdayEntry) -> None:
+        """
+        Stores both moods of a day, None removes a mood.
+        """
+
+    def save_many(self, user: User, entries: typing.List[WeekdayEntry]) -> None:
+        for entry in entries:
+            self.save(user, entry)
+
+    @abstractmethod
+    def delete_range(self, user: User, first_day: date, last_day: date) -> None:
+        pass
+
+    @abstractmethod
+    def entries(
+        self,
+        user: User,
+        first_day: typing.Optional[date] = None,
+        last_day: typing.Optional[date] = None,
+    ) -> typing.List[WeekdayEntry]:
+        """
+        Returns the days with at least one mood, ordered by day.
+        """
+
+    @abstractmethod
+    async def aentries(
+        self,
+        user: User,
+        first_day: typing.Optional[date] = None,
+        last_day: typing.Optional[date] = None,
+    ) -> typing.List[WeekdayEntry]:
+        pass
+
+    @abstractmethod
+    def bounds(self, user: User) -> DateRange:
+        """
+        Returns the first and the last day with a mood.
+        """
+
+    @abstractmethod
+    async def abounds(self, user: User) -> DateRange:
+        pass
+
+    def weeks_with_moods(
+        self,
+        user: User,
+        first_day: typing.Optional[date] = None,
+        last_day: typing.Optional[date] = None,
+        mood: typing.Optional[int] = None,
+    ) -> typing.Set[date]:
+        """
+        Returns the first days of the weeks with the mood, or any mood, on a day.
+        """
+        return self._weeks(self.entries(user, first_day, last_day), mood)
+
+    async def aweeks_with_moods(
+        self,
+        user: User,
+        first_day: typing.Optional[date] = None,
+        last_day: typing.Optional[date] = None,
+        mood: typing.Optional[int] = None,
+    ) -> typing.Set[date]:
+        return self._weeks(await self.aentries(user, first_day, last_day), mood)
+
+    def counts(
+        self,
+        user: User,
+        period: str,
+        first_day: typing.Optional[date] = None,
+        last_day: typing.Optional[date] = None,
+    ) -> typing.Dict[int, int]:
+        return self._counts(self.entries(user, first_day, last_day), period)
+
+    async def acounts(
+        self,
+        user: User,
+        period: str,
+        first_day: typing.Optional[date] = None,
+        last_day: typing.Optional[date] = None,
+    ) -> typing.Dict[int, int]:
+        return self._counts(await self.aentries(user, first_day, last_day), period)
+
+    def averages(
+        self,
+        user: User,
+        first_day: typing.Optional[date] = None,
+        last_day: typing.Optional[date] = None,
+    ) -> typing.Dict[str, typing.Optional[float]]:
+        return self._averages(self.entries(user, first_day, last_day))
+
+    async def aaverages(
+        self,
+        user: User,
+        first_day: typing.Optional[date] = None,
+        last_day: typing.Optional[date] = None,
+    ) -> typing.Dict[str, typing.Optional[float]]:
+        return self._averages(await self.aentries(user, first_day, last_day))
+
+    def latest(
+        self, user: User, period: str, mood: int
+    ) -> typing.Optional[WeekdayEntry]:
+        """
+        Returns the last day with the mood in the period.
+        """
+        for entry in reversed(self.entries(user)):
+            if getattr(entry, period) == mood:
+                return entry
+        return None
+
+    def grid(
+        self,
+        user: User,
+        row: str,
+        column: str,
+        iso_year: typing.Optional[int] = None,
+    ) -> typing.Dict[typing.Tuple[int, int], dict]:
+        """
+        Groups the moods by two of the `GRID_KEYS`. Returns the averages and
+        counts of both periods for every (row, column) with at least one mood.
+        """
+        first_day = last_day = None
+        if iso_year:
+            # The first and last ISO week may reach into the adjacent years
+            first_day = date(iso_year, 1, 1) - timedelta(days=7)
+            last_day = date(iso_year + 1, 1, 1) + timedelta(days=7)
+        return self._grid(
+            self.entries(user, first_day, last_day), row, column, iso_year
+        )
+
+    @staticmethod
+    def _grid(
+        entries: typing.Iterable[WeekdayEntry],
+        row: str,
+        column: str,
+        iso_year: typing.Optional[int] = None,
+    ) -> typing.Dict[typing.Tuple[int, int], dict]:
+        buckets = defaultdict(list)
+        for entry in entries:
+            if iso_year and entry.day.isocalendar()[0] != iso_year:
+                continue
+            key = (GRID_KEYS[row](entry.day), GRID_KEYS[column](entry.day))
+            buckets[key].append(entry)
+        ret = {}
+        for key, entries in buckets.items():
+            item = {}
+            for period, name in ((PERIOD_DAY, "day"), (PERIOD_NIGHT, "night")):
+                values = [getattr(e, period) for e in entries if getattr(e, period)]
+                item[f"avg_{name}"] = sum(values) / len(values) if values else None
+                item[f"count_{name}"] = len(values)
+            ret[key] = item
+        return ret
+
+    @staticmethod
+    def _counts(
+        entries: typing.Iterable[WeekdayEntry], period: str
+    ) -> typing.Dict[int, int]:
+        if period not in PERIODS:
+            raise ValueError(f"period must be one of {PERIODS}")
+        ret = defaultdict(int)
+        for entry in entries:
+            if getattr(entry, period):
+                ret[getattr(entry, period)] += 1
+        return dict(ret)
+
+    @staticmethod
+    def _weeks(
+        entries: typing.Iterable[WeekdayEntry], mood: typing.Optional[int]
+    ) -> typing.Set[date]:
+        return {
+            week_start(entry.day)
+            for entry in entries
+            if mood is None or mood in (entry.mood_day, entry.mood_night)
+        }
+
+    @staticmethod
+    def _averages(
+        entries: typing.Iterable[WeekdayEntry],
+    ) -> typing.Dict[str, typing.Optional[float]]:
+        ret = {}
+        entries = list(entries)
+        for period in PERIODS:
+            values = [getattr(e, period) for e in entries if getattr(e, period)]
+            ret[period] = sum(values) / len(values) if values else None
+        return ret
+
+
+class RowMoodStore(MoodStore):
+    """
+    One `Entry` row per day.
+    """
+
+    grid_expressions = {
+        GRID_WEEKDAY: ExtractIsoWeekDay("day"),
+        GRID_MONTH: ExtractMonth("day"),
+        GRID_WEEK: ExtractWeek("day"),
+    }
+
+    def get(self, user: User, day: date) -> WeekdayEntry:
+        obj = Entry.objects.filter(user=user, day=day).first()
+        if obj is None:
+            return WeekdayEntry(day=day, mood_day=None, mood_night=None)
+        return WeekdayEntry(day=day, mood_day=obj.mood_day, mood_night=obj.mood_night)
+
+    def save(self, user: User, entry: WeekdayEntry) -> None:
+        Entry.objects.update_or_create(
+            user=user,
+            day=entry.day,
+            defaults={PERIOD_DAY: entry.mood_day, PERIOD_NIGHT: entry.mood_night},
+        )
+
+    def save_many(self, user: User, entries: typing.List[WeekdayEntry]) -> None:
+        Entry.objects.bulk_create(
+            [
+                Entry(
+                    user=user,
+                    day=entry.day,
+                    mood_day=entry.mood_day,
+                    mood_night=entry.mood_night,
+                )
+                for entry in entries
+            ],
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=["user", "day"],
+            update_fields=PERIODS,
+        )
+
+    def delete_range(self, user: User, first_day: date, last_day: date) -> None:
+        Entry.objects.filter(user=user, day__gte=first_day, day__lt=last_day).delete()
+
+    def entries(
+        self,
+        user: User,
+        first_day: typing.Optional[date] = None,
+        last_day: typing.Optional[date] = None,
+    ) -> typing.List[WeekdayEntry]:
+        return [
+            WeekdayEntry(day=day, mood_day=mood_day, mood_night=mood_night)
+            for day, mood_day, mood_night in self._range_qs(user, first_day, last_day)
+        ]
+
+    async def aentries(
+        self,
+        user: User,
+        first_day: typing.Optional[date] = None,
+        last_day: typing.Optional[date] = None,
+    ) -> typing.List[WeekdayEntry]:
+        return [
+            WeekdayEntry(day=day, mood_day=mood_day, mood_night=mood_night)
+            async for day, mood_day, mood_night in self._range_qs(
+                user, first_day, last_day
+            )
+        ]
+
+    def bounds(self, user: User) -> DateRange:
+        qs = self._qs(user).order_by("day").values_list("day", flat=True)
+        return qs.first(), qs.last()
+
+    async def abounds(self, user: User) -> DateRange:
+        qs = self._qs(user).order_by("day").values_list("day", flat=True)
+        return await qs.afirst(), await qs.alast()
+
+    def weeks_with_moods(
+        self,
+        user: User,
+        first_day: typing.Optional[date] = None,
+        last_day: typing.Optional[date] = None,
+        mood: typing.Optional[int] = None,
+    ) -> typing.Set[date]:
+        return set(self._weeks_qs(user, first_day, last_day, mood))
+
+    async def aweeks_with_moods(
+        self,
+        user: User,
+        first_day: typing.Optional[date] = None,
+        last_day: typing.Optional[date] = None,
+        mood: typing.Optional[int] = None,
+    ) -> typing.Set[date]:
+        return {week async for week in self._weeks_qs(user, first_day, last_day, mood)}
+
+    def counts(
+        self,
+        user: User,
+        period: str,
+        first_day: typing.Optional[date] = None,
+        last_day: typing.Optional[date] = None,
+    ) -> typing.Dict[int, int]:
+        return dict(self._counts_qs(user, period, first_day, last_day))
+
+    async def acounts(
+        self,
+        user: User,
+        period: str,
+        first_day: typing.Optional[date] = None,
+        last_day: typing.Optional[date] = None,
+    ) -> typing.Dict[int, int]:
+        qs = self._counts_qs(user, period, first_day, last_day)
+        return {mood: total async for mood, total in qs}
+
+    def averages(
+        self,
+        user: User,
+        first_day: typing.Optional[date] = None,
+        last_day: typing.Optional[date] = None,
+    ) -> typing.Dict[str, typing.Optional[float]]:
+        return self._filter_range(
+            Entry.objects.filter(user=user), first_day, last_day
+        ).aggregate(**{period: Avg(period) for period in PERIODS})
+
+    async def aaverages(
+        self,
+        user: User,
+        first_day: typing.Optional[date] = None,
+        last_day: typing.Optional[date] = None,
+    ) -> typing.Dict[str, typing.Optional[float]]:
+        return await self._filter_range(
+            Entry.objects.filter(user=user), first_day, last_day
+        ).aaggregate(**{period: Avg(period) for period in PERIODS})
+
+    def latest(
+        self, user: User, period: str, mood: int
+    ) -> typing.Optional[WeekdayEntry]:
+        obj = Entry.objects.filter(user=user, **{period: mood}).order_by("-day").first()
+        if obj is None:
+            return None
+        return WeekdayEntry(
+            day=obj.day, mood_day=obj.mood_day, mood_night=obj.mood_night
+        )
+
+    def grid(
+        self,
+        user: User,
+        row: str,
+        column: str,
+        iso_year: typing.Optional[int] = None,
+    ) -> typing.Dict[typing.Tuple[int, int], dict]:
+        qs = self._qs(user)
+        if iso_year:
+            qs = qs.filter(day__iso_year=iso_year)
+        qs = (
+            qs.annotate(
+                row=self.grid_expressions[row], column=self.grid_expressions[column]
+            )
+            .values("row", "column")
+            .annotate(
+                avg_day=Avg(PERIOD_DAY),
+                avg_night=Avg(PERIOD_NIGHT),
+                count_day=Count(PERIOD_DAY),
+                count_night=Count(PERIOD_NIGHT),
+            )
+            .order_by()
+        )
+        return {(item.pop("row"), item.pop("column")): item for item in qs}
+
+    def _qs(self, user: User) -> QuerySet:
+        return Entry.objects.filter(user=user).filter(
+            Q(mood_day__isnull=False) | Q(mood_night__isnull=False)
+        )
+
+    def _range_qs(
+        self,
+        user: User,
+        first_day: typing.Optional[date],
+        last_day: typing.Optional[date],
+    ) -> QuerySet:
+        return (
+            self._filter_range(self._qs(user), first_day, last_day)
+            .order_by("day")
+            .values_list("day", PERIOD_DAY, PERIOD_NIGHT)
+        )
+
+    def _weeks_qs(
+        self,
+        user: User,
+        first_day: typing.Optional[date],
+        last_day: typing.Optional[date],
+        mood: typing.Optional[int],
+    ) -> QuerySet:
+        qs = self._filter_range(self._qs(user), first_day, last_day)
+        if mood is not None:
+            qs = qs.filter(Q(mood_day=mood) | Q(mood_night=mood))
+        return (
+            qs.annotate(week=TruncWeek("day"))
+            .order_by()
+            .values_list("week", flat=True)
+            .distinct()
+        )
+
+    def _counts_qs(
+        self,
+        user: User,
+        period: str,
+        first_day: typing.Optional[date],
+        last_day: typing.Optional[date],
+    ) -> QuerySet:
+        if period not in PERIODS:
+            raise ValueError(f"period must be one of {PERIODS}")
+        return (
+            self._filter_range(Entry.objects.filter(user=user), first_day, last_day)
+            .filter(**{f"{period}__isnull": False})
+            .values_list(period)
+            .annotate(total=Count(period))
+            .order_by()
+        )
+
+    @staticmethod
+    def _filter_range(
+        qs: QuerySet, first_day: typing.Optional[date], last_day: typing.Optional[date]
+    ) -> QuerySet:
+        if first_day:
+            qs = qs.filter(day__gte=first_day)
+        if last_day:
+            qs = qs.filter(day__lt=last_day)
+        return qs
+
+
+class PackedMoodStore(MoodStore):
+    """
+    Moods of a week in `Week.moods`: 14 bytes, day and night of Monday first,
+    0 for a missing mood.
+    """
+
+    def get(self, user: User, day: date) -> WeekdayEntry:
+        week_date = week_start(day)
+        moods = (
+            Week.objects.filter(user=user, week_date=week_date)
+            .values_list("moods", flat=True)
+            .first()
+        )
+        return unpack_week(week_date, moods)[day.weekday()]
+
+    def save(self, user: User, entry: WeekdayEntry) -> None:
+        week, created = Week.objects.select_for_update().get_or_create(
+            user=user, week_date=week_start(entry.day)
+        )
+        moods = bytearray(week.moods or bytes(14))
+        idx = entry.day.weekday() * 2
+        moods[idx] = entry.mood_day or 0
+        moods[idx + 1] = entry.mood_night or 0
+        week.moods = bytes(moods) if any(moods) else None
+        week.save(update_fields=["moods"])
+
+    def delete_range(self, user: User, first_day: date, last_day: date) -> None:
+        weeks = self._qs(user).filter(
+            week_date__gte=week_start(first_day), week_date__lt=last_day
+        )
+        for week in weeks.select_for_update():
+            moods = bytearray(week.moods)
+            for d in range(7):
+                if first_day <= week.week_date + timedelta(days=d) < last_day:
+                    moods[d * 2] = moods[d * 2 + 1] = 0
+            week.moods = bytes(moods) if any(moods) else None
+            week.save(update_fields=["moods"])
+
+    def entries(
+        self,
+        user: User,
+        first_day: typing.Optional[date] = None,
+        last_day: typing.Optional[date] = None,
+    ) -> typing.List[WeekdayEntry]:
+        weeks = self._range_qs(user, first_day, last_day)
+        return self._unpack(weeks, first_day, last_day)
+
+    async def aentries(
+        self,
+        user: User,
+        first_day: typing.Optional[date] = None,
+        last_day: typing.Optional[date] = None,
+    ) -> typing.List[WeekdayEntry]:
+        weeks = [week async for week in self._range_qs(user, first_day, last_day)]
+        return self._unpack(weeks, first_day, last_day)
+
+    def bounds(self, user: User) -> DateRange:
+        qs = self._qs(user).order_by("week_date").values_list("week_date", "moods")
+        return self._bounds(qs.first(), qs.last())
+
+    async def abounds(self, user: User) -> DateRange:
+        qs = self._qs(user).order_by("week_date").values_list("week_date", "moods")
+        return self._bounds(await qs.afirst(), await qs.alast())
+
+    def _qs(self, user: User) -> QuerySet:
+        return Week.objects.filter(user=user, moods__isnull=False)
+
+    def _range_qs(
+        self,
+        user: User,
+        first_day: typing.Optional[date],
+        last_day: typing.Optional[date],
+    ) -> QuerySet:
+        qs = self._qs(user)
+        if first_day:
+            qs = qs.filter(week_date__gte=week_start(first_day))
+        if last_day:
+            qs = qs.filter(week_date__lt=last_day)
+        return qs.order_by("week_date").values_list("week_date", "moods")
+
+    @staticmethod
+    def _unpack(
+        weeks: typing.Iterable[typing.Tuple[date, bytes]],
+        first_day: typing.Optional[date],
+        last_day: typing.Optional[date],
+    ) -> typing.List[WeekdayEntry]:
+        return [
+            entry
+            for week_date, moods in weeks
+            for entry in unpack_week(week_date, moods)
+            if (entry.mood_day or entry.mood_night)
+            and (not first_day or entry.day >= first_day)
+            and (not last_day or entry.day < last_day)
+        ]
+
+    @staticmethod
+    def _bounds(
+        first: typing.Optional[tuple], last: typing.Optional[tuple]
+    ) -> DateRange:
+        if first is None:
+            return None, None
+        first_days = [e.day for e in unpack_week(*first) if e.mood_day or e.mood_night]
+        last_days = [e.day for e in unpack_week(*last) if e.mood_day or e.mood_night]
+        return first_days[0], last_days[-1]
+
+
+def week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def unpack_week(
+    week_date: date, moods: typing.Optional[bytes]
+) -> typing.List[WeekdayEntry]:
+    moods = bytes(moods or bytes(14))
+    return [
+        WeekdayEntry(
+            day=week_date + timedelta(days=d),
+            mood_day=moods[d * 2] or None,
+            mood_night=moods[d * 2 + 1] or None,
+        )
+        for d in range(7)
+    ]
+
+
+@lru_cache(maxsize=None)
+def get_store() -> MoodStore:
+    store = import_string(settings.SK_MOOD_STORAGE)()
+    if settings.SK_ARCHIVE:
+        from web.archive import ArchiveMoodStore
+
+        store = ArchiveMoodStore(store)
+    return store
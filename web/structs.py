@@ -2,7 +2,7 @@
 from dataclasses import dataclass
 from datetime import date
 
-from web.models import Entry, Week
+from web.models import Week
 
 
 @dataclass
@@ -24,7 +24,7 @@ class MoodTable:
 class StandoutData:
     label: str
     css_class: str
-    entry: Entry
+    entry: typing.Optional[WeekdayEntry]
 
 
 @dataclass
@@ -93,3 +93,45 @@ class ExportData:
     entries: SkCalendar
     moods: dict
     weeks: typing.List[Week]
+
+
+@dataclass
+class HeatmapCell:
+    """
+    One cell of the mood heatmap: averages and counts of all entries
+    falling into a (row, column) bucket.
+    """
+
+    row: int
+    column: int
+    avg_day: typing.Optional[float]
+    avg_night: typing.Optional[float]
+    count_day: int
+    count_night: int
+
+
+@dataclass
+class HeatmapResponse:
+    """
+    Data class for the heatmap endpoint.
+
+    `weekday_month`: rows are ISO weekdays (1 = monday), columns are months.
+    `week_weekday`: rows are ISO weeks of `year`, columns are ISO weekdays.
+    """
+
+    weekday_month: typing.List[HeatmapCell]
+    year: typing.Optional[int]
+    week_weekday: typing.List[HeatmapCell]
+
+
+@dataclass
+class Streaks:
+    """
+    Runs of consecutive days: "tracked" days have any mood, "good" days have
+    a good or very good day mood.
+    """
+
+    current_tracked: int
+    longest_tracked: int
+    current_good: int
+    longest_good: int
@@ -1 +1,1481 @@
-# Create your tests here.
+"""
+Query budgets of all views and API endpoints, the query plans of the mood
+range queries, and tests of the streaks, the change events, the replica
+routing, the mood stores, the archive, the shards, the signed tokens, the
+request profiles, the memory samples, the log queue and the Prometheus
+metrics.
+
+A budget is the maximum number of queries of a request. If a change needs
+more queries for a good reason, raise the budget in `CASES`.
+"""
+
+import asyncio
+import importlib
+import io
+import logging
+import logging.handlers
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import typing
+import unittest
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from pathlib import Path
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver
+from django.utils import timezone, translation
+from rest_framework import exceptions
+
+from web import auth, events, log, metrics, partitioning, sharding
+from web.catalog import get_catalog
+from web.db_router import REPLICA_DB
+from web.models import (
+    ArchivedYear,
+    Entry,
+    MemorySample,
+    RequestProfile,
+    SkEvent,
+    UserMoodColorSettings,
+    UserSettings,
+    UserShard,
+    Week,
+)
+from web.service.bar_graph import BarGraphService
+from web.service.base_graph import PERIOD_DAY
+from web.service.heatmap import HeatmapService
+from web.service.pie_graph import PieGraphService
+from web.service.scatter_graph import ScatterGraphService
+from web.service.settings import SettingsService
+from web.service.sk import SkService
+from web.service.streaks import StreakService
+from web.service.svg import SvgService
+from web.storage import PERIODS, PackedMoodStore, RowMoodStore, get_store
+from web.structs import WeekdayEntry
+
+try:
+    from prometheus_client import CollectorRegistry, Counter
+    from prometheus_client import values as prometheus_values
+except ImportError:
+    pass
+
+FIRST_DAY = date(2023, 1, 2)  # A Monday
+DAYS = 2 * 365
+PASSWORD = "budget-password"
+
+
+@dataclass
+class Case:
+    route: str
+    # Maximum queries of a logged-in user, None if the request isn't made
+    budget: typing.Optional[int]
+    # Queries of an anonymous request, which is refused or redirected
+    anonymous_budget: typing.Optional[int] = 0
+    method: str = "get"
+    # Path and data are built from the test and the user
+    path: typing.Optional[typing.Callable] = None
+    data: typing.Union[dict, typing.Callable] = field(default_factory=dict)
+    json: bool = False
+
+
+def _svg_version(test: "QueryBudgetTest", user: User) -> int:
+    return UserSettings.objects.get(user=user).data_version
+
+
+CASES = [
+    Case("", 16),
+    Case("logout", 4, method="get"),
+    Case(
+        "save-mood/",
+        15,
+        method="post",
+        data={"entry": "4_2024-06-05", "period": "day"},
+    ),
+    Case(
+        "save-note/",
+        11,
+        method="post",
+        data={"week": "2024-06-03", "note": "Budget"},
+    ),
+    Case(
+        "save-settings/",
+        12,
+        method="post",
+        data={"view_day_form": "on", "view_night_form": "on", "use_js_btn": "on"},
+    ),
+    Case("graph/", 6),
+    Case("settings/", 4),
+    Case("search/", 6, path=lambda test, user: "/search/?search_term=note"),
+    Case("calendar/", 4),
+    Case(
+        "svg/heatmap/<int:year>/<int:version>.svg",
+        5,
+        path=lambda test, user: f"/svg/heatmap/2024/{_svg_version(test, user)}.svg",
+    ),
+    Case(
+        "svg/sparkline/<str:week>/<int:version>.svg",
+        5,
+        path=lambda test, user: (
+            f"/svg/sparkline/2024-06-03/{_svg_version(test, user)}.svg"
+        ),
+    ),
+    Case("jsoni18n/", 0, anonymous_budget=0, path=lambda test, user: "/jsoni18n/"),
+    Case(
+        "jsoni18n/<str:language>/<str:digest>.json",
+        0,
+        anonymous_budget=0,
+        path=lambda test, user: get_catalog("de-de").url,
+    ),
+    Case("openapi", 2, anonymous_budget=0),
+    Case(
+        "api/entry-day/",
+        14,
+        method="post",
+        data={"mood": 3, "period": "night", "day": "2024-06-06"},
+        json=True,
+    ),
+    Case("api/mood-table/", 4),
+    Case("api/standout-data/", 6),
+    Case("api/scatter-graph/", 3),
+    Case(
+        "api/pie-chart-graph/",
+        3,
+        path=lambda test, user: "/api/pie-chart-graph/?period=mood_day",
+    ),
+    Case("api/bar-chart-graph/", 3),
+    Case("api/heatmap/", 4, path=lambda test, user: "/api/heatmap/?year=2024"),
+    Case(
+        "api/save-note/",
+        11,
+        method="post",
+        data={"week_date": "2024-06-10", "note": "Budget"},
+        json=True,
+    ),
+    Case("api/search/", 3, path=lambda test, user: "/api/search/?search_term=note"),
+    Case("api/graph/", 4),
+    Case("api/graph-page/", 8),
+    # A stream that doesn't end, only the refused request is checked
+    Case("api/events/", None),
+    Case("api/calendar/", 5),
+    Case("api/export/", 6),
+    Case(
+        "api/set-language/",
+        2,
+        method="post",
+        data={"language": "de-de"},
+        json=True,
+    ),
+    Case("api/forms-displayed/", 3),
+    Case("api/mood-colors/", 4),
+    Case(
+        "api/token/",
+        1,
+        anonymous_budget=1,
+        method="post",
+        data=lambda test, user: {"username": user.username, "password": PASSWORD},
+    ),
+    # Staff only, the seeded users are refused
+    Case("api/memory/", None),
+    # Only with METRICS, see MetricsTest
+    Case("metrics", None, anonymous_budget=None),
+    Case(
+        "api/token/refresh/",
+        1,
+        anonymous_budget=1,
+        method="post",
+        data=lambda test, user: {"refresh": auth.issue_tokens(user)["refresh"]},
+    ),
+]
+
+# Routes that are served as they are by Django and the other apps
+THIRD_PARTY_MODULES = ("django.", "django_registration.", "rosetta.")
+# Staff pages, including the views of web/admin.py
+ADMIN_PREFIX = "admin/"
+
+
+def _routes(patterns: list, prefix: str = "") -> typing.Iterator[URLPattern]:
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from _routes(pattern.url_patterns, prefix + str(pattern.pattern))
+        else:
+            yield prefix + str(pattern.pattern), pattern
+
+
+def _seed(user: User, days: int) -> None:
+    """
+    Moods for every day but every fifth, a note every third week and custom
+    colors.
+    """
+    Entry.objects.bulk_create(
+        Entry(
+            user=user,
+            day=FIRST_DAY + timedelta(days=d),
+            mood_day=d % 5 + 1,
+            mood_night=(d * 3) % 5 + 1,
+        )
+        for d in range(days)
+        if d % 5
+    )
+    Week.objects.bulk_create(
+        Week(user=user, week_date=FIRST_DAY + timedelta(weeks=w), note=f"note {w}")
+        for w in range(0, days // 7, 3)
+    )
+    SettingsService(user).save_user_colors_settings(
+        {"mood-1": "#ff0000", "mood-5": "#00ff00"}
+    )
+
+
+@override_settings(ALLOWED_HOSTS=["testserver"])
+class QueryBudgetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.active = User.objects.create_user("active", password=PASSWORD)
+        _seed(cls.active, DAYS)
+        cls.new = User.objects.create_user("new", password=PASSWORD)
+
+    def setUp(self):
+        # Cold caches, every request pays for its lookups
+        cache.clear()
+
+    def _request(self, case: Case, user: typing.Optional[User]):
+        path = case.path(self, user) if case.path else "/" + case.route
+        data = case.data(self, user) if callable(case.data) else case.data
+        kwargs = {"content_type": "application/json"} if case.json else {}
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, case.method)(path, data, **kwargs)
+        return response, queries
+
+    def _assert_budget(self, case: Case, budget: int, user: typing.Optional[User]):
+        response, queries = self._request(case, user)
+        self.assertLess(response.status_code, 400, f"{case.route}: {response}")
+        sql = "\n".join(query["sql"] for query in queries.captured_queries)
+        self.assertLessEqual(
+            len(queries),
+            budget,
+            f"{case.route} ({user or 'anonymous'}): {len(queries)} queries\n{sql}",
+        )
+
+    def test_every_route_has_a_budget(self):
+        routes = {case.route for case in CASES}
+        for route, pattern in _routes(get_resolver().url_patterns):
+            if pattern.callback.__module__.startswith(THIRD_PARTY_MODULES):
+                continue
+            if route.startswith(ADMIN_PREFIX):
+                continue
+            self.assertIn(route, routes, f"No query budget for {route}")
+
+    def test_budgets(self):
+        for user in [self.active, self.new]:
+            for case in CASES:
+                if case.budget is None:
+                    continue
+                with self.subTest(route=case.route, user=user.username):
+                    self.client.force_login(user)
+                    cache.clear()
+                    self._assert_budget(case, case.budget, user)
+
+    def test_anonymous_budgets(self):
+        for case in CASES:
+            if case.anonymous_budget is None:
+                continue
+            with self.subTest(route=case.route):
+                self.client.logout()
+                response, queries = self._request(case, self.active)
+                self.assertEqual(
+                    len(queries),
+                    case.anonymous_budget,
+                    f"{case.route}: {[q['sql'] for q in queries.captured_queries]}",
+                )
+
+    def test_sessions_of_model_backend(self):
+        # Sessions from before CachedModelBackend
+        self.client.force_login(
+            self.active, backend="django.contrib.auth.backends.ModelBackend"
+        )
+        self.assertEqual(self.client.get("/").status_code, 302)
+        migration = importlib.import_module("web.migrations.0036_session_backend")
+        migration.to_cached_model_backend(
+            django_apps, connection.schema_editor(atomic=False)
+        )
+        self.assertEqual(self.client.get("/").status_code, 200)
+
+    def test_schema_of_staff(self):
+        staff = User.objects.create_user("staff", is_staff=True)
+        for user, expected in [(staff, True), (self.active, False), (staff, True)]:
+            with self.subTest(user=user.username):
+                self.client.force_login(user)
+                response = self.client.get("/openapi")
+                self.assertEqual("/api/memory/" in response.data["paths"], expected)
+
+    def test_login_page(self):
+        with self.assertNumQueries(0):
+            response = self.client.get("/accounts/login/")
+        self.assertEqual(response.status_code, 200)
+
+
+class EntryQueryPlanTest(TestCase):
+    """
+    The mood queries of a date range must search the index of user and day,
+    not scan the table.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("plan")
+        _seed(cls.user, 60)
+
+    def _entry_queries(self, fn: typing.Callable) -> typing.List[str]:
+        with CaptureQueriesContext(connection) as queries:
+            fn()
+        return [
+            query["sql"]
+            for query in queries.captured_queries
+            if Entry._meta.db_table in query["sql"]
+        ]
+
+    def _plan(self, sql: str) -> str:
+        with connection.cursor() as cursor:
+            if connection.vendor == "sqlite":
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                return "\n".join(row[-1] for row in cursor.fetchall())
+            # The planner would scan the small test tables anyway
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute(f"EXPLAIN {sql}")
+            return "\n".join(row[0] for row in cursor.fetchall())
+
+    def _assert_index(self, sql: str) -> None:
+        plan = self._plan(sql)
+        if connection.vendor == "sqlite":
+            self.assertNotRegex(plan, r"SCAN web_entry(?! USING)", f"{sql}\n{plan}")
+            self.assertIn("USING", plan, f"{sql}\n{plan}")
+        else:
+            self.assertNotIn("Seq Scan", plan, f"{sql}\n{plan}")
+
+    def test_range_queries_use_an_index(self):
+        sk_service = SkService(self.user)
+        calls = {
+            "mood_table": lambda: sk_service.mood_table("2023-01-16"),
+            "calendar": sk_service.calendar,
+            "standout_data": sk_service.standout_data,
+        }
+        for name, fn in calls.items():
+            queries = self._entry_queries(fn)
+            self.assertTrue(queries, f"{name} didn't query {Entry._meta.db_table}")
+            for sql in queries:
+                with self.subTest(name=name, sql=sql):
+                    self._assert_index(sql)
+
+
+class SearchTest(TestCase):
+    """
+    Weeks are found by their moods, with or without a `Week` row.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("search")
+        sk_service = SkService(cls.user)
+        sk_service.save_entry("day", 1, "2024-03-05")
+        sk_service.save_entry("day", 1, "2024-03-13")
+        sk_service.save_entry("night", 2, "2024-03-20")
+        sk_service.save_note("2024-03-11", "a note")
+
+    def _week_dates(self, weeks: typing.List[Week]) -> typing.List[str]:
+        return [week.week_date.isoformat() for week in weeks]
+
+    def test_search(self):
+        sk_service = SkService(self.user)
+        searches = {
+            (("mood", "1"),): ["2024-03-11", "2024-03-04"],
+            (("mood", "2"),): ["2024-03-18"],
+            (): ["2024-03-18", "2024-03-11", "2024-03-04"],
+            (("search_term", "note"),): ["2024-03-11"],
+            (("search_term", "note"), ("mood", "1")): ["2024-03-11"],
+            (("search_term", "note"), ("mood", "2")): [],
+            (("mood", "1"), ("start_dt", "2024-03-06")): ["2024-03-11"],
+            (("mood", "1"), ("end_dt", "2024-03-10")): ["2024-03-04"],
+        }
+        for kwargs, expected in searches.items():
+            with self.subTest(**dict(kwargs)):
+                weeks = sk_service.search(**dict(kwargs))
+                self.assertEqual(self._week_dates(weeks), expected)
+                weeks = async_to_sync(sk_service.asearch)(**dict(kwargs))
+                self.assertEqual(self._week_dates(weeks), expected)
+
+
+STREAK_FIELDS = [
+    "tracked_streak",
+    "tracked_streak_end",
+    "longest_tracked_streak",
+    "good_streak",
+    "good_streak_end",
+    "longest_good_streak",
+]
+
+
+class StreakTest(TestCase):
+    """
+    The counters updated on every write match a recomputation from scratch.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("streaks")
+
+    def _assert_recomputed(self, step: str) -> None:
+        stored = UserSettings.objects.values(*STREAK_FIELDS).get(user=self.user)
+        StreakService(self.user).recompute()
+        recomputed = UserSettings.objects.values(*STREAK_FIELDS).get(user=self.user)
+        self.assertEqual(stored, recomputed, step)
+
+    def test_writes_in_order_and_out_of_order(self):
+        sk_service = SkService(self.user)
+        # Saving the saved mood again removes it
+        steps = [
+            ("day", 4, "2023-12-29"),
+            ("day", 5, "2023-12-30"),
+            ("day", 4, "2024-01-01"),  # Gap on New Year's Eve
+            ("day", 4, "2023-12-31"),  # Closes the gap across the year
+            ("night", 1, "2024-01-02"),
+            ("day", 1, "2023-12-30"),  # Overwrites a good mood
+            ("day", 1, "2023-12-30"),  # Removes it, the night is empty
+            ("day", 5, "2024-01-07"),  # Sunday
+            ("day", 5, "2024-01-08"),  # Monday of the next week
+            ("day", 4, "2024-01-01"),  # Removes a day in the middle
+            ("night", 3, "2023-12-01"),
+        ]
+        for period, mood, day in steps:
+            sk_service.save_entry(period, mood, day)
+            self._assert_recomputed(f"{period} {mood} {day}")
+
+    def test_random_writes(self):
+        sk_service = SkService(self.user)
+        rng = random.Random(27)
+        first_day = date(2023, 12, 18)
+        for i in range(150):
+            day = first_day + timedelta(days=rng.randrange(35))
+            period = rng.choice(["day", "night"])
+            mood = rng.randint(1, 5)
+            sk_service.save_entry(period, mood, day.isoformat())
+            self._assert_recomputed(f"{i}: {period} {mood} {day}")
+
+
+class _Rollback(Exception):
+    pass
+
+
+@override_settings(SK_EVENTS_HEARTBEAT=1, SK_EVENTS_POLL_INTERVAL=0.01)
+class EventTest(TestCase):
+    """
+    Writes publish their events once committed, and `api/events/` streams
+    them, including those missed before reconnecting.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("events")
+
+    def setUp(self):
+        events.get_broker.cache_clear()
+        self.addCleanup(events.get_broker.cache_clear)
+
+    async def _next(self, stream: typing.AsyncIterator) -> typing.Any:
+        return await asyncio.wait_for(stream.__anext__(), timeout=5)
+
+    @override_settings(SK_EVENT_BROKER="web.events.DatabaseEventBroker")
+    def test_published_after_commit(self):
+        sk_service = SkService(self.user)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            sk_service.save_entry("day", 4, "2024-06-05")
+            sk_service.save_note("2024-06-03", "Events")
+            self.assertFalse(SkEvent.objects.exists())
+        self.assertEqual(len(callbacks), 2)
+        self.assertEqual(
+            list(SkEvent.objects.order_by("id").values_list("type", "data")),
+            [
+                (
+                    events.EVENT_ENTRY,
+                    {"day": "2024-06-05", "mood_day": 4, "mood_night": None},
+                ),
+                (
+                    events.EVENT_NOTE,
+                    {"week_date": "2024-06-03", "note": "Events"},
+                ),
+            ],
+        )
+
+    @override_settings(SK_EVENT_BROKER="web.events.DatabaseEventBroker")
+    def test_not_published_after_rollback(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(_Rollback), transaction.atomic():
+                SkService(self.user).save_entry("day", 4, "2024-06-05")
+                raise _Rollback
+        self.assertEqual(callbacks, [])
+        self.assertFalse(SkEvent.objects.exists())
+
+    async def test_local_broker(self):
+        broker = events.LocalEventBroker()
+        broker.publish(self.user.pk, events.EVENT_ENTRY, {"n": 1})
+        broker.publish(self.user.pk, events.EVENT_ENTRY, {"n": 2})
+        broker.publish(0, events.EVENT_ENTRY, {"other": True})
+        # A new subscriber only gets new events
+        stream = broker.subscribe(self.user.pk)
+        self.assertIsNone(await self._next(stream))  # Heartbeat
+        broker.publish(self.user.pk, events.EVENT_NOTE, {"n": 3})
+        self.assertEqual((await self._next(stream)).data, {"n": 3})
+        await stream.aclose()
+        # A reconnecting one also gets those it missed
+        stream = broker.subscribe(self.user.pk, last_event_id=1)
+        self.assertEqual([(await self._next(stream)).id for _ in range(2)], [2, 4])
+        await stream.aclose()
+        self.assertEqual(broker._subscribers, {})
+
+    async def test_database_broker(self):
+        broker = events.DatabaseEventBroker()
+        publish = sync_to_async(broker.publish)
+        await publish(self.user.pk, events.EVENT_ENTRY, {"n": 1})
+        await publish(self.user.pk, events.EVENT_ENTRY, {"n": 2})
+        first = await SkEvent.objects.order_by("id").afirst()
+        stream = broker.subscribe(self.user.pk)
+        self.assertIsNone(await self._next(stream))
+        await publish(self.user.pk, events.EVENT_NOTE, {"n": 3})
+        self.assertEqual((await self._next(stream)).data, {"n": 3})
+        await stream.aclose()
+        stream = broker.subscribe(self.user.pk, last_event_id=first.id)
+        self.assertEqual(
+            [(await self._next(stream)).data for _ in range(2)], [{"n": 2}, {"n": 3}]
+        )
+        await stream.aclose()
+
+    async def test_stream_replays_missed_events(self):
+        broker = events.get_broker()
+        broker.publish(self.user.pk, events.EVENT_ENTRY, {"day": "2024-06-04"})
+        broker.publish(self.user.pk, events.EVENT_ENTRY, {"day": "2024-06-05"})
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(
+            "/api/events/", headers={"Last-Event-ID": "1"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await self._next(stream), b"retry: 5000\n\n")
+        self.assertEqual(
+            await self._next(stream),
+            b'id: 2\nevent: entry\ndata: {"day": "2024-06-05"}\n\n',
+        )
+        # Published while connected
+        broker.publish(self.user.pk, events.EVENT_NOTE, {"note": "Live"})
+        self.assertEqual(
+            await self._next(stream), b'id: 3\nevent: note\ndata: {"note": "Live"}\n\n'
+        )
+        await stream.aclose()
+
+    def test_stream_requires_asgi(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get("/api/events/").status_code, 501)
+        self.client.logout()
+        self.assertEqual(self.client.get("/api/events/").status_code, 403)
+
+
+class _DatabaseCopiesTest(TestCase):
+    """
+    Adds the database aliases in `copies`, each backed by a copy of the
+    SQLite test database in a temporary file.
+    """
+
+    copies: typing.List[str] = []
+    # Resolved in setUpClass, once the copies have been added
+    databases = "__all__"
+
+    @classmethod
+    def setUpClass(cls):
+        tmp = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(tmp.cleanup)
+        connections["default"].ensure_connection()
+        for alias in cls.copies:
+            path = os.path.join(tmp.name, f"{alias}.sqlite3")
+            copy = sqlite3.connect(path)
+            connections["default"].connection.backup(copy)
+            copy.close()
+            # The connections read the same dict
+            settings.DATABASES[alias] = connections.configure_settings(
+                {
+                    "default": settings.DATABASES["default"],
+                    alias: {"ENGINE": "django.db.backends.sqlite3", "NAME": path},
+                }
+            )[alias]
+            cls.addClassCleanup(cls._remove_copy, alias)
+        super().setUpClass()
+
+    @staticmethod
+    def _remove_copy(alias: str) -> None:
+        connections[alias].close()
+        del connections[alias]
+        del settings.DATABASES[alias]
+
+
+@unittest.skipUnless(connection.vendor == "sqlite", "Copies the SQLite test database")
+class ReplicaRouterTest(_DatabaseCopiesTest):
+    """
+    The read-only services use the replica, a copy of the test database in a
+    second SQLite file, unless the user has just written something.
+    """
+
+    # As if DATABASE_REPLICA_URL was set
+    copies = [REPLICA_DB]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("replica")
+        User.objects.using(REPLICA_DB).bulk_create([User(pk=cls.user.pk)])
+        # The replica lags behind: it has older moods than the primary
+        Entry.objects.create(user=cls.user, day=date(2024, 6, 5), mood_day=1)
+        Entry.objects.using(REPLICA_DB).create(
+            user_id=cls.user.pk, day=date(2024, 5, 8), mood_day=5
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def _queries(self, read: typing.Callable) -> typing.Tuple[int, int]:
+        with CaptureQueriesContext(connections["default"]) as primary:
+            with CaptureQueriesContext(connections[REPLICA_DB]) as replica:
+                read()
+        return len(primary), len(replica)
+
+    def _reads(self) -> typing.Dict[str, typing.Callable]:
+        sk_service = SkService(self.user)
+        mood_mapping = sk_service.mood_mapping
+        first_day, last_day = date(2024, 5, 1), date(2024, 6, 30)
+        return {
+            "calendar": sk_service.calendar,
+            "search": lambda: sk_service.search(mood="5"),
+            "export": lambda: list(sk_service.export().weeks),
+            "bar": BarGraphService(
+                self.user, mood_mapping, first_day, last_day
+            ).load_data,
+            "pie": lambda: PieGraphService(
+                self.user, mood_mapping, first_day, last_day
+            ).load_data(PERIOD_DAY),
+            "scatter": ScatterGraphService(
+                True, mood_mapping, self.user, first_day, last_day
+            ).load_data,
+            "heatmap": HeatmapService(self.user).load_data,
+            "svg": lambda: SvgService(self.user, {}).year_heatmap(2024),
+        }
+
+    def _calendar_days(self) -> typing.Set[date]:
+        return {
+            entry.day
+            for entry in SkService(self.user).calendar().entries
+            if entry.mood_day
+        }
+
+    def test_reads_use_replica(self):
+        for name, read in self._reads().items():
+            with self.subTest(name):
+                primary, replica = self._queries(read)
+                self.assertEqual(primary, 0)
+                self.assertGreater(replica, 0)
+        self.assertEqual(self._calendar_days(), {date(2024, 5, 8)})
+        self.assertEqual(
+            [week.week_date for week in SkService(self.user).search(mood="5")],
+            [date(2024, 5, 6)],
+        )
+
+    @override_settings(DATABASE_REPLICA_PIN_SECONDS=1)
+    def test_reads_use_primary_after_write(self):
+        SkService(self.user).save_entry("day", 3, "2024-06-06")
+        for name, read in self._reads().items():
+            with self.subTest(name):
+                primary, replica = self._queries(read)
+                self.assertGreater(primary, 0)
+                self.assertEqual(replica, 0)
+        self.assertEqual(self._calendar_days(), {date(2024, 6, 5), date(2024, 6, 6)})
+        # Other users still read from the replica
+        other = User.objects.create_user("replica-other")
+        self.assertEqual(self._queries(SkService(other).calendar)[0], 0)
+        time.sleep(1.1)
+        self.assertEqual(self._calendar_days(), {date(2024, 5, 8)})
+
+
+class MoodStoreParityTest(TestCase):
+    """
+    `RowMoodStore` and `PackedMoodStore` answer every call the same after the
+    same writes.
+    """
+
+    # Most ranges start and end within a week
+    RANGES = [
+        (None, None),
+        (date(2024, 1, 3), date(2024, 1, 9)),
+        (date(2024, 1, 3), date(2024, 2, 14)),
+        (date(2023, 12, 31), None),
+        (None, date(2024, 1, 1)),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.stores = [
+            (RowMoodStore(), User.objects.create_user("rows")),
+            (PackedMoodStore(), User.objects.create_user("packed")),
+        ]
+
+    def _save(self, entries: typing.List[WeekdayEntry]) -> None:
+        for store, user in self.stores:
+            for entry in entries:
+                store.save(user, entry)
+
+    def _assert_same(self, call: str, *args: typing.Any) -> None:
+        (rows, rows_user), (packed, packed_user) = self.stores
+        expected = getattr(rows, call)(rows_user, *args)
+        if call == "averages":
+            # The row store averages in the database
+            expected = {k: v if v is None else round(v, 9) for k, v in expected.items()}
+            actual = {
+                k: v if v is None else round(v, 9)
+                for k, v in packed.averages(packed_user, *args).items()
+            }
+        else:
+            actual = getattr(packed, call)(packed_user, *args)
+        self.assertEqual(expected, actual, f"{call}{args}")
+
+    def _assert_all_same(self) -> None:
+        self._assert_same("bounds")
+        for first_day, last_day in self.RANGES:
+            self._assert_same("entries", first_day, last_day)
+            self._assert_same("averages", first_day, last_day)
+            for period in PERIODS:
+                self._assert_same("counts", period, first_day, last_day)
+            for mood in [None, *range(1, 6)]:
+                self._assert_same("weeks_with_moods", first_day, last_day, mood)
+        for period in PERIODS:
+            for mood in range(1, 6):
+                self._assert_same("latest", period, mood)
+        for day in (date(2024, 1, 2), date(2024, 1, 4), date(2024, 1, 10)):
+            self._assert_same("get", day)
+
+    def test_same_results(self):
+        rng = random.Random(35)
+        first_day = date(2023, 12, 18)
+        self._save(
+            [
+                WeekdayEntry(
+                    day=first_day + timedelta(days=d),
+                    mood_day=rng.choice([None, 1, 2, 3, 4, 5]),
+                    mood_night=rng.choice([None, 1, 2, 3, 4, 5]),
+                )
+                for d in range(70)
+            ]
+        )
+        self._assert_all_same()
+        # Overwrites, removals and a day without any mood left
+        self._save(
+            [
+                WeekdayEntry(day=date(2024, 1, 3), mood_day=5, mood_night=5),
+                WeekdayEntry(day=date(2024, 1, 8), mood_day=None, mood_night=1),
+                WeekdayEntry(day=date(2024, 1, 9), mood_day=None, mood_night=None),
+            ]
+        )
+        self._assert_all_same()
+        for store, user in self.stores:
+            store.delete_range(user, date(2024, 1, 3), date(2024, 1, 9))
+        self._assert_all_same()
+        self._assert_same("entries", date(2024, 1, 1), date(2024, 1, 15))
+
+    def test_empty(self):
+        self._assert_all_same()
+
+
+@override_settings(SK_ARCHIVE=True)
+class ArchiveTest(TestCase):
+    """
+    Sealed years read the same through `get_store()`, and saving a mood of a
+    sealed year unseals it.
+    """
+
+    RANGES = [
+        (None, None),
+        (date(2022, 12, 28), date(2023, 1, 4)),
+        (date(2023, 3, 1), date(2023, 4, 1)),
+        (date(2023, 12, 20), date(2024, 1, 10)),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("archive")
+        rng = random.Random(37)
+        first_day = date(2022, 11, 1)
+        get_store.cache_clear()
+        get_store().save_many(
+            cls.user,
+            [
+                WeekdayEntry(
+                    day=first_day + timedelta(days=d),
+                    mood_day=rng.choice([None, 1, 2, 3, 4, 5]),
+                    mood_night=rng.choice([None, 1, 2, 3, 4, 5]),
+                )
+                for d in range(500)
+            ],
+        )
+
+    def setUp(self):
+        get_store.cache_clear()
+        self.addCleanup(get_store.cache_clear)
+        cache.clear()
+
+    def _reads(self) -> dict:
+        store = get_store()
+        ret = {"bounds": store.bounds(self.user)}
+        for first_day, last_day in self.RANGES:
+            key = (first_day, last_day)
+            ret["entries", key] = store.entries(self.user, first_day, last_day)
+            ret["averages", key] = {
+                period: round(value, 9)
+                for period, value in store.averages(
+                    self.user, first_day, last_day
+                ).items()
+            }
+            ret["weeks", key] = store.weeks_with_moods(
+                self.user, first_day, last_day, 5
+            )
+            for period in PERIODS:
+                ret["counts", period, key] = store.counts(
+                    self.user, period, first_day, last_day
+                )
+        for period in PERIODS:
+            for mood in range(1, 6):
+                ret["latest", period, mood] = store.latest(self.user, period, mood)
+        ret["get"] = store.get(self.user, date(2023, 6, 5))
+        return ret
+
+    def _seal(self) -> str:
+        stdout = io.StringIO()
+        # Seals the years before 2024
+        older_than = timezone.now().year - 2024
+        call_command("seal_years", f"--older-than={older_than}", stdout=stdout)
+        return stdout.getvalue()
+
+    def test_sealed_years_read_the_same(self):
+        before = self._reads()
+        self.assertEqual(self._seal(), "Sealed 2 years before 2024.\n")
+        self.assertEqual(
+            list(ArchivedYear.objects.values_list("year", flat=True).order_by("year")),
+            [2022, 2023],
+        )
+        self.assertFalse(Entry.objects.filter(day__lt=date(2024, 1, 1)).exists())
+        self.assertEqual(self._reads(), before)
+        # From the cached years
+        self.assertEqual(self._reads(), before)
+
+    def test_save_unseals(self):
+        self._seal()
+        # Saving the saved mood would remove it
+        mood = 4 if get_store().get(self.user, date(2023, 6, 5)).mood_day == 5 else 5
+        SkService(self.user).save_entry("day", mood, "2023-06-05")
+        # 2023 is back in the mood store, 2022 stays sealed
+        self.assertEqual(
+            list(ArchivedYear.objects.values_list("year", flat=True)), [2022]
+        )
+        self.assertEqual(
+            Entry.objects.get(user=self.user, day=date(2023, 6, 5)).mood_day, mood
+        )
+        self.assertEqual(get_store().get(self.user, date(2023, 6, 5)).mood_day, mood)
+        reads = self._reads()
+        call_command("seal_years", "--unseal-all", stdout=io.StringIO())
+        self.assertFalse(ArchivedYear.objects.exists())
+        self.assertEqual(self._reads(), reads)
+
+
+SHARDS = ["shard0", "shard1"]
+USER_DATA_MODELS = [Entry, Week, UserSettings, UserMoodColorSettings, ArchivedYear]
+
+
+@unittest.skipUnless(connection.vendor == "sqlite", "Copies the SQLite test database")
+@override_settings(DATABASE_SHARDS=SHARDS)
+class ShardingTest(_DatabaseCopiesTest):
+    """
+    The data of a user lives on one shard, `move_user` and `rebalance_shards`
+    move all of it.
+    """
+
+    # As if DATABASE_SHARD_URLS had two URLs
+    copies = SHARDS
+
+    def setUp(self):
+        # The shards of the users are cached
+        cache.clear()
+
+    def _locations(self, user_id: int) -> typing.Dict[str, typing.List[str]]:
+        """
+        Returns the sharded models with rows of the user in each database.
+        """
+        return {
+            alias: [
+                model.__name__
+                for model in USER_DATA_MODELS
+                if model.objects.using(alias).filter(user_id=user_id).exists()
+            ]
+            for alias in sharding.locations()
+        }
+
+    def _legacy_user(self) -> User:
+        """
+        A user with data in the default database, from before sharding.
+        """
+        with override_settings(DATABASE_SHARDS=[]):
+            user = User.objects.create_user("sharding-legacy")
+            sk_service = SkService(user)
+            sk_service.save_entry("day", 4, "2024-06-05")
+            sk_service.save_note("2024-06-03", "Legacy")
+            SettingsService(user).save_user_colors_settings({"mood-1": "#ff0000"})
+            ArchivedYear.objects.create(user=user, year=2020, moods=b"", stats={})
+        return user
+
+    def test_rows_on_mapped_shard(self):
+        for username in ("sharding-1", "sharding-2"):
+            user = User.objects.create_user(username)
+            shard = sharding.target_shard(user.pk)
+            with sharding.use_shard(user):
+                sk_service = SkService(user)
+                sk_service.save_entry("day", 4, "2024-06-05")
+                sk_service.save_note("2024-06-03", "Sharded")
+                SettingsService(user).save_user_colors_settings({"mood-1": "#ff0000"})
+                self.assertEqual(get_store().get(user, date(2024, 6, 5)).mood_day, 4)
+            self.assertEqual(UserShard.objects.get(user=user).shard, shard)
+            self.assertTrue(User.objects.using(shard).filter(pk=user.pk).exists())
+            self.assertEqual(
+                self._locations(user.pk),
+                {
+                    alias: (
+                        ["Entry", "Week", "UserSettings", "UserMoodColorSettings"]
+                        if alias == shard
+                        else []
+                    )
+                    for alias in sharding.locations()
+                },
+            )
+
+    def test_move_user(self):
+        user = self._legacy_user()
+        everything = [model.__name__ for model in USER_DATA_MODELS]
+        self.assertEqual(
+            self._locations(user.pk), {"default": everything, **{s: [] for s in SHARDS}}
+        )
+        for shard in (*SHARDS, "default"):
+            self.assertTrue(sharding.move_user(user.pk, shard))
+            self.assertFalse(sharding.move_user(user.pk, shard))
+            self.assertEqual(
+                self._locations(user.pk),
+                {
+                    alias: everything if alias == shard else []
+                    for alias in sharding.locations()
+                },
+            )
+            self.assertEqual(UserShard.objects.get(user=user).shard, shard)
+            # The copy of the user row only exists on the current shard
+            for alias in SHARDS:
+                self.assertEqual(
+                    User.objects.using(alias).filter(pk=user.pk).exists(),
+                    alias == shard,
+                )
+        with sharding.use_shard(user):
+            self.assertEqual(get_store().get(user, date(2024, 6, 5)).mood_day, 4)
+
+    def test_rebalance_dry_run(self):
+        user = self._legacy_user()
+        locations = self._locations(user.pk)
+        shard = sharding.target_shard(user.pk)
+        stdout = io.StringIO()
+        call_command("rebalance_shards", "--dry-run", stdout=stdout)
+        self.assertIn(f"User {user.pk}: default -> {shard}\n", stdout.getvalue())
+        self.assertIn("Would move 1 users.\n", stdout.getvalue())
+        self.assertEqual(self._locations(user.pk), locations)
+        self.assertFalse(UserShard.objects.filter(user=user).exists())
+        self.assertFalse(User.objects.using(shard).filter(pk=user.pk).exists())
+
+        call_command("rebalance_shards", stdout=io.StringIO())
+        self.assertEqual(UserShard.objects.get(user=user).shard, shard)
+        self.assertEqual(self._locations(user.pk)[shard], locations["default"])
+
+
+class SignedTokenTest(TestCase):
+    """
+    Signed access tokens are refused once expired or revoked, refresh tokens
+    only issue new tokens and stop working after a password change. DRF
+    refuses with 403, as the session authentication comes first.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("signed", password=PASSWORD)
+
+    def setUp(self):
+        cache.clear()
+
+    def _get(self, token: str) -> typing.Any:
+        return self.client.get("/api/mood-table/", HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def _refresh(self, token: str) -> typing.Any:
+        return self.client.post(
+            "/api/token/refresh/", {"refresh": token}, content_type="application/json"
+        )
+
+    def _refusal(self, token: str, kind: str) -> str:
+        # The message is translated when it is raised
+        with translation.override("en"), self.assertRaises(
+            exceptions.AuthenticationFailed
+        ) as cm:
+            auth.verify_token(token, kind)
+        return str(cm.exception.detail)
+
+    def test_access_token(self):
+        response = self.client.post(
+            "/api/token/",
+            {"username": "signed", "password": PASSWORD},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._get(response.json()["access"]).status_code, 200)
+
+    def test_expired(self):
+        issued = time.time() - settings.ACCESS_TOKEN_LIFETIME - 1
+        with mock.patch("time.time", return_value=issued):
+            tokens = auth.issue_tokens(self.user)
+        self.assertEqual(self._get(tokens["access"]).status_code, 403)
+        self.assertEqual(self._refusal(tokens["access"], auth.ACCESS), "Token expired.")
+        # Refresh tokens live longer
+        self.assertEqual(self._refresh(tokens["refresh"]).status_code, 200)
+
+    def test_salts(self):
+        tokens = auth.issue_tokens(self.user)
+        self.assertEqual(self._get(tokens["refresh"]).status_code, 403)
+        self.assertEqual(
+            self._refusal(tokens["refresh"], auth.ACCESS), "Invalid token."
+        )
+        self.assertEqual(self._refresh(tokens["access"]).status_code, 403)
+        self.assertEqual(
+            self._refusal(tokens["access"], auth.REFRESH), "Invalid token."
+        )
+
+    @override_settings(TOKEN_REVOCATION=True)
+    def test_revoked(self):
+        tokens = auth.issue_tokens(self.user)
+        self.assertTrue(auth.revoke_token(tokens["access"]))
+        self.assertEqual(self._get(tokens["access"]).status_code, 403)
+        self.assertEqual(self._refusal(tokens["access"], auth.ACCESS), "Token revoked.")
+        # A refresh token can be used once
+        response = self._refresh(tokens["refresh"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._get(response.json()["access"]).status_code, 200)
+        self.assertEqual(self._refresh(tokens["refresh"]).status_code, 403)
+        self.assertFalse(auth.revoke_token("not a token"))
+
+    def test_password_change(self):
+        tokens = auth.issue_tokens(self.user)
+        self.assertEqual(self._refresh(tokens["refresh"]).status_code, 200)
+        self.user.set_password("changed-password")
+        self.user.save()
+        self.assertEqual(self._refresh(tokens["refresh"]).status_code, 403)
+        # Still signed correctly, refused by refresh_tokens
+        self.assertEqual(
+            auth.verify_token(tokens["refresh"], auth.REFRESH)["u"], self.user.pk
+        )
+
+    def test_token_user_not_saved(self):
+        claims = auth.verify_token(auth.issue_tokens(self.user)["access"], auth.ACCESS)
+        user = auth.token_user(claims)
+        self.assertEqual((user.pk, user.username), (self.user.pk, "signed"))
+        with self.assertRaises(ValueError):
+            user.save()
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password(PASSWORD))
+
+
+PROFILE_MIDDLEWARE = "web.profiling.profile_middleware"
+
+
+def _middleware_after(middleware: str, after: str) -> typing.List[str]:
+    """
+    Returns `MIDDLEWARE` with `middleware` right after `after`.
+    """
+    ret = [m for m in settings.MIDDLEWARE if m != middleware]
+    ret.insert(ret.index(after) + 1, middleware)
+    return ret
+
+
+@override_settings(
+    PROFILE_TOKEN="profile-secret",
+    PROFILE_USERS=["profiled"],
+    # Where settings.py adds it
+    MIDDLEWARE=_middleware_after(
+        PROFILE_MIDDLEWARE, "django.contrib.auth.middleware.AuthenticationMiddleware"
+    ),
+)
+class ProfilingTest(TestCase):
+    """
+    Requests with the profile token or of a user in `PROFILE_USERS` are
+    profiled, only the newest profiles are kept and staff can download them.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("not-profiled")
+        cls.profiled = User.objects.create_user("profiled")
+
+    def setUp(self):
+        self.dir = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.enterContext(override_settings(PROFILE_DIR=self.dir))
+
+    def _files(self) -> typing.Set[str]:
+        return {path.name for path in self.dir.iterdir()}
+
+    def test_header(self):
+        self.client.force_login(self.user)
+        self.client.get("/api/mood-table/", HTTP_X_PROFILE_TOKEN="wrong")
+        self.client.get("/api/mood-table/")
+        self.assertFalse(RequestProfile.objects.exists())
+        response = self.client.get(
+            "/api/mood-table/", HTTP_X_PROFILE_TOKEN="profile-secret"
+        )
+        self.assertEqual(response.status_code, 200)
+        profile = RequestProfile.objects.get()
+        self.assertEqual(
+            (profile.path, profile.user, profile.status, profile.trigger),
+            ("/api/mood-table/", self.user, 200, "header"),
+        )
+        self.assertGreater(profile.file_path.stat().st_size, 0)
+        self.assertEqual(self._files(), {profile.file_name})
+
+    def test_user(self):
+        self.client.force_login(self.profiled)
+        self.client.get("/api/mood-table/")
+        profile = RequestProfile.objects.get()
+        self.assertEqual((profile.user, profile.trigger), (self.profiled, "user"))
+        self.assertTrue(profile.file_path.exists())
+
+    @override_settings(PROFILE_MAX_FILES=2)
+    def test_rotation(self):
+        self.client.force_login(self.profiled)
+        for _ in range(4):
+            self.client.get("/api/mood-table/")
+        kept = set(RequestProfile.objects.values_list("file_name", flat=True))
+        self.assertEqual(len(kept), 2)
+        self.assertEqual(self._files(), kept)
+
+    def test_download_by_staff(self):
+        self.client.force_login(self.profiled)
+        self.client.get("/api/mood-table/")
+        profile = RequestProfile.objects.get()
+        url = f"/admin/web/requestprofile/{profile.pk}/download/"
+        # The profiled user isn't staff
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 302)
+        self.assertIn("/admin/login/", response["Location"])
+        staff = User.objects.create_user("profile-staff", is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        staff.user_permissions.add(
+            Permission.objects.get(codename="view_requestprofile")
+        )
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            b"".join(response.streaming_content), profile.file_path.read_bytes()
+        )
+
+
+MEMORY_MIDDLEWARE = "web.memory.memory_middleware"
+
+
+@override_settings(
+    MEMORY_SAMPLE_RATE=1.0,
+    MIDDLEWARE=_middleware_after(
+        MEMORY_MIDDLEWARE, "django.contrib.auth.middleware.AuthenticationMiddleware"
+    ),
+)
+class MemoryTest(TestCase):
+    """
+    Sampled requests store their memory, `memory_report` sums it up by route
+    and `api/memory/` is for staff only.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("memory")
+        _seed(cls.user, 60)
+
+    def test_sample(self):
+        self.client.force_login(self.user)
+        response = self.client.get("/api/calendar/")
+        self.assertEqual(response.status_code, 200)
+        sample = MemorySample.objects.get()
+        self.assertEqual((sample.route, sample.pid), ("api/calendar/", os.getpid()))
+        self.assertGreater(sample.peak_alloc, 0)
+        # Not traced any longer after the request
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_api_memory_for_staff(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get("/api/memory/").status_code, 403)
+        staff = User.objects.create_user("memory-staff", is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get("/api/memory/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["pid"], os.getpid())
+        # The snapshots of api/memory/ aren't sampled
+        self.assertFalse(MemorySample.objects.exists())
+
+    def test_report(self):
+        with self.assertRaises(CommandError):
+            call_command("memory_report", stdout=io.StringIO())
+        self.client.force_login(self.user)
+        for path in ("/api/calendar/", "/api/calendar/", "/api/mood-table/"):
+            self.client.get(path)
+        stdout = io.StringIO()
+        call_command("memory_report", stdout=stdout)
+        lines = stdout.getvalue().splitlines()
+        self.assertRegex(
+            lines[0],
+            r"^route +samples +RSS growth +max RSS growth +avg peak +max peak$",
+        )
+        self.assertEqual(
+            sorted(line.split()[:2] for line in lines[1:3]),
+            [["api/calendar/", "2"], ["api/mood-table/", "1"]],
+        )
+        # The table of the processes follows
+        self.assertEqual(lines[3], "")
+        self.assertEqual(lines[5].split()[:2], [str(os.getpid()), "3"])
+
+
+class _RecordingCursor:
+    def __init__(self, rows: typing.List[tuple]):
+        self.rows = rows
+        self.statements = []
+
+    def execute(self, sql: str, params: typing.Optional[list] = None) -> None:
+        self.statements.append(sql)
+
+    def fetchone(self) -> tuple:
+        return self.rows.pop(0)
+
+
+class PartitioningTest(TestCase):
+    def _moved(self, identity: str) -> typing.List[str]:
+        cursor = _RecordingCursor([(identity, "public.web_entry_id_seq")])
+        partitioning._move_rows(cursor, "web_entry_plain")
+        return cursor.statements
+
+    def test_serial_sequence_is_kept(self):
+        statements = self._moved("")
+        alter = "ALTER SEQUENCE public.web_entry_id_seq OWNED BY web_entry.id"
+        self.assertIn(alter, statements)
+        self.assertLess(
+            statements.index(alter), statements.index("DROP TABLE web_entry_plain")
+        )
+
+    def test_identity_sequence_is_copied(self):
+        statements = self._moved("d")
+        self.assertFalse([sql for sql in statements if "ALTER SEQUENCE" in sql])
+
+    @unittest.skipUnless(partitioning.is_supported(connection), "requires Postgres")
+    def test_serial_id(self):
+        # Tables from before Django 4.1 have a serial id
+        with connection.cursor() as cursor:
+            cursor.execute("ALTER TABLE web_entry ALTER id DROP IDENTITY")
+            cursor.execute("CREATE SEQUENCE web_entry_id_seq OWNED BY web_entry.id")
+            cursor.execute(
+                "ALTER TABLE web_entry ALTER id SET DEFAULT nextval('web_entry_id_seq')"
+            )
+        user = User.objects.create_user("partitioned")
+        Entry.objects.create(user=user, day=date(2024, 6, 5), mood_day=1)
+        changes = [partitioning.partition_table, partitioning.unpartition_table]
+        for year, change in enumerate(changes, 2025):
+            with self.subTest(change=change.__name__):
+                with connection.cursor() as cursor:
+                    # Tables with deferred foreign key checks can't be dropped
+                    cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+                change(connection)
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT pg_get_serial_sequence('web_entry', 'id')")
+                    self.assertIsNotNone(cursor.fetchone()[0])
+                Entry.objects.create(user=user, day=date(year, 6, 5), mood_day=2)
+        self.assertEqual(Entry.objects.filter(user=user).count(), 3)
+
+
+class QueueHandlerTest(unittest.TestCase):
+    def test_threads_start_one_listener(self):
+        target = logging.handlers.BufferingHandler(capacity=100)
+        target.set_name("sk-test-buffer")
+        self.addCleanup(logging._handlers.pop, "sk-test-buffer", None)
+        handler = log.QueueHandler(["sk-test-buffer"])
+        barrier = threading.Barrier(8)
+        started = []
+        start = handler._start
+
+        def counted_start():
+            started.append(1)
+            start()
+
+        handler._start = counted_start
+
+        def emit(i: int) -> None:
+            barrier.wait()
+            # Without Handler.handle(), which would serialize the threads
+            handler.emit(
+                logging.makeLogRecord({"msg": f"record {i}", "levelno": logging.INFO})
+            )
+
+        threads = [threading.Thread(target=emit, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        handler.close()
+        self.assertEqual(len(started), 1)
+        self.assertEqual(len(target.buffer), 8)
+
+
+def _samples(text: str) -> typing.Dict[tuple, float]:
+    from prometheus_client.parser import text_string_to_metric_families
+
+    return {
+        (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+        for family in text_string_to_metric_families(text)
+        for sample in family.samples
+    }
+
+
+METRICS_MIDDLEWARE = "web.metrics.metrics_middleware"
+
+# Runs in a new process, which writes its metrics to PROMETHEUS_MULTIPROC_DIR
+_WORKER = """
+import django
+django.setup()
+from web import metrics
+metrics.count_write("mood")
+"""
+
+
+@unittest.skipUnless(metrics.Counter, "requires prometheus_client")
+@override_settings(
+    ALLOWED_HOSTS=["testserver"],
+    METRICS=True,
+    MIDDLEWARE=[
+        METRICS_MIDDLEWARE,
+        *(m for m in settings.MIDDLEWARE if m != METRICS_MIDDLEWARE),
+    ],
+)
+class MetricsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("metrics", password=PASSWORD)
+        _seed(cls.user, 60)
+
+    def setUp(self):
+        cache.clear()
+        metrics.instrument_connection(connection)
+        self.addCleanup(connection.execute_wrappers.remove, metrics._count_query)
+
+    def _scrape(self) -> typing.Dict[tuple, float]:
+        return _samples(metrics.render().decode())
+
+    @override_settings(AUTH_CACHE_TIMEOUT=60)
+    def test_request_metrics(self):
+        self.client.force_login(self.user)
+        before = self._scrape()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/calendar/")
+        self.assertEqual(response.status_code, 200)
+        after = self._scrape()
+
+        def delta(name: str, **labels: str) -> float:
+            key = (name, tuple(sorted(labels.items())))
+            return after.get(key, 0) - before.get(key, 0)
+
+        view = {"view": "api-calendar"}
+        self.assertEqual(
+            delta("sk_requests_total", method="GET", status="200", **view), 1
+        )
+        self.assertEqual(
+            delta("sk_request_duration_seconds_count", method="GET", **view), 1
+        )
+        self.assertEqual(delta("sk_db_queries_per_request_sum", **view), len(queries))
+        self.assertEqual(
+            delta("sk_cache_lookups_total", cache="user", result="miss"), 1
+        )
+
+    def test_writes(self):
+        before = self._scrape()
+        SkService(self.user).save_entry("day", 3, "2024-06-05")
+        SkService(self.user).save_note("2024-06-03", "note")
+        after = self._scrape()
+        for kind in ["mood", "note"]:
+            key = ("sk_writes_total", (("kind", kind),))
+            self.assertEqual(after[key] - before.get(key, 0), 1)
+
+    def test_active_users(self):
+        User.objects.filter(pk=self.user.pk).update(last_login=timezone.now())
+        samples = self._scrape()
+        self.assertEqual(samples[("sk_active_users", (("window", "1d"),))], 1)
+
+    def test_token(self):
+        factory = RequestFactory()
+        with override_settings(METRICS_TOKEN="secret"):
+            response = metrics.metrics_view(factory.get("/metrics"))
+            self.assertEqual(response.status_code, 401)
+            response = metrics.metrics_view(
+                factory.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"sk_active_users", response.content)
+
+    def test_multiprocess(self):
+        with tempfile.TemporaryDirectory() as path:
+            env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": path, "METRICS": "True"}
+            for _ in range(2):
+                subprocess.run(
+                    [sys.executable, "-c", _WORKER],
+                    cwd=settings.BASE_DIR,
+                    env=env,
+                    check=True,
+                )
+            samples = _samples(metrics.render(path).decode())
+        self.assertEqual(samples[("sk_writes_total", (("kind", "mood"),))], 2)
+
+    def test_multiprocess_registries(self):
+        with tempfile.TemporaryDirectory() as path:
+            with mock.patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": path}):
+                # Two workers, each with its own registry and metric file
+                for worker, writes in ((1, 2), (2, 3)):
+                    value_class = prometheus_values.MultiProcessValue(lambda: worker)
+                    with mock.patch.object(
+                        prometheus_values, "ValueClass", value_class
+                    ):
+                        counter = Counter(
+                            "sk_writes",
+                            "Saved moods and notes",
+                            ["kind"],
+                            registry=CollectorRegistry(),
+                        )
+                        counter.labels("mood").inc(writes)
+            self.assertEqual(len(os.listdir(path)), 2)
+            samples = _samples(metrics.render(path).decode())
+        self.assertEqual(samples[("sk_writes_total", (("kind", "mood"),))], 5)
+        self.assertIn(("sk_active_users", (("window", "1d"),)), samples)
@@ -1,28 +1,34 @@
 import sys
 import typing
+from abc import ABC, abstractmethod
 from datetime import date, datetime, timedelta
+from importlib import metadata
 
-import pkg_resources
 from django.conf import settings
 from django.contrib.auth import logout
 from django.contrib.auth.decorators import login_required
+from django.core.cache import cache
 from django.core.exceptions import BadRequest
-from django.http import HttpResponseNotFound
+from django.http import HttpResponse, HttpResponseNotFound
 from django.shortcuts import redirect
 from django.template import loader
 from django.urls import reverse_lazy
 from django.utils import timezone
+from django.utils.cache import patch_cache_control
 from django.utils.decorators import method_decorator
 from django.views import View
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.views.generic import RedirectView, TemplateView
 from django.views.generic.list import ListView
 
+from web import metrics, serializers
 from web.models import PERIODS
-from web.query_params import QP_END_DT, QP_MOOD, QP_SEARCH_TERM, QP_START_DT
+from web.query_params import QP_END_DT, QP_MOOD, QP_PERIOD, QP_SEARCH_TERM, QP_START_DT
 from web.service.base_graph import PERIOD_DAY, PERIOD_NIGHT
-from web.service.settings import SettingsService
+from web.service.settings import settings_service
 from web.service.sk import SkService
+from web.service.streaks import StreakService
+from web.service.svg import SvgService
 
 
 def custom_page_not_found_view(request, exception):
@@ -85,8 +91,12 @@ class SettingsView(TemplateView):
     template_name = "web/settings/settings.html"
 
     def get_context_data(self, **kwargs):
-        ss = SettingsService(self.request.user)
-        sk_version = pkg_resources.get_distribution("stimmungskalender").version
+        ss = settings_service(self.request)
+        try:
+            sk_version = metadata.version("stimmungskalender")
+        except metadata.PackageNotFoundError:
+            # A checkout that isn't installed, e.g. when running the tests
+            sk_version = None
 
         context = super().get_context_data(**kwargs)
         context["default_view_mode"] = ss.get_default_view_mode()
@@ -99,7 +109,7 @@ def get_context_data(self, **kwargs):
 @method_decorator(login_required, name="dispatch")
 class SaveSettingsView(View):
     def post(self, request):
-        ss = SettingsService(self.request.user)
+        ss = settings_service(self.request)
         # If day and night form should be displayed
         view_day_form = request.POST.get("view_day_form", "")
         view_night_form = request.POST.get("view_night_form", "")
@@ -139,15 +149,24 @@ def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         sk_service = SkService(self.request.user)
 
-        ss = SettingsService(self.request.user)
+        ss = settings_service(self.request)
 
         start_day_p = self.request.GET.get(QP_START_DT, "").strip()
         context["mood_table"] = sk_service.mood_table(start_day_p)
         context["moods"] = sk_service.mood_mapping
         context["forms"] = self.get_forms()
         context["standout_data"] = sk_service.standout_data()
+        context["streaks"] = StreakService(
+            self.request.user, ss.user_settings()
+        ).streaks()
         context["general_stats"] = sk_service.general_stats()
         context["js_btn"] = ss.is_use_js_btn()
+        if context["js_btn"]:
+            # Initial state of the JavaScript form, as api/mood-table/ returns it
+            context["mood_table_data"] = serializers.MoodTableSerializer(
+                context["mood_table"]
+            ).data
+        context["data_version"] = ss.user_settings().data_version
 
         return context
 
@@ -184,12 +203,13 @@ def post(self, request):
         return redirect(f"{reverse_lazy('index')}?start_dt={start_day_p}")
 
 
+@method_decorator(login_required, name="dispatch")
 class GraphView(DefaultDateHandler, TemplateView):
     template_name = "web/graph/graph.html"
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        ss = SettingsService(self.request.user)
+        ss = settings_service(self.request)
         is_markers = ss.is_markers(self.request.GET)
         start_dt = self.default_start_dt()
         end_dt = self.default_end_dt()
@@ -225,6 +245,9 @@ def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         sk_service = SkService(self.request.user)
         context["moods"] = sk_service.mood_mapping
+        context["data_version"] = (
+            settings_service(self.request).user_settings().data_version
+        )
         return context
 
     def get_queryset(self):
@@ -261,3 +284,75 @@ def get_context_data(self, **kwargs):
         context["mood_mapping"] = SkService(self.request.user).mood_mapping
         context["site_url"] = reverse_lazy("index")
         return context
+
+
+@method_decorator(login_required, name="dispatch")
+class SvgView(ABC, View):
+    """
+    Serves a rendered SVG image from a URL that contains the data version of
+    the user. The content behind such a URL never changes, so it can be cached
+    by the browser forever. Requests for an outdated version are redirected.
+    """
+
+    url_name = ""
+
+    def get(self, request, version, **kwargs):
+        ss = settings_service(request)
+        current_version = ss.user_settings().data_version
+        if version != current_version:
+            url = reverse_lazy(
+                self.url_name, kwargs={**kwargs, "version": current_version}
+            )
+            query = request.GET.urlencode()
+            return redirect(f"{url}?{query}" if query else url)
+
+        key = "sk-svg-{}-{}-{}-{}-{}".format(
+            request.user.pk,
+            self.url_name,
+            version,
+            "-".join(str(v) for v in kwargs.values()),
+            request.GET.urlencode(),
+        )
+        svg = cache.get(key)
+        metrics.cache_lookup("svg", svg is not None)
+        if svg is None:
+            svg = self.render(SvgService(request.user, ss.user_colors()), **kwargs)
+            cache.set(key, svg, settings.SK_SVG_CACHE_TIMEOUT)
+
+        response = HttpResponse(svg, content_type="image/svg+xml")
+        patch_cache_control(response, private=True, max_age=31536000, immutable=True)
+        return response
+
+    @abstractmethod
+    def render(self, svg_service: SvgService, **kwargs: dict) -> str:
+        pass
+
+
+class HeatmapSvgView(SvgView):
+    """
+    Mood heatmap of a whole year.
+    """
+
+    url_name = "svg-heatmap"
+
+    def render(self, svg_service: SvgService, **kwargs: dict) -> str:
+        period = self.request.GET.get(QP_PERIOD, PERIOD_DAY)
+        try:
+            return svg_service.year_heatmap(kwargs["year"], period)
+        except ValueError:
+            raise BadRequest()
+
+
+class SparklineSvgView(SvgView):
+    """
+    Day and night moods of a single week.
+    """
+
+    url_name = "svg-sparkline"
+
+    def render(self, svg_service: SvgService, **kwargs: dict) -> str:
+        try:
+            week = datetime.strptime(kwargs["week"], settings.SK_DATE_FORMAT).date()
+        except ValueError:
+            raise BadRequest()
+        return svg_service.week_sparkline(week)